@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the compiled blocklist matcher (DomainMatcher)
+Builds a synthetic 100k-domain list and times per-URL lookups
+
+Usage: python blocklist_benchmark.py [domain_count] [lookups]
+"""
+
+import random
+import string
+import sys
+import time
+
+from server import DomainMatcher
+
+TLDS = ["com", "net", "io", "bet", "casino", "co.uk", "com.au", "ag", "eu"]
+
+def random_label(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase + string.digits) for _ in range(rng.randint(4, 14)))
+
+def build_domains(count: int, rng: random.Random) -> list:
+    domains = set()
+    while len(domains) < count:
+        domains.add(f"{random_label(rng)}.{rng.choice(TLDS)}")
+    return list(domains)
+
+def build_urls(domains: list, count: int, rng: random.Random) -> list:
+    """Half hits (exact host or subdomain), half misses"""
+    urls = []
+    for i in range(count):
+        if i % 2 == 0:
+            domain = rng.choice(domains)
+            prefix = rng.choice(["", "www.", "sportsbook.", "m.app."])
+            urls.append(f"https://{prefix}{domain}/promo?ref={i}")
+        else:
+            urls.append(f"https://{random_label(rng)}.{random_label(rng)}.com/page")
+    return urls
+
+def main():
+    domain_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    rng = random.Random(42)
+    
+    domains = build_domains(domain_count, rng)
+    urls = build_urls(domains, lookups, rng)
+    hosts = [url.split("/")[2] for url in urls]
+    
+    start = time.perf_counter()
+    matcher = DomainMatcher(domains)
+    build_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    hits = sum(1 for url in urls if matcher.match(url))
+    url_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for host in hosts:
+        matcher.match_host(host)
+    host_seconds = time.perf_counter() - start
+    
+    print(f"Domains:           {matcher.size:,}")
+    print(f"Build time:        {build_seconds * 1000:.1f} ms")
+    print(f"Lookups:           {lookups:,} ({hits:,} blocked)")
+    print(f"URL lookup:        {url_seconds / lookups * 1e6:.2f} us/lookup")
+    print(f"Host lookup:       {host_seconds / lookups * 1e6:.2f} us/lookup")
+
+if __name__ == "__main__":
+    main()
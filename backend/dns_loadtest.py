@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Load test for the DNS sinkhole (dns_sinkhole.py)
+Runs the responder on one core against a local stub upstream and measures
+sustained queries per second from separate client processes
+
+Usage: python dns_loadtest.py [seconds] [client_processes] [window]
+"""
+
+import asyncio
+import multiprocessing
+import random
+import socket
+import struct
+import sys
+import time
+
+from dns_sinkhole import start_dns_sinkhole, stop_dns_sinkhole, BLOCK, FORWARD, REFUSE
+from server import DomainMatcher
+
+SINKHOLE_ADDR = ("127.0.0.1", 15353)
+UPSTREAM_ADDR = ("127.0.0.1", 15354)
+BLOCKED_DOMAINS = [f"casino{i}.bet" for i in range(5000)] + ["draftkings.com", "fanduel.com"]
+
+
+def build_query(qid: int, name: str, qtype: int = 1) -> bytes:
+    question = b"".join(bytes([len(label)]) + label.encode() for label in name.split(".")) + b"\x00"
+    return struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0) + question + struct.pack("!HH", qtype, 1)
+
+
+def run_stub_upstream():
+    """Answer every query with 192.0.2.1 as fast as a blocking socket allows"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(UPSTREAM_ADDR)
+    answer = struct.pack("!HHHIH", 0xC00C, 1, 1, 300, 4) + socket.inet_aton("192.0.2.1")
+    while True:
+        data, addr = sock.recvfrom(512)
+        header = struct.pack("!HHHHHH", struct.unpack_from("!H", data)[0], 0x8180, 1, 1, 0, 0)
+        sock.sendto(header + data[12:] + answer, addr)
+
+
+def run_client(seconds: float, window: int, results):
+    """Keep `window` queries in flight; half blocked hosts, half forwarded"""
+    rng = random.Random()
+    names = [f"www.casino{rng.randrange(5000)}.bet" if i % 2 == 0 else f"site{i}.example.org"
+             for i in range(1024)]
+    queries = [build_query(i & 0xFFFF, names[i % len(names)]) for i in range(65536)]
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(SINKHOLE_ADDR)
+    sock.settimeout(0.5)
+
+    sent = received = timeouts = 0
+    for _ in range(window):
+        sock.send(queries[sent & 0xFFFF])
+        sent += 1
+
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            sock.recv(512)
+            received += 1
+        except socket.timeout:
+            timeouts += 1
+        sock.send(queries[sent & 0xFFFF])
+        sent += 1
+
+    results.put((received, timeouts))
+
+
+async def run_sinkhole(seconds: float):
+    matcher = DomainMatcher(BLOCKED_DOMAINS)
+
+    def policy(client_ip: str, qname: str) -> int:
+        if client_ip != "127.0.0.1":
+            return REFUSE
+        return BLOCK if matcher.match_host(qname) else FORWARD
+
+    transport, protocol = await start_dns_sinkhole(
+        policy, host=SINKHOLE_ADDR[0], port=SINKHOLE_ADDR[1], upstream=UPSTREAM_ADDR
+    )
+    await asyncio.sleep(seconds)
+    stop_dns_sinkhole(transport, protocol)
+    return protocol.stats
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    window = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+
+    upstream = multiprocessing.Process(target=run_stub_upstream, daemon=True)
+    upstream.start()
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=run_client, args=(seconds, window, results))
+               for _ in range(clients)]
+
+    async def run():
+        task = asyncio.create_task(run_sinkhole(seconds + 1.5))
+        await asyncio.sleep(0.5)
+        for worker in workers:
+            worker.start()
+        return await task
+
+    stats = asyncio.run(run())
+    received = timeouts = 0
+    for _ in workers:
+        r, t = results.get()
+        received += r
+        timeouts += t
+    for worker in workers:
+        worker.join()
+    upstream.terminate()
+
+    print(f"Duration:          {seconds:.0f} s, {clients} client processes, window {window}")
+    print(f"Sinkhole stats:    {stats}")
+    print(f"Answers received:  {received:,} ({timeouts} client timeouts)")
+    print(f"Throughput:        {received / seconds:,.0f} queries/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Local DNS sinkhole for Recovery Mode
+
+An asyncio UDP responder that answers queries for blocked hosts with a
+sinkhole address and forwards (or refuses) everything else. The policy is
+a plain callable so the server can plug in its cached lock state and
+compiled blocklist matchers without this module knowing about Mongo.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import secrets
+import socket
+import struct
+import time
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Policy verdicts
+FORWARD = 0
+BLOCK = 1
+REFUSE = 2
+
+QTYPE_A = 1
+QTYPE_AAAA = 28
+QCLASS_IN = 1
+
+RCODE_FORMERR = 1
+RCODE_REFUSED = 5
+
+# Seconds clients may cache a sinkholed answer
+SINKHOLE_TTL = 60
+# Seconds an upstream query may stay unanswered before its slot is reused
+UPSTREAM_TIMEOUT = 5.0
+# Random upstream ids tried before a query is refused as out of free ids
+UPSTREAM_ID_ATTEMPTS = 8
+
+_HEADER = struct.Struct("!HHHHHH")
+_ANSWER = struct.Struct("!HHHIH")
+
+
+def parse_query(data: bytes) -> Optional[Tuple[int, int, str, int, int]]:
+    """Parse a DNS query into (id, flags, qname, qtype, question_end)
+
+    Returns None for anything that is not a single-question query.
+    """
+    if len(data) < 12:
+        return None
+    qid, flags, qdcount = _HEADER.unpack_from(data)[:3]
+    if flags & 0x8000 or qdcount != 1:
+        return None
+
+    labels = []
+    pos = 12
+    end = len(data)
+    while True:
+        if pos >= end:
+            return None
+        length = data[pos]
+        if length == 0:
+            pos += 1
+            break
+        if length > 63:
+            return None  # compression pointers never appear in a query name
+        labels.append(data[pos + 1:pos + 1 + length])
+        pos += 1 + length
+
+    if pos + 4 > end:
+        return None
+    qtype = (data[pos] << 8) | data[pos + 1]
+    qname = b".".join(labels).decode("ascii", "replace").lower()
+    return qid, flags, qname, qtype, pos + 4
+
+
+def build_error(data: bytes, question_end: int, rcode: int) -> bytes:
+    """Echo the question back with an error rcode"""
+    qid, flags = struct.unpack_from("!HH", data)
+    flags = 0x8000 | (flags & 0x7900) | 0x0080 | rcode
+    qdcount = 1 if question_end > 12 else 0
+    return _HEADER.pack(qid, flags, qdcount, 0, 0, 0) + data[12:question_end]
+
+
+def build_sinkhole(data: bytes, question_end: int, qtype: int,
+                   ipv4: bytes, ipv6: bytes) -> bytes:
+    """Answer A/AAAA with the sinkhole address, other types with NODATA"""
+    qid, flags = struct.unpack_from("!HH", data)
+    flags = 0x8000 | (flags & 0x7900) | 0x0080
+
+    if qtype == QTYPE_A:
+        rdata = ipv4
+    elif qtype == QTYPE_AAAA:
+        rdata = ipv6
+    else:
+        return _HEADER.pack(qid, flags, 1, 0, 0, 0) + data[12:question_end]
+
+    answer = _ANSWER.pack(0xC00C, qtype, QCLASS_IN, SINKHOLE_TTL, len(rdata)) + rdata
+    return _HEADER.pack(qid, flags, 1, 1, 0, 0) + data[12:question_end] + answer
+
+
+class _UpstreamProtocol(asyncio.DatagramProtocol):
+    def __init__(self, sinkhole: "DNSSinkholeProtocol"):
+        self.sinkhole = sinkhole
+        self.peer = None
+
+    def connection_made(self, transport):
+        self.peer = transport.get_extra_info("peername")
+
+    def datagram_received(self, data, addr):
+        # The socket is connected, but check anyway: only the upstream may answer
+        if addr == self.peer:
+            self.sinkhole.upstream_response(data)
+
+
+class DNSSinkholeProtocol(asyncio.DatagramProtocol):
+    """UDP DNS responder driven by a (client_ip, qname) -> verdict policy"""
+
+    def __init__(self, policy: Callable[[str, str], int],
+                 sinkhole_ipv4: str = "0.0.0.0", sinkhole_ipv6: str = "::"):
+        self.policy = policy
+        self.ipv4 = socket.inet_pton(socket.AF_INET, sinkhole_ipv4)
+        self.ipv6 = socket.inet_pton(socket.AF_INET6, sinkhole_ipv6)
+        self.transport = None
+        self.upstream = None
+        # Forwarded queries: {upstream_id: (client_id, client_addr, question, sent_at)}
+        self.pending = {}
+        self.stats = {"queries": 0, "blocked": 0, "forwarded": 0, "refused": 0, "malformed": 0,
+                      "mismatched": 0}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.stats["queries"] += 1
+        parsed = parse_query(data)
+        if parsed is None:
+            self.stats["malformed"] += 1
+            if len(data) >= 12:
+                self.transport.sendto(build_error(data, 12, RCODE_FORMERR), addr)
+            return
+
+        qid, flags, qname, qtype, question_end = parsed
+        verdict = self.policy(addr[0], qname)
+
+        if verdict == BLOCK:
+            self.stats["blocked"] += 1
+            self.transport.sendto(
+                build_sinkhole(data, question_end, qtype, self.ipv4, self.ipv6), addr
+            )
+        elif verdict == FORWARD and self.upstream is not None:
+            self.stats["forwarded"] += 1
+            self.forward(data, qid, addr, question_end)
+        else:
+            self.stats["refused"] += 1
+            self.transport.sendto(build_error(data, question_end, RCODE_REFUSED), addr)
+
+    def forward(self, data: bytes, client_id: int, addr, question_end: int):
+        # Unpredictable ids, and answers must echo the question, so an off-path
+        # sender can't get a forged answer relayed by guessing
+        now = time.monotonic()
+        for _ in range(UPSTREAM_ID_ATTEMPTS):
+            upstream_id = secrets.randbits(16)
+            entry = self.pending.get(upstream_id)
+            if entry is None or now - entry[3] >= UPSTREAM_TIMEOUT:
+                break
+        else:
+            # Nearly every id is in flight; refuse rather than misroute an answer
+            self.stats["refused"] += 1
+            self.transport.sendto(build_error(data, question_end, RCODE_REFUSED), addr)
+            return
+        self.pending[upstream_id] = (client_id, addr, data[12:question_end], now)
+        self.upstream.sendto(struct.pack("!H", upstream_id) + data[2:])
+
+    def upstream_response(self, data: bytes):
+        if len(data) < 12:
+            return
+        upstream_id = struct.unpack_from("!H", data)[0]
+        entry = self.pending.get(upstream_id)
+        if entry is None:
+            return
+        client_id, addr, question, _ = entry
+        if _HEADER.unpack_from(data)[2] != 1 or data[12:12 + len(question)] != question:
+            self.stats["mismatched"] += 1
+            return
+        del self.pending[upstream_id]
+        self.transport.sendto(struct.pack("!H", client_id) + data[2:], addr)
+
+
+def acquire_sinkhole_lock(path: str) -> Optional[int]:
+    """Take the lock that elects one process to bind the DNS port
+
+    Returns the locked file descriptor (keep it open while serving), or None
+    if another process holds it.
+    """
+    fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+async def start_dns_sinkhole(policy: Callable[[str, str], int], host: str = "0.0.0.0",
+                             port: int = 53, upstream: Optional[Tuple[str, int]] = None,
+                             sinkhole_ipv4: str = "0.0.0.0", sinkhole_ipv6: str = "::"):
+    """Start the responder; returns (transport, protocol)
+
+    With no upstream, every query that is not blocked is refused.
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: DNSSinkholeProtocol(policy, sinkhole_ipv4, sinkhole_ipv6),
+        local_addr=(host, port)
+    )
+    if upstream:
+        protocol.upstream, _ = await loop.create_datagram_endpoint(
+            lambda: _UpstreamProtocol(protocol),
+            remote_addr=upstream
+        )
+    logger.info(f"DNS sinkhole listening on {host}:{port} (upstream: {upstream or 'refuse'})")
+    return transport, protocol
+
+
+def stop_dns_sinkhole(transport, protocol):
+    if protocol.upstream is not None:
+        protocol.upstream.close()
+    transport.close()
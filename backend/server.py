@@ -1,18 +1,40 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 from datetime import datetime, timedelta
+from collections import OrderedDict, deque
 from jose import JWTError, jwt
+import brotli
 from passlib.context import CryptContext
 import socketio
+import asyncio
+import csv
+import gzip
+import hashlib
+import heapq
+import io
+import ipaddress
+import json
+import math
 import os
+import re
+import struct
+import time
+import uuid
 import logging
 from pathlib import Path
 from bson import ObjectId
 from dotenv import load_dotenv
+from dns_sinkhole import acquire_sinkhole_lock, start_dns_sinkhole, stop_dns_sinkhole, BLOCK, FORWARD, REFUSE
+from socket_managers import LocalPubSubManager, MongoChangeStreamManager, RelayManager, UnixSocketPubSubManager
+from socket_metrics import InstrumentedServerMixin, MongoCommandCounter, SORT_FIELDS as SOCKET_METRIC_SORT_FIELDS
+from socket_serializers import NegotiatingAsyncServer
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -23,9 +45,30 @@ DB_NAME = os.getenv('DB_NAME', 'gambling_recovery_app')
 SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production-12345678')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
+# DNS sinkhole (disabled unless a port is configured)
+DNS_SINKHOLE_HOST = os.getenv('DNS_SINKHOLE_HOST', '0.0.0.0')
+DNS_SINKHOLE_PORT = int(os.getenv('DNS_SINKHOLE_PORT', '0'))
+DNS_SINKHOLE_ADDRESS = os.getenv('DNS_SINKHOLE_ADDRESS', '0.0.0.0')
+DNS_UPSTREAM = os.getenv('DNS_UPSTREAM', '')  # "host:port", empty refuses unblocked queries
+# Only the worker holding this lock file binds the DNS port
+DNS_SINKHOLE_LOCK = os.getenv('DNS_SINKHOLE_LOCK', '/tmp/lockedin-dns-sinkhole.lock')
+# Reverse proxies (addresses or CIDRs) whose X-Forwarded-For is believed
+TRUSTED_PROXIES = [ipaddress.ip_network(p.strip()) for p in os.getenv('TRUSTED_PROXIES', '').split(',') if p.strip()]
+BLOCKLIST_EXPORT_DIR = Path(os.getenv('BLOCKLIST_EXPORT_DIR', str(ROOT_DIR / 'blocklist_exports')))
+# Socket.IO fan-out between workers: memory (single process), mongo, unix or local
+SOCKETIO_MANAGER = os.getenv('SOCKETIO_MANAGER', 'memory')
+SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'socketio')
+SOCKETIO_UNIX_PATH = os.getenv('SOCKETIO_UNIX_PATH', '/tmp/lockedin-socketio.sock')
+# Chat persistence: "buffered" broadcasts first and batches inserts, "sync" inserts before broadcasting
+MESSAGE_DURABILITY = os.getenv('MESSAGE_DURABILITY', 'buffered')
+MESSAGE_FLUSH_INTERVAL_MS = int(os.getenv('MESSAGE_FLUSH_INTERVAL_MS', '20'))
+MESSAGE_FLUSH_BATCH_SIZE = int(os.getenv('MESSAGE_FLUSH_BATCH_SIZE', '500'))
+# Room messages closer together than this go out as one room_messages batch (0 disables)
+ROOM_BATCH_WINDOW_MS = int(os.getenv('ROOM_BATCH_WINDOW_MS', '0'))
 
 # MongoDB connection
-client = AsyncIOMotorClient(MONGO_URL)
+# The command counter charges Mongo calls to the socket event that made them
+client = AsyncIOMotorClient(MONGO_URL, event_listeners=[MongoCommandCounter()])
 db = client[DB_NAME]
 users_collection = db.users
 messages_collection = db.messages
@@ -39,6 +82,11 @@ media_collection = db.media
 friends_collection = db.friends
 reactions_collection = db.reactions
 dm_messages_collection = db.dm_messages
+blocklist_collection = db.blocklist
+blocklist_changes_collection = db.blocklist_changes
+blocklist_hits_collection = db.blocklist_hits
+user_blocked_attempts_collection = db.user_blocked_attempts
+socket_presence_collection = db.socket_presence
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -51,11 +99,34 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Socket.IO setup
-sio = socketio.AsyncServer(
+def create_socketio_manager():
+    """Pub/sub client manager so emits reach sockets held by other workers"""
+    if SOCKETIO_MANAGER == 'mongo':
+        return MongoChangeStreamManager(db.socketio_messages, channel=SOCKETIO_CHANNEL, logger=logger)
+    if SOCKETIO_MANAGER == 'unix':
+        return UnixSocketPubSubManager(SOCKETIO_UNIX_PATH, channel=SOCKETIO_CHANNEL, logger=logger)
+    if SOCKETIO_MANAGER == 'local':
+        return LocalPubSubManager(channel=SOCKETIO_CHANNEL, logger=logger)
+    return None  # default in-memory manager
+
+class SocketServer(InstrumentedServerMixin, NegotiatingAsyncServer):
+    """Per-client serializers, with per-event metrics around every handler"""
+    
+    async def _handle_event(self, eio_sid, namespace, id, data):
+        # Any event from a client counts as activity, heartbeats included;
+        # they need no handler of their own
+        sid = self.manager.sid_from_eio_sid(eio_sid, namespace or "/")
+        if sid is not None:
+            presence.heartbeat(sid)
+        await super()._handle_event(eio_sid, namespace, id, data)
+
+# JSON by default; clients may connect with ?serializer=msgpack instead
+sio = SocketServer(
     async_mode='asgi',
     cors_allowed_origins='*',
     ping_interval=25,
-    ping_timeout=60
+    ping_timeout=60,
+    client_manager=create_socketio_manager()
 )
 
 # FastAPI app
@@ -247,6 +318,122 @@ DEFAULT_MEDIA = [
     },
 ]
 
+# Seed blocklist grouped by section: [(category, domains)]
+DEFAULT_BLOCKED_DOMAINS = [
+    # Major US Sportsbooks
+    ("sportsbook", [
+        "draftkings.com", "fanduel.com", "bet365.com", "caesars.com", "betmgm.com",
+        "pointsbet.com", "barstoolsportsbook.com", "foxbet.com", "unibet.com", "williamhill.com",
+        "betrivers.com", "sugarhousebet.com", "twinspires.com", "wynnbet.com", "hardrock.bet",
+        "betfred.com", "betway.com", "borgataonline.com", "betonline.ag", "bovada.lv",
+        "mybookie.ag", "sportsbetting.ag", "intertops.eu", "xbet.ag", "betdsi.com",
+        "betonline.com", "betonusa.com", "bovada.ag", "nitrogen.eu", "cloudbet.com",
+    ]),
+    # Online Casinos
+    ("casino", [
+        "888casino.com", "pokerstars.com", "partypoker.com", "pulsz.com", "stake.us",
+        "betmgmcasino.com", "goldencasino.com", "betrivers.net", "playsugarhouse.com",
+        "tropicana.net", "mohegansuncasino.com", "resortscasino.com", "betamerica.com",
+        "chumba.com", "luckyland.com", "funzpoints.com", "global poker.com", "fortunecoins.com",
+        "wow.vegas.com", "sweepslots.com", "mcluck.com", "real.prize.com", "rollbit.com",
+        "ignition.casino", "cafe-casino.com", "slots.lv", "slotslights.com", "bodog.com",
+    ]),
+    # Social Casinos
+    ("social_casino", [
+        "doubledowncasino.com", "slotsmania.com", "houseof fun.com", "jackpotparty.com",
+        "quickhitsslots.com", "hititrich.com", "pop slots.com", "slotomania.com",
+        "cashman.com", "lightning link.com", "heartoflasvegas.com", "big fish casino.com",
+        "caesarscasino.com", "mykonami.com", "doubleucasino.com", "lucktastic.com",
+        "wsop.com", "zynga.com/games/zynga-poker", "replay poker.com", "playtika.com",
+    ]),
+    # International Betting Sites
+    ("sportsbook", [
+        "bet888.com", "bwin.com", "paddypower.com", "betfair.com", "coral.co.uk",
+        "ladbrokes.com", "skybet.com", "betvictor.com", "10bet.com", "888sport.com",
+        "betsson.com", "bethard.com", "mr green.com", "leovegas.com", "casumo.com",
+        "22bet.com", "1xbet.com", "melbet.com", "parimatch.com", "dafabet.com",
+        "sbobet.com", "pinnacle.com", "marathon bet.com", "asiabet.com", "cmd368.com",
+    ]),
+    # Crypto Gambling
+    ("crypto", [
+        "stake.com", "roobet.com", "bc.game", "duelbits.com", "wolf.bet",
+        "betfury.io", "coinflip.com", "fortunejack.com", "bitstarz.com", "cryptowild.com",
+        "fair spin.com", "bitcasino.io", "sportsbet.io", "cloudbet.com", "nitrogen.eu",
+        "thunderpick.io", "trust dice.io", "metaspins.com", "punt.com", "flush.com",
+    ]),
+    # DFS & Fantasy Sports
+    ("fantasy", [
+        "draftkings.com/daily-fantasy", "fanduel.com/fantasy", "yahoo.com/fantasy",
+        "espn.com/fantasy", "underdog.com", "prizepicks.com", "drafters.com",
+        "monday.qq.com", "superdraft.com", "betr.com", "parlayplay.com", "jock mkt.com",
+    ]),
+    # Horse Racing
+    ("horse_racing", [
+        "tvg.com", "twinspires.com", "xpressbet.com", "nyra.com/bets", "betamerica.com",
+        "4njbets.com", "fanduel racing.com", "paddypower.com/racing", "betfair racing.com",
+    ]),
+    # Lottery & Bingo
+    ("lottery", [
+        "jackpocket.com", "thel.com", "luckyday.com", "bingo.com", "bingoblitz.com",
+        "gsn.com/bingo", "bingozone.com", "cyberbingo.com", "south beach bingo.com",
+    ]),
+    # Poker Sites
+    ("poker", [
+        "pokerstars.net", "888poker.com", "party poker.com", "acr poker.eu",
+        "globalpoker.com", "wsop.com/poker", "ggpoker.com", "bet online.poker",
+        "ignitionpoker.eu", "carbon poker.ag", "bodog.poker", "betonline.poker",
+    ]),
+    # Prediction Markets
+    ("prediction_market", [
+        "predicit.com", "poly market.com", "kalshi.com", "augur.net", "futuur.com",
+    ]),
+    # Skill-Based & Other
+    ("skill_gaming", [
+        "skillz.com", "pocket7games.com", "real money.com", "swagbucks.com/games",
+        "long game.com", "winr.games", "gameville.com", "winview.com",
+    ]),
+    # Additional International
+    ("sportsbook", [
+        "betano.com", "inter wetten.com", "tipico.com", "bettilt.com", "netbet.com",
+        "marathonbet.com", "boyle sports.com", "sports bet.com.au", "tab.com.au",
+        "bet365.es", "codere.es", "marca.apuestas.es", "luckia.es", "versus.es",
+        "bet way.co.za", "hollywoodbets.net", "supabets.co.za", "bet.co.za",
+        "betika.com", "sporty bet.com", "1xbet.ng", "bet9ja.com", "nairabet.com",
+    ]),
+    # Sweepstakes & Contest Sites
+    ("sweepstakes", [
+        "sweepstakes.com", "contest.com", "omaze.com", "prizegrab.com", "raffall.com",
+        "lottoland.com", "thelotter.com", "mega millions.com", "power ball.com",
+    ]),
+    # Affiliate/Review Sites
+    ("affiliate", [
+        "odds checker.com", "sbo.net", "askgamblers.com", "casino.org", "gambling.com",
+        "odds portal.com", "bet tips.com", "picks and parlays.com", "covers.com",
+        "the action network.com", "vegasinsider.com", "sports betting dime.com",
+    ]),
+    # Mobile Apps Websites
+    ("rewards_app", [
+        "big time.com", "mistplay.com", "appkarma.io", "featurepoints.com",
+        "cash'em all.com", "make money.com", "money sms.com", "current app.com",
+    ]),
+    # Emerging/New Platforms (2024-2025)
+    ("sportsbook", [
+        "fliff.com", "betr.app", "tipico.de", "betano.de", "neo.bet",
+        "admiral bet.com", "maxbet.rs", "meridian bet.com", "mozzart.com",
+        "pinnbet.com", "stoiximan.gr", "novibet.gr", "pamestoixima.gr",
+    ]),
+    # Fantasy & Props
+    ("fantasy", [
+        "champ.games", "dabble.com", "sleeper.app", "run your pool.com",
+        "fantasy pros.com", "draft sharks.com", "player profiler.com",
+    ]),
+    # Newer Social Casinos
+    ("social_casino", [
+        "zula.casino", "gambino.slots.com", "scratchmania.com", "primal.casino",
+        "wow.vegas", "hey.spin.com", "vibe.gaming.com", "wild.casino",
+    ]),
+]
+
 # Chat models
 class ChatMessageCreate(BaseModel):
     content: str = Field(..., min_length=1, max_length=1000)
@@ -257,6 +444,19 @@ class ReactionCreate(BaseModel):
     target_type: str  # "activity" or "chat"
     target_id: str
 
+class BulkUserAction(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    reason: str = "Admin blocked"
+
+class MessagePurgeRequest(BaseModel):
+    user_id: str
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    include_reactions: bool = True
+
+class PresenceQuery(BaseModel):
+    user_ids: List[str] = Field(..., max_length=1000)
+
 class FriendRequest(BaseModel):
     receiver_id: str
 
@@ -277,6 +477,37 @@ class VPNEnableRequest(BaseModel):
 class VPNUnlockRequest(BaseModel):
     reason: str = Field(..., min_length=10, max_length=500)
 
+class BlocklistOverlayUpdate(BaseModel):
+    add_domains: List[str] = []
+    remove_domains: List[str] = []
+
+class BlocklistUpdate(BaseModel):
+    add: List[str] = []
+    remove: List[str] = []
+    category: str = "uncategorized"
+
+class BlocklistImportEntry(BaseModel):
+    domain: str
+    category: str = "uncategorized"
+
+class BlocklistImport(BaseModel):
+    entries: List[BlocklistImportEntry] = Field(..., max_length=50000)
+
+class BlockedAttempt(BaseModel):
+    url: str
+    category: Optional[str] = None
+
+class BlockedAttemptReport(BaseModel):
+    events: List[BlockedAttempt] = Field(..., max_length=100)
+
+class BlockCheckRequest(BaseModel):
+    urls: List[str] = Field(..., max_length=1000)
+
+class UnlockDecisionBulk(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    action: str = Field(..., description="approve or deny")
+    reason: str = "Request denied by admin"
+
 class VPNStatus(BaseModel):
     recovery_mode_enabled: bool
     lock_duration: Optional[str]
@@ -354,6 +585,12 @@ async def get_current_admin(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
+def parse_object_id(value: str, detail: str = "Invalid id") -> ObjectId:
+    try:
+        return ObjectId(value)
+    except Exception:
+        raise HTTPException(status_code=400, detail=detail)
+
 def serialize_doc(doc):
     """Convert MongoDB document to JSON-serializable dict"""
     if doc is None:
@@ -385,6 +622,11 @@ async def startup_db():
     await users_collection.create_index("email", unique=True)
     await users_collection.create_index("username", unique=True)
     await messages_collection.create_index([("timestamp", -1)])
+    await messages_collection.create_index([("user_id", 1), ("timestamp", 1)])
+    await messages_collection.create_index([("room", 1), ("timestamp", 1), ("_id", 1)])
+    await chat_messages_collection.create_index([("user_id", 1), ("created_at", 1)])
+    await reactions_collection.create_index([("user_id", 1), ("created_at", 1)])
+    await reactions_collection.create_index([("target_type", 1), ("target_id", 1)])
     
     # Initialize default settings
     default_settings = await settings_collection.find_one({"_id": "app_settings"})
@@ -392,101 +634,6 @@ async def startup_db():
         await settings_collection.insert_one({
             "_id": "app_settings",
             "discord_link": "https://discord.gg/gambling-recovery",
-            "blocked_domains": [
-                # Major US Sportsbooks
-                "draftkings.com", "fanduel.com", "bet365.com", "caesars.com", "betmgm.com",
-                "pointsbet.com", "barstoolsportsbook.com", "foxbet.com", "unibet.com", "williamhill.com",
-                "betrivers.com", "sugarhousebet.com", "twinspires.com", "wynnbet.com", "hardrock.bet",
-                "betfred.com", "betway.com", "borgataonline.com", "betonline.ag", "bovada.lv",
-                "mybookie.ag", "sportsbetting.ag", "intertops.eu", "xbet.ag", "betdsi.com",
-                "betonline.com", "betonusa.com", "bovada.ag", "nitrogen.eu", "cloudbet.com",
-                
-                # Online Casinos
-                "888casino.com", "pokerstars.com", "partypoker.com", "pulsz.com", "stake.us",
-                "betmgmcasino.com", "goldencasino.com", "betrivers.net", "playsugarhouse.com",
-                "tropicana.net", "mohegansuncasino.com", "resortscasino.com", "betamerica.com",
-                "chumba.com", "luckyland.com", "funzpoints.com", "global poker.com", "fortunecoins.com",
-                "wow.vegas.com", "sweepslots.com", "mcluck.com", "real.prize.com", "rollbit.com",
-                "ignition.casino", "cafe-casino.com", "slots.lv", "slotslights.com", "bodog.com",
-                
-                # Social Casinos
-                "doubledowncasino.com", "slotsmania.com", "houseof fun.com", "jackpotparty.com",
-                "quickhitsslots.com", "hititrich.com", "pop slots.com", "slotomania.com",
-                "cashman.com", "lightning link.com", "heartoflasvegas.com", "big fish casino.com",
-                "caesarscasino.com", "mykonami.com", "doubleucasino.com", "lucktastic.com",
-                "wsop.com", "zynga.com/games/zynga-poker", "replay poker.com", "playtika.com",
-                
-                # International Betting Sites
-                "bet888.com", "bwin.com", "paddypower.com", "betfair.com", "coral.co.uk",
-                "ladbrokes.com", "skybet.com", "betvictor.com", "10bet.com", "888sport.com",
-                "betsson.com", "bethard.com", "mr green.com", "leovegas.com", "casumo.com",
-                "22bet.com", "1xbet.com", "melbet.com", "parimatch.com", "dafabet.com",
-                "sbobet.com", "pinnacle.com", "marathon bet.com", "asiabet.com", "cmd368.com",
-                
-                # Crypto Gambling
-                "stake.com", "roobet.com", "bc.game", "duelbits.com", "wolf.bet",
-                "betfury.io", "coinflip.com", "fortunejack.com", "bitstarz.com", "cryptowild.com",
-                "fair spin.com", "bitcasino.io", "sportsbet.io", "cloudbet.com", "nitrogen.eu",
-                "thunderpick.io", "trust dice.io", "metaspins.com", "punt.com", "flush.com",
-                
-                # DFS & Fantasy Sports
-                "draftkings.com/daily-fantasy", "fanduel.com/fantasy", "yahoo.com/fantasy",
-                "espn.com/fantasy", "underdog.com", "prizepicks.com", "drafters.com",
-                "monday.qq.com", "superdraft.com", "betr.com", "parlayplay.com", "jock mkt.com",
-                
-                # Horse Racing
-                "tvg.com", "twinspires.com", "xpressbet.com", "nyra.com/bets", "betamerica.com",
-                "4njbets.com", "fanduel racing.com", "paddypower.com/racing", "betfair racing.com",
-                
-                # Lottery & Bingo
-                "jackpocket.com", "thel.com", "luckyday.com", "bingo.com", "bingoblitz.com",
-                "gsn.com/bingo", "bingozone.com", "cyberbingo.com", "south beach bingo.com",
-                
-                # Poker Sites
-                "pokerstars.net", "888poker.com", "party poker.com", "acr poker.eu",
-                "globalpoker.com", "wsop.com/poker", "ggpoker.com", "bet online.poker",
-                "ignitionpoker.eu", "carbon poker.ag", "bodog.poker", "betonline.poker",
-                
-                # Prediction Markets
-                "predicit.com", "poly market.com", "kalshi.com", "augur.net", "futuur.com",
-                
-                # Skill-Based & Other
-                "skillz.com", "pocket7games.com", "real money.com", "swagbucks.com/games",
-                "long game.com", "winr.games", "gameville.com", "winview.com",
-                
-                # Additional International
-                "betano.com", "inter wetten.com", "tipico.com", "bettilt.com", "netbet.com",
-                "marathonbet.com", "boyle sports.com", "sports bet.com.au", "tab.com.au",
-                "bet365.es", "codere.es", "marca.apuestas.es", "luckia.es", "versus.es",
-                "bet way.co.za", "hollywoodbets.net", "supabets.co.za", "bet.co.za",
-                "betika.com", "sporty bet.com", "1xbet.ng", "bet9ja.com", "nairabet.com",
-                
-                # Sweepstakes & Contest Sites
-                "sweepstakes.com", "contest.com", "omaze.com", "prizegrab.com", "raffall.com",
-                "lottoland.com", "thelotter.com", "mega millions.com", "power ball.com",
-                
-                # Affiliate/Review Sites
-                "odds checker.com", "sbo.net", "askgamblers.com", "casino.org", "gambling.com",
-                "odds portal.com", "bet tips.com", "picks and parlays.com", "covers.com",
-                "the action network.com", "vegasinsider.com", "sports betting dime.com",
-                
-                # Mobile Apps Websites
-                "big time.com", "mistplay.com", "appkarma.io", "featurepoints.com",
-                "cash'em all.com", "make money.com", "money sms.com", "current app.com",
-                
-                # Emerging/New Platforms (2024-2025)
-                "fliff.com", "betr.app", "tipico.de", "betano.de", "neo.bet",
-                "admiral bet.com", "maxbet.rs", "meridian bet.com", "mozzart.com",
-                "pinnbet.com", "stoiximan.gr", "novibet.gr", "pamestoixima.gr",
-                
-                # Fantasy & Props
-                "champ.games", "dabble.com", "sleeper.app", "run your pool.com",
-                "fantasy pros.com", "draft sharks.com", "player profiler.com",
-                
-                # Newer Social Casinos
-                "zula.casino", "gambino.slots.com", "scratchmania.com", "primal.casino",
-                "wow.vegas", "hey.spin.com", "vibe.gaming.com", "wild.casino",
-            ]
         })
     
     logger.info("Database initialized")
@@ -501,6 +648,29 @@ async def startup_db():
     await community_activity_collection.create_index([("created_at", -1)])
     await community_activity_collection.create_index("user_id")
     await user_achievements_collection.create_index("user_id")
+    
+    await blocklist_collection.create_index([("host", 1), ("path", 1)], unique=True)
+    await blocklist_collection.create_index("category")
+    await blocklist_changes_collection.create_index("version", unique=True)
+    await migrate_blocklist()
+    await load_blocklist()
+    start_background_task(blocklist_refresh_loop())
+
+# Long-running background loops started at startup and cancelled on shutdown
+background_tasks = []
+
+def start_background_task(coro):
+    """Schedule a background coroutine that lives for the lifetime of the app"""
+    task = asyncio.create_task(coro)
+    background_tasks.append(task)
+    return task
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
 
 # Helper function to create community activity
 async def create_community_activity(user_id: str, activity_type: str, activity_value: str = None):
@@ -607,6 +777,7 @@ async def register(user_data: UserRegister):
     
     result = await users_collection.insert_one(user_doc)
     user_id = str(result.inserted_id)
+    await bump_admin_stats(total_users=1)
     
     # Create token
     token = create_access_token({"sub": user_id})
@@ -667,7 +838,8 @@ async def get_recovery_stats(current_user: dict = Depends(get_current_user)):
         "money_saved": round(total_saved, 2),
         "sobriety_start_date": sobriety_start.isoformat() if sobriety_start else None,
         "last_gambled_date": current_user.get("last_gambled_date"),
-        "gambling_weekly_amount": weekly_amount
+        "gambling_weekly_amount": weekly_amount,
+        "attempts_blocked_this_week": await get_weekly_blocked_attempts(current_user["_id"])
     }
 
 @app.post("/api/recovery/relapse")
@@ -722,6 +894,131 @@ async def get_gambling_history(current_user: dict = Depends(get_current_user)):
     history = user.get("gambling_history", [])
     return {"history": serialize_doc(history)}
 
+# ============= MESSAGE WRITE-BEHIND =============
+
+# Buffered chat inserts: {collection name: [docs]}
+message_buffers = {}
+message_flush_wakeup = asyncio.Event()
+message_batch_full = asyncio.Event()
+message_flush_lock = asyncio.Lock()
+# Admin counters bumped once rows are actually written
+MESSAGE_STATS_COUNTERS = {"messages": "total_messages"}
+message_write_stats = {
+    "buffered": 0, "written": 0, "batches": 0, "largest_batch": 0,
+    "flush_errors": 0, "requeued": 0, "rejected": 0,
+    "last_flush_ms": 0.0, "max_flush_ms": 0.0, "oldest_pending_at": None
+}
+
+async def messages_written(collection_name: str, count: int):
+    message_write_stats["written"] += count
+    counter = MESSAGE_STATS_COUNTERS.get(collection_name)
+    if counter and count:
+        await bump_admin_stats(**{counter: count})
+
+async def persist_message(collection, doc: dict) -> ObjectId:
+    """Assign the message id now and insert it (buffered unless MESSAGE_DURABILITY=sync)"""
+    doc = {**doc, "_id": ObjectId()}
+    if MESSAGE_DURABILITY == "sync":
+        await collection.insert_one(doc)
+        await messages_written(collection.name, 1)
+        return doc["_id"]
+    
+    buffer = message_buffers.setdefault(collection.name, [])
+    buffer.append(doc)
+    message_write_stats["buffered"] += 1
+    if message_write_stats["oldest_pending_at"] is None:
+        message_write_stats["oldest_pending_at"] = datetime.utcnow()
+    message_flush_wakeup.set()
+    if len(buffer) >= MESSAGE_FLUSH_BATCH_SIZE:
+        message_batch_full.set()
+    return doc["_id"]
+
+async def insert_message_batch(collection_name: str, batch: list):
+    try:
+        await db[collection_name].insert_many(batch, ordered=False)
+        written = len(batch)
+    except BulkWriteError as e:
+        # Duplicate ids are rows an interrupted flush already wrote
+        errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+        written = len(batch) - len(errors)
+        if errors:
+            message_write_stats["rejected"] += len(errors)
+            logger.error(f"{len(errors)} {collection_name} rows rejected: {errors[0].get('errmsg')}")
+    await messages_written(collection_name, written)
+
+async def flush_messages():
+    """Write every buffered message; failed batches go back to the front of the buffer
+
+    Flushes run one at a time, so when this returns True every message
+    buffered before the call is in Mongo. Returns False if a batch failed.
+    """
+    async with message_flush_lock:
+        return await write_buffered_messages()
+
+async def write_buffered_messages():
+    started = datetime.utcnow()
+    ok = True
+    message_write_stats["oldest_pending_at"] = None
+    for collection_name in list(message_buffers):
+        docs = message_buffers[collection_name]
+        message_buffers[collection_name] = []
+        message_write_stats["buffered"] -= len(docs)
+        while docs:
+            batch = docs[:MESSAGE_FLUSH_BATCH_SIZE]
+            try:
+                await insert_message_batch(collection_name, batch)
+            except BaseException as e:
+                # Keep the rows (also on cancellation at shutdown) for the next flush
+                message_buffers[collection_name][:0] = docs
+                message_write_stats["buffered"] += len(docs)
+                message_write_stats["requeued"] += len(docs)
+                message_write_stats["oldest_pending_at"] = started
+                if not isinstance(e, Exception):
+                    raise
+                message_write_stats["flush_errors"] += 1
+                logger.error(f"Message flush to {collection_name} failed: {e}")
+                ok = False
+                break
+            docs = docs[MESSAGE_FLUSH_BATCH_SIZE:]
+            message_write_stats["batches"] += 1
+            message_write_stats["largest_batch"] = max(message_write_stats["largest_batch"], len(batch))
+    
+    elapsed_ms = (datetime.utcnow() - started).total_seconds() * 1000
+    message_write_stats["last_flush_ms"] = round(elapsed_ms, 2)
+    message_write_stats["max_flush_ms"] = max(message_write_stats["max_flush_ms"], round(elapsed_ms, 2))
+    return ok
+
+async def message_flush_loop():
+    while True:
+        await message_flush_wakeup.wait()
+        try:
+            await asyncio.wait_for(message_batch_full.wait(), MESSAGE_FLUSH_INTERVAL_MS / 1000)
+        except asyncio.TimeoutError:
+            pass
+        message_flush_wakeup.clear()
+        message_batch_full.clear()
+        if not await flush_messages():
+            await asyncio.sleep(1)  # back off while Mongo is failing
+            message_flush_wakeup.set()
+
+@app.on_event("startup")
+async def startup_message_writes():
+    start_background_task(message_flush_loop())
+
+@app.on_event("shutdown")
+async def shutdown_message_writes():
+    # Runs after the flush loop is cancelled; anything it held was requeued
+    await flush_messages()
+    if message_write_stats["buffered"]:
+        logger.error(f"{message_write_stats['buffered']} chat messages were not persisted at shutdown")
+
+@app.get("/api/admin/chat/write-stats")
+async def get_message_write_stats(current_user: dict = Depends(get_current_admin)):
+    stats = dict(message_write_stats)
+    oldest = stats.pop("oldest_pending_at")
+    stats["pending_age_ms"] = round((datetime.utcnow() - oldest).total_seconds() * 1000, 2) if oldest else 0
+    return {"durability": MESSAGE_DURABILITY, **stats}
+
 # ============= CHAT ENDPOINTS =============
 
 @app.get("/api/chat/history")
@@ -738,23 +1035,876 @@ async def get_chat_history(
 
 # ============= RECOVERY MODE / VPN ENDPOINTS =============
 
+# ============= BLOCKLIST MATCHING =============
+
+# Per-user overlay limits
+MAX_CUSTOM_BLOCKED_DOMAINS = 500
+USER_MATCHER_CACHE_SIZE = 10000
+# Versions of blocklist changes kept in memory for delta sync
+BLOCKLIST_CHANGELOG_RETENTION = 200
+# How often each worker checks whether another one changed the list
+BLOCKLIST_REFRESH_SECONDS = 30
+
+def normalize_domain(entry: str) -> str:
+    """Normalize a blocklist entry to lowercase host[/path] form"""
+    entry = entry.strip().lower()
+    if "://" in entry:
+        entry = entry.split("://", 1)[1]
+    entry = entry.lstrip("*.").rstrip("/")
+    if entry.startswith("www."):
+        entry = entry[4:]
+    return entry
+
+VALID_HOSTNAME = re.compile(r"^[a-z0-9_-]+(\.[a-z0-9_-]+)+$")
+
+def parse_blocklist_entry(raw: str) -> Optional[tuple]:
+    """Clean a raw entry into (host, path), or None if it is not a valid rule.
+
+    Embedded spaces and quotes are dropped ("houseof fun.com" -> "houseoffun.com") and
+    path fragments become path rules ("yahoo.com/fantasy").
+    """
+    entry = normalize_domain(raw.replace(" ", "").replace("'", ""))
+    host, slash, path = entry.partition("/")
+    if not VALID_HOSTNAME.match(host):
+        return None
+    return host, (slash + path).rstrip("/")
+
+def url_host_and_path(url: str) -> tuple:
+    """Extract (host, path) from a URL or bare hostname"""
+    url = url.strip().lower()
+    scheme_end = url.find("://")
+    if scheme_end != -1:
+        url = url[scheme_end + 3:]
+    for sep in "?#":
+        cut = url.find(sep)
+        if cut != -1:
+            url = url[:cut]
+    authority, slash, path = url.partition("/")
+    host = authority.rpartition("@")[2]
+    if host.startswith("["):
+        host = host[:host.find("]") + 1]
+    else:
+        host = host.partition(":")[0]
+    return host.rstrip("."), (slash + path).rstrip("/")
+
+# Trie node keys that can never collide with a DNS label
+_TRIE_BLOCKED = "\0"
+_TRIE_PATHS = "\1"
+
+class DomainMatcher:
+    """Compiled blocklist as a reversed-label suffix trie.
+
+    "sportsbook.draftkings.com" walks com -> draftkings -> sportsbook and
+    stops at the first node marked blocked, so an entry matches its exact
+    host and every subdomain, never unrelated hosts that merely contain it.
+    """
+    
+    def __init__(self, domains: List[str]):
+        self.root = {}
+        self.size = 0
+        for entry in domains:
+            self.add(entry)
+    
+    def add(self, entry: str):
+        entry = normalize_domain(entry)
+        if not entry:
+            return
+        host, _, path = entry.partition("/")
+        node = self.root
+        for label in reversed(host.split(".")):
+            node = node.setdefault(label, {})
+        if path:
+            node.setdefault(_TRIE_PATHS, []).append(("/" + path, entry))
+        elif _TRIE_BLOCKED not in node:
+            node[_TRIE_BLOCKED] = entry
+        else:
+            return
+        self.size += 1
+    
+    def match_host(self, host: str, path: str = "", skip=()) -> Optional[str]:
+        """Return the entry blocking host (and optional path), or None.
+
+        Entries in `skip` are passed over, so a longer entry below them can still match.
+        """
+        node = self.root
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                return None
+            blocked = node.get(_TRIE_BLOCKED)
+            if blocked and blocked not in skip:
+                return blocked
+            for prefix, entry in node.get(_TRIE_PATHS, ()):
+                if (path == prefix or path.startswith(prefix + "/")) and entry not in skip:
+                    return entry
+        return None
+    
+    def match(self, url: str) -> Optional[str]:
+        """Return the blocklist entry matching a URL, or None"""
+        host, path = url_host_and_path(url)
+        if not host:
+            return None
+        return self.match_host(host, path)
+
+class OverlayMatcher:
+    """A user's view of the global matcher: their own additions, minus their removals.
+
+    Only the additions are compiled per user; the global trie is shared and
+    looked up at match time, so a new list version needs no rebuild.
+    """
+    
+    def __init__(self, additions: List[str], removals: List[str]):
+        self.additions = DomainMatcher(additions)
+        self.removals = frozenset(removals)
+    
+    def match_host(self, host: str, path: str = "") -> Optional[str]:
+        """Return the entry blocking host (and optional path), or None"""
+        return (self.additions.match_host(host, path)
+                or blocklist_cache["matcher"].match_host(host, path, self.removals))
+    
+    def match(self, url: str) -> Optional[str]:
+        """Return the blocklist entry matching a URL, or None"""
+        host, path = url_host_and_path(url)
+        if not host:
+            return None
+        return self.match_host(host, path)
+
+def blocklist_hash(domains: List[str]) -> str:
+    """Order-independent content hash of a domain list"""
+    return hashlib.sha256("\n".join(sorted(domains)).encode()).hexdigest()
+
+# Global blocklist, compiled once per version of the settings list
+blocklist_cache = {
+    "version": 0,
+    "hash": blocklist_hash([]),
+    "domains": [],
+    "categories": {},  # {rule: category}
+    "category_names": frozenset(),
+    "matcher": DomainMatcher([]),
+    "changes": []  # [(version, added, removed)] ascending, most recent only
+}
+# Per-user overlays: {user_id: ((overlay_version, removals_active), OverlayMatcher)}
+user_matcher_cache = OrderedDict()
+
+async def insert_blocklist_entries(entries: List[tuple], source: str) -> List[str]:
+    """Bulk insert (host, path, category) rules, skipping duplicates.
+
+    Returns the rules that were actually inserted, as "host[/path]" strings.
+    """
+    if not entries:
+        return []
+    now = datetime.utcnow()
+    docs = [
+        {"host": host, "path": path, "category": category, "source": source, "created_at": now}
+        for host, path, category in entries
+    ]
+    failed = set()
+    try:
+        await blocklist_collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        failed = {err["index"] for err in e.details.get("writeErrors", [])}
+    return [docs[i]["host"] + docs[i]["path"] for i in range(len(docs)) if i not in failed]
+
+async def migrate_blocklist():
+    """Move the flat settings array (or the seed list) into the blocklist collection"""
+    if await blocklist_collection.estimated_document_count() > 0:
+        return
+    
+    categories = {}
+    for category, domains in DEFAULT_BLOCKED_DOMAINS:
+        for raw in domains:
+            parsed = parse_blocklist_entry(raw)
+            if parsed:
+                categories.setdefault(parsed, category)
+    
+    settings = await settings_collection.find_one({"_id": "app_settings"}) or {}
+    raw_entries = settings.get("blocked_domains")
+    if raw_entries is None:
+        parsed_entries = list(categories)
+    else:
+        parsed_entries = [p for p in map(parse_blocklist_entry, raw_entries) if p]
+    
+    entries = [(host, path, categories.get((host, path), "uncategorized"))
+               for host, path in dict.fromkeys(parsed_entries)]
+    inserted = await insert_blocklist_entries(entries, "seed")
+    
+    # Cached client copies predate normalization, so force a full resync
+    await settings_collection.update_one(
+        {"_id": "app_settings"},
+        {"$unset": {"blocked_domains": ""}, "$inc": {"blocked_domains_version": 1}}
+    )
+    logger.info(f"Blocklist migrated: {len(inserted)} entries")
+
+async def record_blocklist_change(added: List[str], removed: List[str], admin_id: str) -> int:
+    """Bump the list version, log the change for delta sync and recompile"""
+    settings = await settings_collection.find_one_and_update(
+        {"_id": "app_settings"},
+        {"$inc": {"blocked_domains_version": 1}},
+        projection={"blocked_domains_version": 1},
+        return_document=True
+    )
+    version = settings["blocked_domains_version"]
+    
+    await blocklist_changes_collection.insert_one({
+        "version": version,
+        "added": added,
+        "removed": removed,
+        "changed_by": admin_id,
+        "created_at": datetime.utcnow()
+    })
+    await load_blocklist()
+    return version
+
+async def load_blocklist():
+    """(Re)compile the global blocklist from the blocklist collection"""
+    settings = await settings_collection.find_one(
+        {"_id": "app_settings"},
+        {"blocked_domains_version": 1}
+    ) or {}
+    version = settings.get("blocked_domains_version", 0)
+    
+    entries = await blocklist_collection.find(
+        {},
+        {"_id": 0, "host": 1, "path": 1, "category": 1}
+    ).to_list(None)
+    categories = {e["host"] + e["path"]: e["category"] for e in entries}
+    domains = sorted(categories)
+    
+    changes = await blocklist_changes_collection.find(
+        {"version": {"$lte": version}}
+    ).sort("version", -1).limit(BLOCKLIST_CHANGELOG_RETENTION).to_list(None)
+    changes.reverse()
+    
+    blocklist_cache["domains"] = domains
+    blocklist_cache["categories"] = categories
+    blocklist_cache["category_names"] = frozenset(categories.values())
+    blocklist_cache["matcher"] = DomainMatcher(domains)
+    blocklist_cache["hash"] = blocklist_hash(domains)
+    blocklist_cache["changes"] = [(c["version"], c["added"], c["removed"]) for c in changes]
+    blocklist_cache["version"] = version
+
+async def blocklist_refresh_loop():
+    """Pick up list changes made through other workers"""
+    while True:
+        await asyncio.sleep(BLOCKLIST_REFRESH_SECONDS)
+        try:
+            settings = await settings_collection.find_one(
+                {"_id": "app_settings"},
+                {"blocked_domains_version": 1}
+            ) or {}
+            if settings.get("blocked_domains_version", 0) != blocklist_cache["version"]:
+                await load_blocklist()
+        except Exception as e:
+            logger.error(f"Blocklist refresh failed: {e}")
+
+ENTITY_TAG = re.compile(r'(?:W/)?("[^"]*")')
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches etag (RFC 9110 weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in ENTITY_TAG.findall(if_none_match)
+
+def blocklist_diff(since: int) -> Optional[tuple]:
+    """Net (added, removed) between a client version and the current one.
+
+    Returns None when the changelog no longer reaches back to `since`,
+    in which case the client needs the full list.
+    """
+    changes = blocklist_cache["changes"]
+    if since > blocklist_cache["version"] or since < 0:
+        return None
+    if since < blocklist_cache["version"] and (not changes or changes[0][0] > since + 1):
+        return None
+    
+    added, removed = set(), set()
+    for version, change_added, change_removed in changes:
+        if version <= since:
+            continue
+        for domain in change_added:
+            if domain in removed:
+                removed.discard(domain)
+            else:
+                added.add(domain)
+        for domain in change_removed:
+            if domain in added:
+                added.discard(domain)
+            else:
+                removed.add(domain)
+    return sorted(added), sorted(removed)
+
+def overlay_removals_active(user: dict) -> bool:
+    """Removals from the global list only apply while no lock is active"""
+    return not user.get("recovery_mode_enabled", False)
+
+def get_user_matcher(user: dict):
+    """Matcher for the global list with the user's own overlay applied"""
+    additions = user.get("blocklist_additions") or []
+    removals = user.get("blocklist_removals") or []
+    if not overlay_removals_active(user):
+        removals = []
+    if not additions and not removals:
+        return blocklist_cache["matcher"]
+    
+    user_id = str(user["_id"])
+    key = (user.get("blocklist_overlay_version", 0), bool(removals))
+    cached = user_matcher_cache.get(user_id)
+    if cached and cached[0] == key:
+        user_matcher_cache.move_to_end(user_id)
+        return cached[1]
+    
+    matcher = OverlayMatcher(additions, removals)
+    
+    user_matcher_cache[user_id] = (key, matcher)
+    user_matcher_cache.move_to_end(user_id)
+    if len(user_matcher_cache) > USER_MATCHER_CACHE_SIZE:
+        user_matcher_cache.popitem(last=False)
+    return matcher
+
 @app.get("/api/blocking/domains")
-async def get_blocked_domains(current_user: dict = Depends(get_current_user)):
-    """Get list of blocked gambling domains"""
-    settings = await settings_collection.find_one({"_id": "app_settings"})
-    return {"domains": settings.get("blocked_domains", [])}
+async def get_blocked_domains(
+    request: Request,
+    response: Response,
+    since: Optional[int] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get blocked gambling domains, or only the changes since a version"""
+    version = blocklist_cache["version"]
+    removals_active = overlay_removals_active(current_user)
+    overlay = f'{current_user.get("blocklist_overlay_version", 0)}{"" if removals_active else "-locked"}'
+    etag = f'"bl-{version}-{overlay}"'
+    headers = {"ETag": etag, "X-Blocklist-Version": str(version), "Cache-Control": "no-cache"}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    
+    result = {
+        "version": version,
+        "hash": blocklist_cache["hash"],
+        "custom_additions": current_user.get("blocklist_additions", []),
+        "custom_removals": current_user.get("blocklist_removals", []) if removals_active else []
+    }
+    
+    diff = blocklist_diff(since) if since is not None else None
+    if diff is None:
+        result["full"] = True
+        result["domains"] = blocklist_cache["domains"]
+    else:
+        result["full"] = False
+        result["since"] = since
+        result["added"], result["removed"] = diff
+    return result
+
+@app.patch("/api/admin/blocking/domains")
+async def update_blocked_domains(
+    update: BlocklistUpdate,
+    current_user: dict = Depends(get_current_admin)
+):
+    """Admin: add or remove global blocked domains, bumping the list version"""
+    to_add = [parse_blocklist_entry(d) for d in update.add]
+    invalid = [d for d, parsed in zip(update.add, to_add) if parsed is None]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid domains: {', '.join(invalid[:10])}")
+    
+    added = await insert_blocklist_entries(
+        [(host, path, update.category) for host, path in dict.fromkeys(to_add)], "admin"
+    )
+    
+    # Removals are normalized like additions and deleted one by one, so two
+    # admins removing the same rule never both log it in the change feed
+    removed = []
+    for host, path in dict.fromkeys(p for p in map(parse_blocklist_entry, update.remove) if p):
+        if await blocklist_collection.find_one_and_delete({"host": host, "path": path}, {"_id": 1}):
+            removed.append(host + path)
+    
+    if not added and not removed:
+        return {"version": blocklist_cache["version"], "added": [], "removed": []}
+    
+    version = await record_blocklist_change(added, removed, current_user["_id"])
+    return {"version": version, "added": added, "removed": removed}
 
-@app.get("/api/vpn/status")
-async def get_vpn_status(current_user: dict = Depends(get_current_user)):
-    """Get comprehensive VPN/Recovery Mode status including cooldown info"""
-    user = await users_collection.find_one(
-        {"_id": ObjectId(current_user["_id"])}
+@app.post("/api/admin/blocking/import")
+async def import_blocked_domains(
+    data: BlocklistImport,
+    current_user: dict = Depends(get_current_admin)
+):
+    """Admin: bulk import categorized rules; duplicates and invalid entries are skipped"""
+    entries = {}
+    invalid = []
+    for item in data.entries:
+        parsed = parse_blocklist_entry(item.domain)
+        if parsed is None:
+            invalid.append(item.domain)
+        else:
+            entries.setdefault(parsed, item.category.strip().lower() or "uncategorized")
+    
+    added = await insert_blocklist_entries(
+        [(host, path, category) for (host, path), category in entries.items()], "import"
+    )
+    version = await record_blocklist_change(added, [], current_user["_id"]) if added else blocklist_cache["version"]
+    
+    return {
+        "version": version,
+        "inserted": len(added),
+        "duplicates": len(entries) - len(added),
+        "invalid": invalid[:100]
+    }
+
+@app.get("/api/admin/blocking/entries")
+async def get_blocklist_entries(
+    category: Optional[str] = None,
+    current_user: dict = Depends(get_current_admin)
+):
+    """Admin: blocklist rules with their categories"""
+    query = {"category": category} if category else {}
+    entries = await blocklist_collection.find(query).sort([("host", 1), ("path", 1)]).to_list(None)
+    
+    counts = {}
+    for cat in blocklist_cache["categories"].values():
+        counts[cat] = counts.get(cat, 0) + 1
+    
+    return {"entries": serialize_doc(entries), "categories": counts}
+
+@app.get("/api/blocking/custom")
+async def get_custom_blocklist(current_user: dict = Depends(get_current_user)):
+    """Get the user's own additions to and removals from the blocklist"""
+    return {
+        "additions": current_user.get("blocklist_additions", []),
+        "removals": current_user.get("blocklist_removals", []),
+        "removals_active": overlay_removals_active(current_user),
+        "version": current_user.get("blocklist_overlay_version", 0)
+    }
+
+@app.put("/api/blocking/custom")
+async def update_custom_blocklist(
+    update: BlocklistOverlayUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Add personal triggers to the blocklist, or drop entries while unlocked"""
+    if update.remove_domains and current_user.get("recovery_mode_enabled", False):
+        raise HTTPException(
+            status_code=403,
+            detail="Cannot remove blocked domains while Recovery Mode is enabled"
+        )
+    
+    additions = list(current_user.get("blocklist_additions", []))
+    removals = list(current_user.get("blocklist_removals", []))
+    global_rules = blocklist_cache["categories"]
+    
+    # Same syntax as the global list, so overlay entries and global rules compare equal
+    for entry in update.add_domains:
+        parsed = parse_blocklist_entry(entry)
+        if parsed is None or len(parsed[0]) > 253:
+            raise HTTPException(status_code=400, detail=f"Invalid domain: {entry}")
+        domain = parsed[0] + parsed[1]
+        if domain in removals:
+            removals.remove(domain)
+        if domain not in additions and domain not in global_rules:
+            additions.append(domain)
+    
+    for entry in update.remove_domains:
+        parsed = parse_blocklist_entry(entry)
+        if parsed is None:
+            continue
+        domain = parsed[0] + parsed[1]
+        if domain in additions:
+            additions.remove(domain)
+        elif domain in global_rules and domain not in removals:
+            removals.append(domain)
+    
+    if len(additions) > MAX_CUSTOM_BLOCKED_DOMAINS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Custom blocklist is limited to {MAX_CUSTOM_BLOCKED_DOMAINS} domains"
+        )
+    
+    result = await users_collection.find_one_and_update(
+        {"_id": ObjectId(current_user["_id"])},
+        {
+            "$set": {"blocklist_additions": additions, "blocklist_removals": removals},
+            "$inc": {"blocklist_overlay_version": 1}
+        },
+        projection={"blocklist_overlay_version": 1},
+        return_document=True
+    )
+    
+    await refresh_dns_lock_state(current_user["_id"])
+    
+    return {
+        "additions": additions,
+        "removals": removals,
+        "version": result["blocklist_overlay_version"]
+    }
+
+@app.get("/api/blocking/check")
+async def check_blocked_url(url: str, current_user: dict = Depends(get_current_user)):
+    """Check a single URL against the user's effective blocklist"""
+    matched = get_user_matcher(current_user).match(url)
+    return {"url": url, "blocked": matched is not None, "matched": matched}
+
+@app.post("/api/blocking/check")
+async def check_blocked_urls(
+    request: BlockCheckRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Check a batch of URLs against the user's effective blocklist in one call"""
+    matcher = get_user_matcher(current_user)
+    results = []
+    blocked_count = 0
+    for url in request.urls:
+        matched = matcher.match(url)
+        if matched:
+            blocked_count += 1
+        results.append({"url": url, "blocked": matched is not None, "matched": matched})
+    
+    return {"results": results, "blocked_count": blocked_count}
+
+# ============= BLOCKLIST EXPORTS =============
+
+# Device-level formats; only plain hostnames can be expressed in all of them
+BLOCKLIST_EXPORT_FORMATS = {
+    "hosts": "text/plain; charset=utf-8",
+    "dnsmasq": "text/plain; charset=utf-8",
+    "adguard": "text/plain; charset=utf-8",
+    "bloom": "application/octet-stream",
+}
+BLOOM_FALSE_POSITIVE_RATE = 0.001
+
+# Rendered exports for the current list version: {fmt: {"key", "etag", "identity", "gzip", "br"}}
+blocklist_exports = {}
+blocklist_export_locks = {}
+
+def export_hosts() -> List[str]:
+    hosts = {normalize_domain(d) for d in blocklist_cache["domains"]}
+    return sorted(h for h in hosts if VALID_HOSTNAME.match(h))
+
+def build_bloom_filter(hosts: List[str]) -> bytes:
+    """Bloom filter over hostnames.
+
+    Layout: b"LKBF", u32 version, u32 bit count m, u8 hash count k, bit array.
+    Bit i of hash j is (h1 + j * h2) % m, where h1/h2 are the first two
+    little-endian u64 words of sha256(host).
+    """
+    n = max(len(hosts), 1)
+    m = max(8, int(math.ceil(-n * math.log(BLOOM_FALSE_POSITIVE_RATE) / (math.log(2) ** 2))))
+    k = max(1, round(m / n * math.log(2)))
+    bits = bytearray((m + 7) // 8)
+    for host in hosts:
+        h1, h2 = struct.unpack_from("<QQ", hashlib.sha256(host.encode()).digest())
+        for j in range(k):
+            index = (h1 + j * h2) % m
+            bits[index >> 3] |= 1 << (index & 7)
+    return b"LKBF" + struct.pack("<IIB", blocklist_cache["version"], m, k) + bytes(bits)
+
+def render_blocklist_export(fmt: str) -> bytes:
+    hosts = export_hosts()
+    if fmt == "bloom":
+        return build_bloom_filter(hosts)
+    
+    header = [
+        "# LockedIn gambling blocklist",
+        f"# Version: {blocklist_cache['version']}",
+        f"# Hash: {blocklist_cache['hash']}",
+        f"# Entries: {len(hosts)}",
+    ]
+    if fmt == "hosts":
+        lines = [f"0.0.0.0 {h}\n0.0.0.0 www.{h}" for h in hosts]
+    elif fmt == "dnsmasq":
+        lines = [f"address=/{h}/0.0.0.0\naddress=/{h}/::" for h in hosts]
+    else:
+        header = ["! Title: LockedIn gambling blocklist"] + ["!" + line[1:] for line in header[1:]]
+        lines = [f"||{h}^" for h in hosts]
+    return ("\n".join(header + lines) + "\n").encode()
+
+def build_blocklist_export(fmt: str, key: str) -> dict:
+    """Render and compress one export, reusing the on-disk copy when present"""
+    paths = {enc: BLOCKLIST_EXPORT_DIR / f"{fmt}-{key}.{enc}" for enc in ("identity", "gzip", "br")}
+    export = {"key": key, "etag": f"{fmt}-{key}"}
+    
+    if all(path.exists() for path in paths.values()):
+        for enc, path in paths.items():
+            export[enc] = path.read_bytes()
+        return export
+    
+    body = render_blocklist_export(fmt)
+    export["identity"] = body
+    export["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+    export["br"] = brotli.compress(body, quality=11)
+    
+    try:
+        BLOCKLIST_EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+        for old in BLOCKLIST_EXPORT_DIR.glob(f"{fmt}-*"):
+            old.unlink()
+        for enc, path in paths.items():
+            tmp = path.with_suffix(path.suffix + ".tmp")
+            tmp.write_bytes(export[enc])
+            os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not persist blocklist export {fmt}: {e}")
+    return export
+
+async def get_blocklist_export(fmt: str) -> dict:
+    key = f"{blocklist_cache['version']}-{blocklist_cache['hash'][:16]}"
+    export = blocklist_exports.get(fmt)
+    if export and export["key"] == key:
+        return export
+    
+    lock = blocklist_export_locks.setdefault(fmt, asyncio.Lock())
+    async with lock:
+        export = blocklist_exports.get(fmt)
+        if not export or export["key"] != key:
+            export = await asyncio.to_thread(build_blocklist_export, fmt, key)
+            blocklist_exports[fmt] = export
+    return export
+
+def preferred_encoding(accept: str, available=("br", "gzip")) -> str:
+    """Best of the available content-codings by Accept-Encoding q-value; q=0 refuses one"""
+    weights = {}
+    for part in accept.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    
+    best, best_weight = "identity", 0.0
+    for coding in available:  # earlier codings win ties
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+@app.get("/api/blocking/export/{fmt}")
+async def export_blocklist(fmt: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """Blocklist for device-level blocking: hosts, dnsmasq, adguard or bloom"""
+    if fmt not in BLOCKLIST_EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown format. Must be one of: {', '.join(BLOCKLIST_EXPORT_FORMATS)}"
+        )
+    
+    export = await get_blocklist_export(fmt)
+    
+    encoding = preferred_encoding(request.headers.get("accept-encoding", ""))
+    
+    # Strong validators differ per content-coding
+    etag = f'"{export["etag"]}-{encoding}"'
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "private, max-age=300"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(
+        content=export[encoding],
+        media_type=BLOCKLIST_EXPORT_FORMATS[fmt],
+        headers=headers
     )
+
+# ============= BLOCKLIST TELEMETRY =============
+
+TELEMETRY_FLUSH_SECONDS = 10
+BLOCKLIST_HITS_RETENTION_DAYS = 90
+USER_BLOCKED_ATTEMPTS_RETENTION_DAYS = 35
+
+class HyperLogLog:
+    """Fixed-size distinct-count sketch; registers merge with element-wise max"""
+    
+    P = 8
+    M = 1 << P
+    ALPHA = 0.7213 / (1 + 1.079 / M)
+    
+    def __init__(self):
+        self.registers = bytearray(self.M)
+    
+    def add(self, value: str):
+        x = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        index = x >> (64 - self.P)
+        rest = x & ((1 << (64 - self.P)) - 1)
+        rank = (64 - self.P) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def nonzero(self) -> dict:
+        return {str(i): r for i, r in enumerate(self.registers) if r}
+    
+    @classmethod
+    def estimate(cls, registers: dict) -> int:
+        """Distinct count from a sparse {index: rank} register map"""
+        total = cls.M - len(registers) + sum(2.0 ** -r for r in registers.values())
+        raw = cls.ALPHA * cls.M * cls.M / total
+        zeros = cls.M - len(registers)
+        if raw <= 2.5 * cls.M and zeros:
+            return round(cls.M * math.log(cls.M / zeros))
+        return round(raw)
+
+# Unflushed counters: {(minute, category): {"count", "hll"}} and {(user_id, day): count}
+blocked_hit_buckets = {}
+user_blocked_counts = {}
+
+def record_blocked_attempt(user_id: str, rule: str, category: Optional[str] = None):
+    """Count a blocked attempt in memory; O(1), no database access"""
+    now = datetime.utcnow()
+    minute = now.replace(second=0, microsecond=0)
+    category = category or blocklist_cache["categories"].get(rule, "custom")
+    
+    bucket = blocked_hit_buckets.get((minute, category))
+    if bucket is None:
+        bucket = blocked_hit_buckets[(minute, category)] = {"count": 0, "hll": HyperLogLog()}
+    bucket["count"] += 1
+    bucket["hll"].add(user_id)
+    
+    day_key = (user_id, minute.replace(hour=0, minute=0))
+    user_blocked_counts[day_key] = user_blocked_counts.get(day_key, 0) + 1
+
+async def flush_blocked_attempts():
+    """Write accumulated counters with one bulk_write per collection"""
+    global blocked_hit_buckets, user_blocked_counts
+    buckets, blocked_hit_buckets = blocked_hit_buckets, {}
+    user_counts, user_blocked_counts = user_blocked_counts, {}
+    
+    if buckets:
+        ops = []
+        for (minute, category), bucket in buckets.items():
+            update = {"$inc": {"count": bucket["count"]}}
+            registers = bucket["hll"].nonzero()
+            if registers:
+                update["$max"] = {f"hll.{i}": r for i, r in registers.items()}
+            ops.append(UpdateOne({"minute": minute, "category": category}, update, upsert=True))
+        try:
+            await blocklist_hits_collection.bulk_write(ops, ordered=False)
+        except Exception as e:
+            logger.error(f"Blocked attempt flush failed: {e}")
+            for key, bucket in buckets.items():
+                current = blocked_hit_buckets.setdefault(key, {"count": 0, "hll": HyperLogLog()})
+                current["count"] += bucket["count"]
+                current["hll"].registers = bytearray(
+                    max(a, b) for a, b in zip(current["hll"].registers, bucket["hll"].registers)
+                )
     
+    if user_counts:
+        ops = [
+            UpdateOne({"user_id": user_id, "day": day}, {"$inc": {"count": count}}, upsert=True)
+            for (user_id, day), count in user_counts.items()
+        ]
+        try:
+            await user_blocked_attempts_collection.bulk_write(ops, ordered=False)
+        except Exception as e:
+            logger.error(f"User blocked attempt flush failed: {e}")
+            for key, count in user_counts.items():
+                user_blocked_counts[key] = user_blocked_counts.get(key, 0) + count
+
+async def blocked_attempts_flush_loop():
+    while True:
+        await asyncio.sleep(TELEMETRY_FLUSH_SECONDS)
+        await flush_blocked_attempts()
+
+async def get_weekly_blocked_attempts(user_id: str) -> int:
+    """Blocked attempts over the last 7 days, including unflushed ones"""
+    since = (datetime.utcnow() - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
+    days = await user_blocked_attempts_collection.find(
+        {"user_id": user_id, "day": {"$gte": since}},
+        {"count": 1}
+    ).to_list(None)
+    pending = sum(count for (uid, day), count in user_blocked_counts.items() if uid == user_id and day >= since)
+    return sum(d["count"] for d in days) + pending
+
+@app.on_event("startup")
+async def startup_blocklist_telemetry():
+    await blocklist_hits_collection.create_index([("minute", 1), ("category", 1)], unique=True)
+    await blocklist_hits_collection.create_index(
+        "minute", expireAfterSeconds=BLOCKLIST_HITS_RETENTION_DAYS * 86400
+    )
+    await user_blocked_attempts_collection.create_index([("user_id", 1), ("day", 1)], unique=True)
+    await user_blocked_attempts_collection.create_index(
+        "day", expireAfterSeconds=USER_BLOCKED_ATTEMPTS_RETENTION_DAYS * 86400
+    )
+    start_background_task(blocked_attempts_flush_loop())
+
+@app.on_event("shutdown")
+async def shutdown_blocklist_telemetry():
+    await flush_blocked_attempts()
+
+@app.post("/api/blocking/report")
+async def report_blocked_attempts(
+    report: BlockedAttemptReport,
+    current_user: dict = Depends(get_current_user)
+):
+    """Report blocked attempts caught on the device
+
+    Lookups through /check are not attempts; only these reports (and the DNS
+    sinkhole's own blocks) are counted. A matched rule's category always wins,
+    and a client-sent category is kept only if the blocklist uses it.
+    """
+    matcher = get_user_matcher(current_user)
+    for event in report.events:
+        rule = matcher.match(event.url)
+        if rule is not None:
+            record_blocked_attempt(current_user["_id"], rule)
+            continue
+        category = (event.category or "").strip().lower()
+        if category not in blocklist_cache["category_names"]:
+            category = "uncategorized"
+        record_blocked_attempt(current_user["_id"], url_host_and_path(event.url)[0], category)
+    return {"accepted": len(report.events)}
+
+@app.get("/api/admin/blocking/trends")
+async def get_blocking_trends(
+    days: int = 7,
+    bucket: str = "day",
+    current_user: dict = Depends(get_current_admin)
+):
+    """Admin: blocked attempts and distinct users per category over time"""
+    if bucket not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="bucket must be 'hour' or 'day'")
+    days = max(1, min(days, 30))
+    since = datetime.utcnow() - timedelta(days=days)
+    
+    await flush_blocked_attempts()
+    
+    series = {}
+    async for doc in blocklist_hits_collection.find({"minute": {"$gte": since}}):
+        minute = doc["minute"]
+        start = minute.replace(minute=0) if bucket == "hour" else minute.replace(hour=0, minute=0)
+        point = series.setdefault((doc["category"], start), {"count": 0, "hll": {}})
+        point["count"] += doc["count"]
+        for i, r in doc.get("hll", {}).items():
+            if r > point["hll"].get(i, 0):
+                point["hll"][i] = r
+    
+    categories = {}
+    for (category, start), point in sorted(series.items(), key=lambda item: item[0][1]):
+        categories.setdefault(category, []).append({
+            "start": start.isoformat(),
+            "attempts": point["count"],
+            "distinct_users": HyperLogLog.estimate(point["hll"])
+        })
+    
+    return {"bucket": bucket, "days": days, "categories": categories}
+
+def as_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+
+def vpn_status_payload(user: dict) -> dict:
+    """VPN/Recovery Mode status of a user document, including cooldown info"""
     recovery_mode_enabled = user.get("recovery_mode_enabled", False)
     lock_duration = user.get("lock_duration")
     lock_started_at = user.get("lock_started_at")
-    lock_expires_at = user.get("lock_expires_at")
+    lock_expires_at = as_datetime(user.get("lock_expires_at"))
     
     unlock_requested = user.get("unlock_requested", False)
     unlock_requested_at = user.get("unlock_requested_at")
@@ -762,26 +1912,31 @@ async def get_vpn_status(current_user: dict = Depends(get_current_user)):
     
     unlock_approved = user.get("unlock_approved", False)
     unlock_approved_at = user.get("unlock_approved_at")
-    unlock_effective_at = user.get("unlock_effective_at")
+    unlock_effective_at = as_datetime(user.get("unlock_effective_at"))
+    
+    now = datetime.utcnow()
     
     # Calculate cooldown remaining
     cooldown_remaining_seconds = None
     can_disable = False
     
     if unlock_approved and unlock_effective_at:
-        now = datetime.utcnow()
-        effective_time = unlock_effective_at if isinstance(unlock_effective_at, datetime) else datetime.fromisoformat(unlock_effective_at.replace('Z', '+00:00'))
-        
-        if now >= effective_time:
+        if now >= unlock_effective_at:
             # Cooldown expired - can disable
             can_disable = True
             cooldown_remaining_seconds = 0
         else:
             # Still in cooldown
-            remaining = effective_time - now
+            remaining = unlock_effective_at - now
             cooldown_remaining_seconds = int(remaining.total_seconds())
-            can_disable = False
-    elif not recovery_mode_enabled:
+    
+    # A timed lock that ran out no longer needs admin approval
+    lock_expired = bool(recovery_mode_enabled and lock_expires_at and now >= lock_expires_at)
+    if lock_expired or user.get("can_disable"):
+        # Set by the deadline scheduler once a deadline has passed
+        can_disable = True
+    
+    if not recovery_mode_enabled:
         # VPN not enabled, can enable anytime
         can_disable = False
     
@@ -790,21 +1945,39 @@ async def get_vpn_status(current_user: dict = Depends(get_current_user)):
         "lock_duration": lock_duration,
         "lock_started_at": lock_started_at.isoformat() if lock_started_at else None,
         "lock_expires_at": lock_expires_at.isoformat() if lock_expires_at else None,
+        "lock_expired": lock_expired,
         "unlock_requested": unlock_requested,
         "unlock_requested_at": unlock_requested_at.isoformat() if unlock_requested_at else None,
         "unlock_request_reason": unlock_request_reason,
         "unlock_approved": unlock_approved,
         "unlock_approved_at": unlock_approved_at.isoformat() if unlock_approved_at else None,
         "unlock_effective_at": unlock_effective_at.isoformat() if unlock_effective_at else None,
+        "unlock_denied_reason": user.get("unlock_denied_reason"),
         "cooldown_remaining_seconds": cooldown_remaining_seconds,
         "can_disable": can_disable
     }
 
+def user_room(user_id: str) -> str:
+    """Socket room holding every connection of one user"""
+    return f"user_{user_id}"
+
+async def publish_vpn_status(user_id: str, before: dict, after: dict):
+    """Push the status fields a transition changed to the user's sockets"""
+    old = vpn_status_payload(before)
+    delta = {k: v for k, v in vpn_status_payload(after).items() if old.get(k) != v}
+    if delta:
+        await sio.emit("vpn_status", delta, room=user_room(user_id))
+
+@app.get("/api/vpn/status")
+async def get_vpn_status(current_user: dict = Depends(get_current_user)):
+    """Get comprehensive VPN/Recovery Mode status including cooldown info"""
+    return vpn_status_payload(current_user)
+
 # Keep old endpoint for backward compatibility
 @app.get("/api/blocking/status")
 async def get_blocking_status(current_user: dict = Depends(get_current_user)):
     """Legacy endpoint - redirects to VPN status"""
-    vpn_status = await get_vpn_status(current_user)
+    vpn_status = vpn_status_payload(current_user)
     return {
         "blocking_enabled": vpn_status["recovery_mode_enabled"],
         "is_blocked": current_user.get("is_blocked", False),
@@ -827,7 +2000,7 @@ async def enable_vpn(
     now = datetime.utcnow()
     lock_expires_at = calculate_lock_expiry(request.lock_duration, now)
     
-    await users_collection.update_one(
+    user = await users_collection.find_one_and_update(
         {"_id": ObjectId(current_user["_id"])},
         {
             "$set": {
@@ -842,11 +2015,18 @@ async def enable_vpn(
                 "unlock_request_reason": None,
                 "unlock_approved": False,
                 "unlock_approved_at": None,
-                "unlock_effective_at": None
+                "unlock_effective_at": None,
+                "can_disable": False
             }
-        }
+        },
+        return_document=ReturnDocument.AFTER
     )
     
+    await refresh_dns_lock_state(current_user["_id"])
+    await publish_vpn_status(current_user["_id"], current_user, user)
+    if lock_expires_at:
+        schedule_vpn_deadline(lock_expires_at, current_user["_id"], "lock_expires_at")
+    
     return {
         "message": "Recovery Mode enabled",
         "lock_duration": request.lock_duration,
@@ -867,17 +2047,20 @@ async def enable_blocking_legacy(
         return await enable_vpn(request, current_user)
     else:
         # Check if user can disable
-        vpn_status = await get_vpn_status(current_user)
+        vpn_status = vpn_status_payload(current_user)
         if vpn_status["recovery_mode_enabled"] and not vpn_status["can_disable"]:
             raise HTTPException(
                 status_code=403,
                 detail="Cannot disable Recovery Mode. Request unlock and wait for cooldown."
             )
         
-        await users_collection.update_one(
+        user = await users_collection.find_one_and_update(
             {"_id": ObjectId(current_user["_id"])},
-            {"$set": {"blocking_enabled": False, "recovery_mode_enabled": False}}
+            {"$set": {"blocking_enabled": False, "recovery_mode_enabled": False}},
+            return_document=ReturnDocument.AFTER
         )
+        await refresh_dns_lock_state(current_user["_id"])
+        await publish_vpn_status(current_user["_id"], current_user, user)
         return {"blocking_enabled": False}
 
 @app.post("/api/vpn/request-unlock")
@@ -886,7 +2069,7 @@ async def request_vpn_unlock(
     current_user: dict = Depends(get_current_user)
 ):
     """Request to unlock/disable Recovery Mode - requires admin approval"""
-    user = await users_collection.find_one({"_id": ObjectId(current_user["_id"])})
+    user = current_user
     
     if not user.get("recovery_mode_enabled", False):
         raise HTTPException(
@@ -902,7 +2085,7 @@ async def request_vpn_unlock(
     
     now = datetime.utcnow()
     
-    await users_collection.update_one(
+    updated = await users_collection.find_one_and_update(
         {"_id": ObjectId(current_user["_id"])},
         {
             "$set": {
@@ -910,8 +2093,10 @@ async def request_vpn_unlock(
                 "unlock_requested_at": now,
                 "unlock_request_reason": request.reason
             }
-        }
+        },
+        return_document=ReturnDocument.AFTER
     )
+    await publish_vpn_status(current_user["_id"], user, updated)
     
     return {
         "message": "Unlock request submitted. Awaiting admin approval.",
@@ -921,7 +2106,7 @@ async def request_vpn_unlock(
 @app.post("/api/vpn/disable")
 async def disable_vpn(current_user: dict = Depends(get_current_user)):
     """Disable Recovery Mode - only works if cooldown has expired"""
-    user = await users_collection.find_one({"_id": ObjectId(current_user["_id"])})
+    user = current_user
     
     if not user.get("recovery_mode_enabled", False):
         raise HTTPException(
@@ -932,16 +2117,17 @@ async def disable_vpn(current_user: dict = Depends(get_current_user)):
     # Check if unlock is approved and cooldown expired
     unlock_approved = user.get("unlock_approved", False)
     unlock_effective_at = user.get("unlock_effective_at")
+    lock_expired = vpn_status_payload(user)["lock_expired"]
     
-    if not unlock_approved:
+    if not unlock_approved and not lock_expired:
         raise HTTPException(
             status_code=403,
             detail="Unlock not approved. Request unlock first."
         )
     
-    if unlock_effective_at:
+    if unlock_effective_at and not lock_expired:
         now = datetime.utcnow()
-        effective_time = unlock_effective_at if isinstance(unlock_effective_at, datetime) else datetime.fromisoformat(str(unlock_effective_at).replace('Z', '+00:00'))
+        effective_time = as_datetime(unlock_effective_at)
         
         if now < effective_time:
             remaining = effective_time - now
@@ -953,7 +2139,7 @@ async def disable_vpn(current_user: dict = Depends(get_current_user)):
             )
     
     # Cooldown expired - disable VPN
-    await users_collection.update_one(
+    updated = await users_collection.find_one_and_update(
         {"_id": ObjectId(current_user["_id"])},
         {
             "$set": {
@@ -967,10 +2153,14 @@ async def disable_vpn(current_user: dict = Depends(get_current_user)):
                 "unlock_request_reason": None,
                 "unlock_approved": False,
                 "unlock_approved_at": None,
-                "unlock_effective_at": None
+                "unlock_effective_at": None,
+                "can_disable": False
             }
-        }
+        },
+        return_document=ReturnDocument.AFTER
     )
+    await refresh_dns_lock_state(current_user["_id"])
+    await publish_vpn_status(current_user["_id"], user, updated)
     
     return {"message": "Recovery Mode disabled"}
 
@@ -994,17 +2184,21 @@ async def admin_approve_unlock(
     now = datetime.utcnow()
     unlock_effective_at = now + timedelta(hours=VPN_COOLDOWN_HOURS)
     
-    await users_collection.update_one(
+    updated = await users_collection.find_one_and_update(
         {"_id": ObjectId(user_id)},
         {
             "$set": {
                 "unlock_approved": True,
                 "unlock_approved_at": now,
                 "unlock_effective_at": unlock_effective_at,
-                "unlock_approved_by": current_user["_id"]
+                "unlock_approved_by": current_user["_id"],
+                "can_disable": False
             }
-        }
+        },
+        return_document=ReturnDocument.AFTER
     )
+    await publish_vpn_status(user_id, user, updated)
+    schedule_vpn_deadline(unlock_effective_at, user_id, "unlock_effective_at")
     
     return {
         "message": f"Unlock approved. Cooldown: {VPN_COOLDOWN_HOURS} hours.",
@@ -1025,7 +2219,7 @@ async def admin_deny_unlock(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    await users_collection.update_one(
+    updated = await users_collection.find_one_and_update(
         {"_id": ObjectId(user_id)},
         {
             "$set": {
@@ -1034,8 +2228,10 @@ async def admin_deny_unlock(
                 "unlock_request_reason": None,
                 "unlock_denied_reason": reason
             }
-        }
+        },
+        return_document=ReturnDocument.AFTER
     )
+    await publish_vpn_status(user_id, user, updated)
     
     return {
         "message": "Unlock request denied",
@@ -1043,19 +2239,404 @@ async def admin_deny_unlock(
         "reason": reason
     }
 
+UNLOCK_REQUEST_PROJECTION = {
+    "name": 1, "email": 1, "lock_duration": 1, "lock_started_at": 1, "lock_expires_at": 1,
+    "unlock_requested_at": 1, "unlock_request_reason": 1,
+    "unlock_approved": 1, "unlock_effective_at": 1
+}
+
+def unlock_request_cursor(user: dict) -> str:
+    return f"{user['unlock_requested_at'].isoformat()}_{user['_id']}"
+
 @app.get("/api/admin/unlock-requests")
-async def get_unlock_requests(current_user: dict = Depends(get_current_admin)):
-    """Get all pending unlock requests"""
-    users = await users_collection.find(
-        {"unlock_requested": True},
-        {"password": 0, "gambling_history": 0}
-    ).to_list(100)
+async def get_unlock_requests(
+    limit: int = 50,
+    after: Optional[str] = None,
+    current_user: dict = Depends(get_current_admin)
+):
+    """Get pending unlock requests, oldest first; pass next_cursor as `after` for the next page"""
+    limit = max(1, min(limit, 500))
+    query = {"unlock_requested": True, "unlock_requested_at": {"$type": "date"}}
+    if after:
+        try:
+            requested_at, last_id = after.rsplit("_", 1)
+            requested_at = datetime.fromisoformat(requested_at)
+            last_id = ObjectId(last_id)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"unlock_requested_at": {"$gt": requested_at}},
+            {"unlock_requested_at": requested_at, "_id": {"$gt": last_id}}
+        ]
+    
+    users = await users_collection.find(query, UNLOCK_REQUEST_PROJECTION).sort(
+        [("unlock_requested_at", 1), ("_id", 1)]
+    ).limit(limit).to_list(limit)
     
     return {
         "requests": serialize_doc(users),
-        "count": len(users)
+        "count": len(users),
+        "next_cursor": unlock_request_cursor(users[-1]) if len(users) == limit else None
+    }
+
+@app.post("/api/admin/unlock-requests/bulk")
+async def bulk_decide_unlock_requests(
+    decision: UnlockDecisionBulk,
+    current_user: dict = Depends(get_current_admin)
+):
+    """Approve or deny many pending unlock requests in one bulk write"""
+    if decision.action not in ("approve", "deny"):
+        raise HTTPException(status_code=400, detail="Action must be approve or deny")
+    try:
+        object_ids = list({ObjectId(user_id) for user_id in decision.user_ids})
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid user id")
+    
+    # Only open requests; approving again would restart a running cooldown
+    guard = {"unlock_requested": True}
+    if decision.action == "approve":
+        guard["unlock_approved"] = {"$ne": True}
+    
+    pending = await users_collection.find(
+        {"_id": {"$in": object_ids}, **guard}
+    ).to_list(len(object_ids))
+    
+    now = datetime.utcnow()
+    unlock_effective_at = now + timedelta(hours=VPN_COOLDOWN_HOURS)
+    # Tags the rows this request changed, so only those are announced
+    decision_id = uuid.uuid4().hex
+    if decision.action == "approve":
+        changes = {
+            "unlock_approved": True,
+            "unlock_approved_at": now,
+            "unlock_effective_at": unlock_effective_at,
+            "unlock_approved_by": current_user["_id"],
+            "can_disable": False
+        }
+    else:
+        changes = {
+            "unlock_requested": False,
+            "unlock_requested_at": None,
+            "unlock_request_reason": None,
+            "unlock_denied_reason": decision.reason
+        }
+    changes["unlock_decision_id"] = decision_id
+    
+    changed = []
+    if pending:
+        # The guard skips users whose request was withdrawn or decided meanwhile
+        await users_collection.bulk_write([
+            UpdateOne({"_id": user["_id"], **guard}, {"$set": changes})
+            for user in pending
+        ], ordered=False)
+        changed = await users_collection.find(
+            {"_id": {"$in": [user["_id"] for user in pending]}, "unlock_decision_id": decision_id}
+        ).to_list(len(pending))
+    
+    before = {user["_id"]: user for user in pending}
+    for user in changed:
+        user_id = str(user["_id"])
+        await publish_vpn_status(user_id, before[user["_id"]], user)
+        if decision.action == "approve":
+            schedule_vpn_deadline(unlock_effective_at, user_id, "unlock_effective_at")
+    
+    return {
+        "action": decision.action,
+        "requested": len(object_ids),
+        "modified": len(changed),
+        "skipped": len(object_ids) - len(changed),
+        "effective_at": unlock_effective_at.isoformat() if decision.action == "approve" else None
+    }
+
+# ============= VPN DEADLINE SCHEDULER =============
+
+# Re-read upcoming deadlines so entries scheduled by other workers are picked up
+VPN_SCHEDULER_RELOAD_SECONDS = 300
+VPN_SCHEDULER_MAX_SLEEP_SECONDS = 60
+
+# Min-heap of (deadline, user_id, field) for lock expiry and cooldown ends
+vpn_deadlines = []
+vpn_deadline_keys = set()
+# Entries this worker already fired, so a reload racing the write never queues them again
+vpn_fired_deadlines = set()
+vpn_scheduler_wakeup = asyncio.Event()
+
+def schedule_vpn_deadline(deadline: datetime, user_id: str, field: str):
+    entry = (deadline, user_id, field)
+    if entry in vpn_deadline_keys or entry in vpn_fired_deadlines:
+        return
+    vpn_deadline_keys.add(entry)
+    heapq.heappush(vpn_deadlines, entry)
+    if vpn_deadlines[0] is entry:
+        vpn_scheduler_wakeup.set()
+
+async def load_vpn_deadlines():
+    """Queue every pending lock expiry and cooldown end from the indexed fields.
+
+    Deadlines already recorded (can_disable set) are left out, so past ones
+    are not fired again on every reload.
+    """
+    # Fired entries old enough that the write is visible to the queries below
+    settled = datetime.utcnow() - timedelta(seconds=VPN_SCHEDULER_RELOAD_SECONDS)
+    vpn_fired_deadlines.difference_update([e for e in vpn_fired_deadlines if e[0] < settled])
+    
+    async for user in users_collection.find(
+        {"recovery_mode_enabled": True, "lock_expires_at": {"$type": "date"}, "can_disable": {"$ne": True}},
+        {"lock_expires_at": 1}
+    ).sort("lock_expires_at", 1):
+        schedule_vpn_deadline(user["lock_expires_at"], str(user["_id"]), "lock_expires_at")
+    
+    async for user in users_collection.find(
+        {
+            "recovery_mode_enabled": True, "unlock_approved": True,
+            "unlock_effective_at": {"$type": "date"}, "can_disable": {"$ne": True}
+        },
+        {"unlock_effective_at": 1}
+    ).sort("unlock_effective_at", 1):
+        schedule_vpn_deadline(user["unlock_effective_at"], str(user["_id"]), "unlock_effective_at")
+
+async def fire_vpn_deadline(deadline: datetime, user_id: str, field: str):
+    """Record the transition and push the new status to the user's sockets"""
+    user = await users_collection.find_one_and_update(
+        {
+            "_id": ObjectId(user_id),
+            "recovery_mode_enabled": True,
+            field: deadline,
+            "can_disable": {"$ne": True}
+        },
+        {"$set": {"can_disable": True}},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not user:
+        return  # disabled, re-locked or handled by another worker
+    
+    # The payload already derives these from the clock, so send them outright
+    status = vpn_status_payload({**user, "can_disable": True})
+    await sio.emit(
+        "vpn_status",
+        {k: status[k] for k in ("lock_expired", "cooldown_remaining_seconds", "can_disable")},
+        room=user_room(user_id)
+    )
+    logger.info(f"VPN {field} reached for user {user_id}")
+
+async def vpn_scheduler_loop():
+    last_reload = datetime.utcnow()
+    while True:
+        now = datetime.utcnow()
+        if (now - last_reload).total_seconds() >= VPN_SCHEDULER_RELOAD_SECONDS:
+            last_reload = now
+            try:
+                await load_vpn_deadlines()
+            except Exception as e:
+                logger.error(f"VPN deadline reload failed: {e}")
+        
+        while vpn_deadlines and vpn_deadlines[0][0] <= now:
+            entry = heapq.heappop(vpn_deadlines)
+            vpn_deadline_keys.discard(entry)
+            vpn_fired_deadlines.add(entry)
+            try:
+                await fire_vpn_deadline(*entry)
+            except Exception as e:
+                logger.error(f"VPN deadline failed for user {entry[1]}: {e}")
+        
+        timeout = VPN_SCHEDULER_MAX_SLEEP_SECONDS
+        if vpn_deadlines:
+            timeout = min(timeout, max(0.0, (vpn_deadlines[0][0] - datetime.utcnow()).total_seconds()))
+        vpn_scheduler_wakeup.clear()
+        try:
+            await asyncio.wait_for(vpn_scheduler_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+@app.on_event("startup")
+async def startup_vpn_scheduler():
+    await users_collection.create_index(
+        "lock_expires_at",
+        partialFilterExpression={"recovery_mode_enabled": True, "lock_expires_at": {"$type": "date"}}
+    )
+    await users_collection.create_index(
+        "unlock_effective_at",
+        partialFilterExpression={"unlock_approved": True, "unlock_effective_at": {"$type": "date"}}
+    )
+    # Admin unlock-request queue
+    await users_collection.create_index(
+        [("unlock_requested_at", 1), ("_id", 1)],
+        partialFilterExpression={"unlock_requested": True, "unlock_requested_at": {"$type": "date"}}
+    )
+    await load_vpn_deadlines()
+    start_background_task(vpn_scheduler_loop())
+
+# ============= DNS SINKHOLE =============
+
+# Device source address -> user: {client_ip: user_id}
+dns_client_bindings = {}
+# Lock state and overlay of bound users, so queries never touch Mongo
+dns_lock_state = {}
+dns_sinkhole = {}
+
+DNS_LOCK_STATE_PROJECTION = {
+    "recovery_mode_enabled": 1,
+    "dns_client_ip": 1,
+    "blocklist_additions": 1,
+    "blocklist_removals": 1,
+    "blocklist_overlay_version": 1
+}
+
+def dns_policy(client_ip: str, qname: str) -> int:
+    """Per-query verdict: unknown devices are refused, locked users filtered"""
+    user_id = dns_client_bindings.get(client_ip)
+    if user_id is None:
+        return REFUSE
+    user = dns_lock_state.get(user_id)
+    if not user or not user.get("recovery_mode_enabled", False):
+        return FORWARD
+    matched = get_user_matcher(user).match_host(qname)
+    if matched is None:
+        return FORWARD
+    record_blocked_attempt(user_id, matched)
+    return BLOCK
+
+def cache_dns_lock_state(user: dict):
+    user["_id"] = str(user["_id"])
+    dns_lock_state[user["_id"]] = user
+    dns_client_bindings[user["dns_client_ip"]] = user["_id"]
+
+def serving_dns() -> bool:
+    """Whether this worker won the sinkhole election; only it keeps DNS lock state"""
+    return "lock_fd" in dns_sinkhole
+
+async def reload_dns_lock_state(user_id: str):
+    """Re-read a user's binding and lock state after it changed, possibly on another worker"""
+    for client_ip, bound_user in list(dns_client_bindings.items()):
+        if bound_user == user_id:
+            del dns_client_bindings[client_ip]
+    dns_lock_state.pop(user_id, None)
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, DNS_LOCK_STATE_PROJECTION)
+    if user and user.get("dns_client_ip"):
+        cache_dns_lock_state(user)
+
+async def reload_bound_dns_lock_state(user_id: str):
+    """Lock or overlay change: only users with a bound device need a reload"""
+    if user_id in dns_lock_state:
+        await reload_dns_lock_state(user_id)
+
+async def refresh_dns_lock_state(user_id: str):
+    """Reload the cached lock state of a user with a bound device in the
+    worker running the sinkhole"""
+    if serving_dns():
+        await reload_bound_dns_lock_state(user_id)
+    elif DNS_SINKHOLE_PORT and isinstance(sio.manager, RelayManager):
+        await sio.manager.publish_server_event("dns_lock_state", user_id)
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def request_client_ip(request: Request) -> str:
+    """Socket peer address, or the X-Forwarded-For client when the peer is a trusted proxy"""
+    peer = request.client.host if request.client else ""
+    if not is_trusted_proxy(peer):
+        return peer
+    # Walk back through the proxies we trust; the first other hop is the client
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+@app.post("/api/vpn/dns/register")
+async def register_dns_device(request: Request, current_user: dict = Depends(get_current_user)):
+    """Bind the caller's network address to their account for DNS filtering"""
+    client_ip = request_client_ip(request)
+    if not client_ip:
+        raise HTTPException(status_code=400, detail="Could not determine client address")
+    
+    user_id = current_user["_id"]
+    
+    # An address belongs to one account at a time, and never leaves one in
+    # recovery mode: another account must not switch off its filtering
+    await users_collection.update_many(
+        {"dns_client_ip": client_ip, "_id": {"$ne": ObjectId(user_id)}, "recovery_mode_enabled": {"$ne": True}},
+        {"$unset": {"dns_client_ip": ""}}
+    )
+    if await users_collection.find_one(
+        {"dns_client_ip": client_ip, "_id": {"$ne": ObjectId(user_id)}}, {"_id": 1}
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This address is bound to an account in recovery mode"
+        )
+    
+    await users_collection.update_one(
+        {"_id": ObjectId(user_id)},
+        {"$set": {"dns_client_ip": client_ip}}
+    )
+    
+    if serving_dns():
+        previous_ip = current_user.get("dns_client_ip")
+        if previous_ip and dns_client_bindings.get(previous_ip) == user_id:
+            del dns_client_bindings[previous_ip]
+        cache_dns_lock_state({
+            **{field: current_user.get(field) for field in DNS_LOCK_STATE_PROJECTION},
+            "_id": user_id,
+            "dns_client_ip": client_ip
+        })
+    elif DNS_SINKHOLE_PORT and isinstance(sio.manager, RelayManager):
+        await sio.manager.publish_server_event("dns_binding", user_id)
+    
+    return {
+        "client_ip": client_ip,
+        "resolver_port": DNS_SINKHOLE_PORT or None,
+        "filtering": current_user.get("recovery_mode_enabled", False)
     }
 
+@app.on_event("startup")
+async def startup_dns_sinkhole():
+    await users_collection.create_index("dns_client_ip", sparse=True)
+    if not DNS_SINKHOLE_PORT:
+        return
+    # With several workers only one can bind the port; the rest serve HTTP only
+    # and forward binding and lock changes to it
+    lock_fd = acquire_sinkhole_lock(DNS_SINKHOLE_LOCK)
+    if lock_fd is None:
+        logger.info("DNS sinkhole runs in another worker")
+        return
+    dns_sinkhole["lock_fd"] = lock_fd
+    
+    async for user in users_collection.find(
+        {"dns_client_ip": {"$exists": True}},
+        DNS_LOCK_STATE_PROJECTION
+    ):
+        cache_dns_lock_state(user)
+    if isinstance(sio.manager, RelayManager):
+        sio.manager.on_server_event("dns_binding", reload_dns_lock_state)
+        sio.manager.on_server_event("dns_lock_state", reload_bound_dns_lock_state)
+    
+    upstream = None
+    if DNS_UPSTREAM:
+        host, _, port = DNS_UPSTREAM.rpartition(":")
+        upstream = (host, int(port))
+    
+    transport, protocol = await start_dns_sinkhole(
+        dns_policy,
+        host=DNS_SINKHOLE_HOST,
+        port=DNS_SINKHOLE_PORT,
+        upstream=upstream,
+        sinkhole_ipv4=DNS_SINKHOLE_ADDRESS
+    )
+    dns_sinkhole["transport"] = transport
+    dns_sinkhole["protocol"] = protocol
+
+@app.on_event("shutdown")
+async def shutdown_dns_sinkhole():
+    if "transport" in dns_sinkhole:
+        stop_dns_sinkhole(dns_sinkhole.pop("transport"), dns_sinkhole.pop("protocol"))
+    if "lock_fd" in dns_sinkhole:
+        os.close(dns_sinkhole.pop("lock_fd"))
+
 # ============= PROFILE ENDPOINTS =============
 
 @app.get("/api/profile")
@@ -1158,6 +2739,7 @@ async def update_profile(
             {"_id": ObjectId(current_user["_id"])},
             {"$set": update_fields}
         )
+        await refresh_socket_profiles([current_user["_id"]])
     
     return {"message": "Profile updated", "updated_fields": list(update_fields.keys())}
 
@@ -1478,8 +3060,7 @@ async def send_community_chat(
         "created_at": datetime.utcnow()
     }
     
-    result = await chat_messages_collection.insert_one(msg_doc)
-    msg_doc["_id"] = str(result.inserted_id)
+    msg_doc["_id"] = str(await persist_message(chat_messages_collection, msg_doc))
     
     # Broadcast via socket
     await sio.emit("community_chat_message", serialize_doc(msg_doc))
@@ -1546,8 +3127,7 @@ async def send_chat_message(
         "created_at": datetime.utcnow()
     }
     
-    result = await chat_messages_collection.insert_one(msg_doc)
-    msg_doc["_id"] = str(result.inserted_id)
+    msg_doc["_id"] = str(await persist_message(chat_messages_collection, msg_doc))
     msg_doc["reactions"] = {}
     
     # Broadcast to all connected clients
@@ -1571,6 +3151,86 @@ async def delete_chat_message(
     
     return {"message": "Message deleted"}
 
+PURGE_BATCH_SIZE = 1000
+
+@app.post("/api/admin/chat/purge")
+async def purge_user_messages(
+    purge: MessagePurgeRequest,
+    current_user: dict = Depends(get_current_admin)
+):
+    """Admin: Delete a user's chat and room messages (and reactions) in a time range"""
+    user_oid = parse_object_id(purge.user_id, "Invalid user id")
+    time_range = {}
+    if purge.since:
+        time_range["$gte"] = purge.since
+    if purge.until:
+        time_range["$lt"] = purge.until
+    
+    # chat_messages stores user_id as a string, messages as an ObjectId
+    chat_query = {"user_id": purge.user_id}
+    room_query = {"user_id": user_oid}
+    if time_range:
+        chat_query["created_at"] = time_range
+        room_query["timestamp"] = time_range
+    
+    reaction_query = {"user_id": purge.user_id}
+    if time_range:
+        reaction_query["created_at"] = time_range
+    
+    # Buffered messages would otherwise be written after the purge and come back
+    if not await flush_messages():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Pending messages could not be written; try the purge again"
+        )
+    
+    # Delete in batches so no single $in, delete or event grows with the purge,
+    # and announce each deletion on the channel the message was sent on
+    chat_deleted = room_deleted = reactions_deleted = 0
+    while True:
+        batch = await chat_messages_collection.find(chat_query, {"_id": 1}).limit(PURGE_BATCH_SIZE).to_list(PURGE_BATCH_SIZE)
+        if not batch:
+            break
+        ids = [m["_id"] for m in batch]
+        chat_deleted += (await chat_messages_collection.delete_many({"_id": {"$in": ids}})).deleted_count
+        if purge.include_reactions:
+            reactions_deleted += (await reactions_collection.delete_many(
+                {"target_type": "chat", "target_id": {"$in": [str(i) for i in ids]}}
+            )).deleted_count
+        # new_chat_message goes to every client
+        await sio.emit("chat_message_deleted", {
+            "message_ids": [str(i) for i in ids],
+            "user_id": purge.user_id
+        })
+    
+    while True:
+        batch = await messages_collection.find(room_query, {"_id": 1, "room": 1}).limit(PURGE_BATCH_SIZE).to_list(PURGE_BATCH_SIZE)
+        if not batch:
+            break
+        deleted = (await messages_collection.delete_many({"_id": {"$in": [m["_id"] for m in batch]}})).deleted_count
+        room_deleted += deleted
+        await bump_admin_stats(total_messages=-deleted)
+        by_room = {}
+        for m in batch:
+            by_room.setdefault(m.get("room"), []).append(str(m["_id"]))
+        for room_id, ids in by_room.items():
+            # Legacy send_message rows went to "community", room messages to their room
+            legacy = room_id in (None, "community")
+            await sio.emit("chat_message_deleted", {
+                "message_ids": ids,
+                "user_id": purge.user_id,
+                "room_id": "community" if legacy else room_id
+            }, room="community" if legacy else f"room_{room_id}")
+    
+    if purge.include_reactions:
+        reactions_deleted += (await reactions_collection.delete_many(reaction_query)).deleted_count
+    
+    return {
+        "chat_messages_deleted": chat_deleted,
+        "room_messages_deleted": room_deleted,
+        "reactions_deleted": reactions_deleted
+    }
+
 # ============= FRIENDS SYSTEM =============
 
 @app.get("/api/friends")
@@ -1927,53 +3587,174 @@ async def get_suggested_connections(
 
 # ============= ADMIN ENDPOINTS =============
 
+# Fields never returned by admin listings or exports
+ADMIN_USER_PROJECTION = {"password": 0, "gambling_history": 0}
+USER_EXPORT_BATCH_SIZE = 1000
+USER_EXPORT_CSV_FIELDS = [
+    "_id", "username", "email", "role", "subscription_status", "is_blocked",
+    "recovery_mode_enabled", "created_at", "sobriety_start_date",
+    "current_streak_days", "longest_streak_days", "total_check_ins", "total_resets"
+]
+
 @app.get("/api/admin/users")
 async def get_all_users(
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
     current_user: dict = Depends(get_current_admin)
 ):
-    users = await users_collection.find(
-        {},
-        {"password": 0, "gambling_history": 0}
-    ).skip(skip).limit(limit).to_list(limit)
-    total_count = await users_collection.count_documents({})
+    """List users by _id; pass next_cursor as `after` instead of growing `skip`"""
+    limit = max(1, min(limit, 500))
+    if after:
+        cursor = users_collection.find(
+            {"_id": {"$gt": parse_object_id(after, "Invalid cursor")}}, ADMIN_USER_PROJECTION
+        )
+    else:
+        cursor = users_collection.find({}, ADMIN_USER_PROJECTION).skip(skip)
+    users = await cursor.sort("_id", 1).limit(limit).to_list(limit)
+    
+    # Maintained counter instead of a full count per page
+    stats = await settings_collection.find_one({"_id": ADMIN_STATS_ID}, {"total_users": 1}) or {}
     return {
         "users": serialize_doc(users),
-        "total": total_count,
+        "total": stats.get("total_users", 0),
         "skip": skip,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": str(users[-1]["_id"]) if len(users) == limit else None
     }
 
-@app.post("/api/admin/block-user/{user_id}")
-async def block_user(
-    user_id: str,
-    reason: str = "Admin blocked",
+async def iter_user_batches():
+    """Walk all users in _id order, one short query per batch"""
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id else {}
+        batch = await users_collection.find(query, ADMIN_USER_PROJECTION).sort(
+            "_id", 1
+        ).limit(USER_EXPORT_BATCH_SIZE).to_list(USER_EXPORT_BATCH_SIZE)
+        if not batch:
+            return
+        yield batch
+        if len(batch) < USER_EXPORT_BATCH_SIZE:
+            return
+        last_id = batch[-1]["_id"]
+
+async def export_users_ndjson():
+    async for batch in iter_user_batches():
+        yield "".join(json.dumps(serialize_doc(user), default=str) + "\n" for user in batch)
+
+async def export_users_csv():
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=USER_EXPORT_CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    async for batch in iter_user_batches():
+        writer.writerows(serialize_doc(batch))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.get("/api/admin/users/export")
+async def export_users(
+    format: str = "ndjson",
+    current_user: dict = Depends(get_current_admin)
+):
+    """Stream every user as NDJSON or CSV"""
+    if format == "ndjson":
+        body, media_type = export_users_ndjson(), "application/x-ndjson"
+    elif format == "csv":
+        body, media_type = export_users_csv(), "text/csv"
+    else:
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    
+    filename = f"users-{datetime.utcnow().strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/api/admin/block-user/{user_id}")
+async def block_user(
+    user_id: str,
+    reason: str = "Admin blocked",
+    current_user: dict = Depends(get_current_admin)
+):
+    user = await users_collection.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {
+            "$set": {
+                "is_blocked": True,
+                "blocked_reason": reason,
+                "blocked_by_admin": ObjectId(current_user["_id"])
+            }
+        },
+        projection={"is_blocked": 1}
+    )
+    
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not user.get("is_blocked"):
+        await bump_admin_stats(blocked_users=1)
+        await refresh_socket_profiles([user_id])
+    
+    return {"message": f"User {user_id} has been blocked"}
+
+@app.post("/api/admin/unblock-user/{user_id}")
+async def unblock_user(
+    user_id: str,
+    current_user: dict = Depends(get_current_admin)
+):
+    user = await users_collection.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {
+            "$set": {
+                "is_blocked": False,
+                "blocked_reason": None,
+                "blocked_by_admin": None
+            }
+        },
+        projection={"is_blocked": 1}
+    )
+    
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if user.get("is_blocked"):
+        await bump_admin_stats(blocked_users=-1)
+        await refresh_socket_profiles([user_id])
+    
+    return {"message": f"User {user_id} has been unblocked"}
+
+@app.post("/api/admin/users/bulk-block")
+async def bulk_block_users(
+    action: BulkUserAction,
     current_user: dict = Depends(get_current_admin)
 ):
-    result = await users_collection.update_one(
-        {"_id": ObjectId(user_id)},
+    object_ids = [parse_object_id(user_id, "Invalid user id") for user_id in action.user_ids]
+    result = await users_collection.update_many(
+        {"_id": {"$in": object_ids}, "is_blocked": {"$ne": True}},
         {
             "$set": {
                 "is_blocked": True,
-                "blocked_reason": reason,
+                "blocked_reason": action.reason,
                 "blocked_by_admin": ObjectId(current_user["_id"])
             }
         }
     )
+    if result.modified_count:
+        await bump_admin_stats(blocked_users=result.modified_count)
+        await refresh_socket_profiles(action.user_ids)
     
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    return {"message": f"User {user_id} has been blocked"}
+    return {"requested": len(object_ids), "blocked": result.modified_count}
 
-@app.post("/api/admin/unblock-user/{user_id}")
-async def unblock_user(
-    user_id: str,
+@app.post("/api/admin/users/bulk-unblock")
+async def bulk_unblock_users(
+    action: BulkUserAction,
     current_user: dict = Depends(get_current_admin)
 ):
-    result = await users_collection.update_one(
-        {"_id": ObjectId(user_id)},
+    object_ids = [parse_object_id(user_id, "Invalid user id") for user_id in action.user_ids]
+    result = await users_collection.update_many(
+        {"_id": {"$in": object_ids}, "is_blocked": True},
         {
             "$set": {
                 "is_blocked": False,
@@ -1982,24 +3763,123 @@ async def unblock_user(
             }
         }
     )
+    if result.modified_count:
+        await bump_admin_stats(blocked_users=-result.modified_count)
+        await refresh_socket_profiles(action.user_ids)
     
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
+    return {"requested": len(object_ids), "unblocked": result.modified_count}
+
+# ============= ADMIN STATS =============
+
+ADMIN_STATS_ID = "admin_stats"
+ADMIN_STATS_RECONCILE_SECONDS = 3600
+# How often each worker checks whether reconciliation is due
+ADMIN_STATS_CLAIM_POLL_SECONDS = 300
+# Recounts of a field bumped while it was being counted, before giving up until next time
+ADMIN_STATS_RECONCILE_ATTEMPTS = 3
+ADMIN_STATS_FIELDS = ("total_users", "active_subscriptions", "blocked_users", "total_messages")
+
+def admin_stats_queries() -> dict:
+    """{field: (collection, query)} that each maintained counter must equal"""
+    return {
+        "total_users": (users_collection, {}),
+        "active_subscriptions": (users_collection, {"subscription_status": "active"}),
+        "blocked_users": (users_collection, {"is_blocked": True}),
+        "total_messages": (messages_collection, {})
+    }
+
+async def bump_admin_stats(**deltas):
+    """Apply counter deltas from a write path; reconciliation repairs any drift"""
+    try:
+        await settings_collection.update_one(
+            {"_id": ADMIN_STATS_ID}, {"$inc": deltas}, upsert=True
+        )
+    except Exception as e:
+        logger.error(f"Admin stats update failed: {e}")
+
+async def reconcile_admin_stats() -> dict:
+    """Recount every statistic and correct the maintained counters.
+
+    Each correction is an $inc by the difference, applied only if the counter
+    still holds the value read before counting. A field bumped meanwhile is
+    recounted, so increments from write paths are never overwritten.
+    """
+    await settings_collection.update_one(
+        {"_id": ADMIN_STATS_ID}, {"$setOnInsert": {"reconciled_at": None}}, upsert=True
+    )
+    counts = {}
+    drift = {}
+    for field, (collection, query) in admin_stats_queries().items():
+        for _ in range(ADMIN_STATS_RECONCILE_ATTEMPTS):
+            stats = await settings_collection.find_one({"_id": ADMIN_STATS_ID}, {field: 1})
+            before = stats.get(field)
+            count = await collection.count_documents(query)
+            delta = count - (before or 0)
+            if not delta:
+                counts[field] = count
+                break
+            result = await settings_collection.update_one(
+                {"_id": ADMIN_STATS_ID, field: before},
+                {"$inc": {field: delta}}
+            )
+            if result.modified_count:
+                counts[field] = count
+                drift[field] = delta
+                break
+        else:
+            logger.warning(f"Admin stats {field} kept changing while counted; retrying next run")
     
-    return {"message": f"User {user_id} has been unblocked"}
+    await settings_collection.update_one(
+        {"_id": ADMIN_STATS_ID}, {"$set": {"reconciled_at": datetime.utcnow()}}
+    )
+    if drift:
+        logger.warning(f"Admin stats drift corrected: {drift}")
+    return counts
+
+async def claim_admin_stats_reconcile() -> bool:
+    """Elect one worker per interval: the one that moves reconcile_due forward runs it"""
+    now = datetime.utcnow()
+    result = await settings_collection.update_one(
+        {"_id": ADMIN_STATS_ID, "$or": [{"reconcile_due": {"$lte": now}}, {"reconcile_due": {"$exists": False}}]},
+        {"$set": {"reconcile_due": now + timedelta(seconds=ADMIN_STATS_RECONCILE_SECONDS)}}
+    )
+    return result.modified_count == 1
+
+async def admin_stats_reconcile_loop():
+    while True:
+        await asyncio.sleep(ADMIN_STATS_CLAIM_POLL_SECONDS)
+        try:
+            if await claim_admin_stats_reconcile():
+                await reconcile_admin_stats()
+        except Exception as e:
+            logger.error(f"Admin stats reconciliation failed: {e}")
+
+@app.on_event("startup")
+async def startup_admin_stats():
+    if not await settings_collection.find_one({"_id": ADMIN_STATS_ID}, {"_id": 1}):
+        await reconcile_admin_stats()
+    start_background_task(admin_stats_reconcile_loop())
 
 @app.get("/api/admin/stats")
-async def get_admin_stats(current_user: dict = Depends(get_current_admin)):
-    total_users = await users_collection.count_documents({})
-    active_subscriptions = await users_collection.count_documents({"subscription_status": "active"})
-    blocked_users = await users_collection.count_documents({"is_blocked": True})
-    total_messages = await messages_collection.count_documents({})
+async def get_admin_stats(
+    mode: str = "exact",
+    current_user: dict = Depends(get_current_admin)
+):
+    """Dashboard counters; mode=estimated reads collection totals from metadata"""
+    if mode not in ("exact", "estimated"):
+        raise HTTPException(status_code=400, detail="Mode must be exact or estimated")
+    
+    stats = await settings_collection.find_one({"_id": ADMIN_STATS_ID}) or {}
+    result = {field: max(0, stats.get(field, 0)) for field in ADMIN_STATS_FIELDS}
+    if mode == "estimated":
+        result["total_users"] = await users_collection.estimated_document_count()
+        result["total_messages"] = await messages_collection.estimated_document_count()
     
+    reconciled_at = stats.get("reconciled_at")
     return {
-        "total_users": total_users,
-        "active_subscriptions": active_subscriptions,
-        "blocked_users": blocked_users,
-        "total_messages": total_messages
+        **result,
+        "mode": mode,
+        "reconciled_at": reconciled_at.isoformat() if reconciled_at else None
     }
 
 # ============= SETTINGS ENDPOINTS =============
@@ -2046,6 +3926,14 @@ class ChessMoveRequest(BaseModel):
 class ChessResign(BaseModel):
     game_id: str
 
+# Abandonment: players offline longer than the grace period lose their active games
+CHESS_ABANDON_GRACE_SECONDS = int(os.getenv('CHESS_ABANDON_GRACE_SECONDS', '120'))
+CHESS_SWEEP_INTERVAL_SECONDS = 30
+# Queue entries (waiting or matched) are dropped by Mongo once they are this old
+CHESS_QUEUE_TTL_SECONDS = 600
+# Games with fewer moves than this are aborted rather than scored
+CHESS_ABORT_MAX_MOVES = 2
+
 # ELO calculation
 def calculate_elo_change(winner_rating: int, loser_rating: int, draw: bool = False) -> tuple:
     """Calculate ELO rating changes"""
@@ -2140,6 +4028,11 @@ async def create_chess_game(
             "from_username": current_user.get("username")
         })
         
+        await announce_live_game(game_doc["_id"], {
+            user_id: current_user.get("username"),
+            request.opponent_id: opponent.get("username")
+        }, white_id, black_id)
+        
         return {"game": serialize_doc(game_doc), "your_color": "white" if white_id == user_id else "black"}
     
     else:
@@ -2213,6 +4106,11 @@ async def create_chess_game(
                 "your_color": "white" if white_id == opponent_id else "black"
             })
             
+            await announce_live_game(game_id, {
+                user_id: current_user.get("username"),
+                opponent_id: potential_opponent.get("username")
+            }, white_id, black_id)
+            
             return {
                 "status": "matched",
                 "game": serialize_doc(game_doc),
@@ -2279,6 +4177,9 @@ async def get_chess_game(
         {"game_id": game_id}
     ).sort("created_at", 1).to_list(500)
     
+    if game["status"] == "active":
+        await touch_chess_player(game["_id"], user_id)
+    
     # Parse board for legal moves
     board = chess.Board(game["game_state"])
     legal_moves = [move.uci() for move in board.legal_moves]
@@ -2381,10 +4282,12 @@ async def make_chess_move(
     await chess_moves_collection.insert_one(move_doc)
     
     # Update game state
+    now = datetime.utcnow()
     update_data = {
         "game_state": board.fen(),
         "move_count": game["move_count"] + 1,
-        "last_move_at": datetime.utcnow()
+        "last_move_at": now,
+        f"players_seen_at.{user_id}": now
     }
     
     # Check for game end conditions
@@ -2442,6 +4345,19 @@ async def make_chess_move(
                 f"won by {game_result}"
             )
     
+    # Fan out to the game room (spectators) once, then to the opponent
+    move_uci = move.uci()
+    await publish_live_move(move_request.game_id, {
+        "game_id": move_request.game_id,
+        "move": move_uci,
+        "san": san,
+        "fen": board.fen(),
+        "move_number": game["move_count"] + 1,
+        "is_check": board.is_check(),
+        "game_result": game_result,
+        "winner_id": winner_id
+    })
+    
     # Notify opponent via socket
     opponent_id = game["player_black_id"] if is_white else game["player_white_id"]
     await sio.emit(f"chess_move_{opponent_id}", {
@@ -2597,6 +4513,7 @@ async def resign_chess_game(
         "game_id": resign.game_id,
         "resigned_by": user_id
     })
+    await publish_live_game_over(resign.game_id, "resignation", winner_id)
     
     return {"message": "You resigned", "winner_id": winner_id}
 
@@ -2759,6 +4676,338 @@ async def get_game_history(
     
     return {"games": enriched_games}
 
+# ============= CHESS ABANDONMENT =============
+
+# Players whose last socket went away: {user_id: offline_since}
+chess_offline_since = {}
+
+def mark_player_offline(user_id: str, since: Optional[datetime] = None):
+    """Start the abandonment grace period for a player"""
+    chess_offline_since.setdefault(user_id, since or datetime.utcnow())
+
+def mark_player_online(user_id: str):
+    """Cancel a pending abandonment when the player reconnects"""
+    chess_offline_since.pop(user_id, None)
+
+async def touch_chess_player(game_id: ObjectId, user_id: str):
+    """Record a player's REST activity in a game; the sweep counts it as presence"""
+    await chess_games_collection.update_one(
+        {"_id": game_id},
+        {"$set": {f"players_seen_at.{user_id}": datetime.utcnow()}}
+    )
+
+async def resolve_abandoned_game(game: dict, abandoned_ids: set):
+    """Abort or auto-resign a game whose player(s) never came back"""
+    game_id = str(game["_id"])
+    white_id = game["player_white_id"]
+    black_id = game["player_black_id"]
+    both_gone = white_id in abandoned_ids and black_id in abandoned_ids
+    
+    if both_gone or game.get("move_count", 0) < CHESS_ABORT_MAX_MOVES:
+        winner_id = None
+        update = {"status": "aborted", "result": "aborted"}
+    else:
+        winner_id = black_id if white_id in abandoned_ids else white_id
+        update = {"status": "completed", "result": "abandonment", "winner_id": winner_id}
+    update["completed_at"] = datetime.utcnow()
+    
+    # Only resolve if nobody finished the game in the meantime
+    result = await chess_games_collection.update_one(
+        {"_id": game["_id"], "status": "active"},
+        {"$set": update}
+    )
+    if result.modified_count == 0:
+        return
+    
+    if winner_id:
+        await update_chess_stats_after_game(white_id, black_id, winner_id, game["mode"])
+        await sio.emit(f"chess_resign_{winner_id}", {
+            "game_id": game_id,
+            "resigned_by": black_id if winner_id == white_id else white_id,
+            "reason": "abandonment"
+        })
+    else:
+        for player_id in (white_id, black_id):
+            if player_id not in abandoned_ids:
+                await sio.emit(f"chess_abort_{player_id}", {"game_id": game_id})
+    
+    await publish_live_game_over(game_id, update["result"], winner_id)
+    logger.info(f"Chess game {game_id} resolved as {update['result']}")
+
+async def sweep_abandoned_games():
+    """Resolve games and queue entries of players past the grace period"""
+    cutoff = datetime.utcnow() - timedelta(seconds=CHESS_ABANDON_GRACE_SECONDS)
+    abandoned_ids = {
+        user_id for user_id, since in chess_offline_since.items() if since <= cutoff
+    }
+    if not abandoned_ids:
+        return
+    
+    # The player may have reconnected to another worker
+    reconnected = await presence.online_users(abandoned_ids)
+    for user_id in reconnected:
+        chess_offline_since.pop(user_id, None)
+    abandoned_ids -= reconnected
+    if not abandoned_ids:
+        return
+    
+    abandoned_list = list(abandoned_ids)
+    games = await chess_games_collection.find({
+        "$or": [
+            {"player_white_id": {"$in": abandoned_list}},
+            {"player_black_id": {"$in": abandoned_list}}
+        ],
+        "status": "active"
+    }).to_list(None)
+    
+    # A player whose socket is down may still be playing over REST (moves,
+    # refreshes); the grace period then restarts from their last request
+    for game in games:
+        for user_id, seen_at in game.get("players_seen_at", {}).items():
+            if user_id in abandoned_ids and seen_at > cutoff:
+                chess_offline_since[user_id] = seen_at
+                abandoned_ids.discard(user_id)
+    abandoned_list = list(abandoned_ids)
+    
+    for game in games:
+        if game["player_white_id"] in abandoned_ids or game["player_black_id"] in abandoned_ids:
+            await resolve_abandoned_game(game, abandoned_ids)
+    
+    await chess_queue_collection.delete_many({
+        "user_id": {"$in": abandoned_list},
+        "status": "waiting"
+    })
+    
+    for user_id in abandoned_list:
+        chess_offline_since.pop(user_id, None)
+
+async def chess_abandonment_loop():
+    while True:
+        await asyncio.sleep(CHESS_SWEEP_INTERVAL_SECONDS)
+        try:
+            await sweep_abandoned_games()
+        except Exception as e:
+            logger.error(f"Chess abandonment sweep failed: {e}")
+
+@app.on_event("startup")
+async def startup_chess():
+    await chess_games_collection.create_index([("player_white_id", 1), ("status", 1)])
+    await chess_games_collection.create_index([("player_black_id", 1), ("status", 1)])
+    await chess_queue_collection.create_index([("user_id", 1), ("status", 1)])
+    await chess_moves_collection.create_index([("game_id", 1), ("move_number", 1)])
+    await chess_queue_collection.create_index(
+        "created_at", expireAfterSeconds=CHESS_QUEUE_TTL_SECONDS
+    )
+    
+    # Nobody is connected after a restart, so every active player starts offline
+    now = datetime.utcnow()
+    async for game in chess_games_collection.find(
+        {"status": "active"},
+        {"player_white_id": 1, "player_black_id": 1}
+    ):
+        mark_player_offline(game["player_white_id"], now)
+        mark_player_offline(game["player_black_id"], now)
+    
+    start_background_task(chess_abandonment_loop())
+
+# ============= CHESS SPECTATORS =============
+
+# Live board cache for active games, so spectators never hit chess_moves:
+# {game_id: {"fen", "moves": [uci], "white": {...}, "black": {...}, "status"}}
+# Moves and game ends are relayed to the other workers' caches as server events.
+live_boards = {}
+# Loads in progress: {game_id: {"lock", "waiters", "moves": [payload], "over"}}
+live_board_loads = {}
+# Spectators per worker, so any worker can report the total: {game_id: {node: count}}
+live_spectators = {}
+
+def chess_game_room(game_id: str) -> str:
+    return f"chess_game_{game_id}"
+
+def live_board_snapshot(game_id: str, board: dict) -> dict:
+    """Compact snapshot sent to a spectator joining mid-game"""
+    return {
+        "game_id": game_id,
+        "fen": board["fen"],
+        "moves": " ".join(board["moves"]),
+        "white": board["white"],
+        "black": board["black"],
+        "status": board["status"],
+        "spectators": sum(live_spectators.get(game_id, {}).values())
+    }
+
+async def load_live_board(game_id: str) -> Optional[dict]:
+    game = await chess_games_collection.find_one({"_id": ObjectId(game_id)})
+    if not game:
+        return None
+    
+    moves = await chess_moves_collection.find(
+        {"game_id": game_id},
+        {"from_square": 1, "to_square": 1, "promotion": 1}
+    ).sort("move_number", 1).to_list(None)
+    
+    players = {}
+    async for user in users_collection.find(
+        {"_id": {"$in": [ObjectId(game["player_white_id"]), ObjectId(game["player_black_id"])]}},
+        {"username": 1, "avatar_id": 1}
+    ):
+        players[str(user["_id"])] = user
+    
+    def player_info(player_id):
+        user = players.get(player_id, {})
+        return {
+            "user_id": player_id,
+            "username": user.get("username"),
+            "avatar_id": user.get("avatar_id", "shield")
+        }
+    
+    return {
+        "fen": game["game_state"],
+        "moves": [m["from_square"] + m["to_square"] + (m.get("promotion") or "") for m in moves],
+        "white": player_info(game["player_white_id"]),
+        "black": player_info(game["player_black_id"]),
+        "status": game["status"]
+    }
+
+def apply_live_move(board: dict, payload: dict) -> bool:
+    """Apply a move in order; False if moves before it are missing from the board"""
+    if payload["move_number"] <= len(board["moves"]):
+        return True  # already in the loaded history
+    if payload["move_number"] > len(board["moves"]) + 1:
+        return False
+    board["fen"] = payload["fen"]
+    board["moves"].append(payload["move"])
+    return True
+
+async def get_live_board(game_id: str) -> Optional[dict]:
+    """Return the cached board, loading it from Mongo at most once per game"""
+    board = live_boards.get(game_id)
+    if board:
+        return board
+    
+    # The entry lives until its last waiter is done, and moves or a game end
+    # published while Mongo is read are recorded on it and applied afterwards
+    load = live_board_loads.get(game_id)
+    if load is None:
+        load = live_board_loads[game_id] = {"lock": asyncio.Lock(), "waiters": 0, "moves": [], "over": False}
+    load["waiters"] += 1
+    try:
+        async with load["lock"]:
+            board = live_boards.get(game_id)
+            if board:
+                return board
+            
+            board = await load_live_board(game_id)
+            if board and board["status"] == "active" and not load["over"]:
+                if all(apply_live_move(board, payload) for payload in load["moves"]):
+                    live_boards[game_id] = board
+    finally:
+        load["waiters"] -= 1
+        if not load["waiters"] and live_board_loads.get(game_id) is load:
+            del live_board_loads[game_id]
+    return board
+
+def update_live_board(payload: dict):
+    """Apply a move to this worker's cached board, or record it for a load in progress"""
+    game_id = payload["game_id"]
+    load = live_board_loads.get(game_id)
+    if load:
+        load["moves"].append(payload)
+    board = live_boards.get(game_id)
+    if board and not apply_live_move(board, payload):
+        # This worker missed a move; the next read reloads the game
+        live_boards.pop(game_id, None)
+
+def evict_live_board(game_id: str):
+    live_boards.pop(game_id, None)
+    live_spectators.pop(game_id, None)
+    load = live_board_loads.get(game_id)
+    if load:
+        load["over"] = True
+
+async def relayed_live_move(payload: dict):
+    update_live_board(payload)
+
+async def relayed_live_game_over(game_id: str):
+    evict_live_board(game_id)
+
+def set_spectator_count(data: dict):
+    counts = live_spectators.setdefault(data["game_id"], {})
+    if data["count"]:
+        counts[data["node"]] = data["count"]
+    else:
+        counts.pop(data["node"], None)
+        if not counts:
+            del live_spectators[data["game_id"]]
+
+async def relayed_spectator_count(data: dict):
+    set_spectator_count(data)
+
+async def report_spectators(game_id: str, leaving_sid: Optional[str] = None):
+    """Share this worker's spectator count for a game with the other workers"""
+    count = sum(
+        1 for sid, _ in sio.manager.get_participants("/", chess_game_room(game_id)) if sid != leaving_sid
+    )
+    data = {"game_id": game_id, "node": SOCKET_NODE_ID, "count": count}
+    set_spectator_count(data)
+    if isinstance(sio.manager, RelayManager):
+        await sio.manager.publish_server_event("live_spectators", data)
+
+if isinstance(sio.manager, RelayManager):
+    sio.manager.on_server_event("live_move", relayed_live_move)
+    sio.manager.on_server_event("live_game_over", relayed_live_game_over)
+    sio.manager.on_server_event("live_spectators", relayed_spectator_count)
+
+async def announce_live_game(game_id: str, usernames: dict, white_id: str, black_id: str):
+    """Post a watchable game to the chess chat room"""
+    await sio.emit("chess_live_game", {
+        "game_id": game_id,
+        "white": {"user_id": white_id, "username": usernames.get(white_id)},
+        "black": {"user_id": black_id, "username": usernames.get(black_id)},
+        "watch_url": f"/api/chess/game/{game_id}/watch"
+    }, room="room_chess")
+
+async def publish_live_move(game_id: str, payload: dict):
+    """Apply a move to the cached boards and emit it once to the game room"""
+    update_live_board(payload)
+    if isinstance(sio.manager, RelayManager):
+        await sio.manager.publish_server_event("live_move", payload)
+    
+    await sio.emit("chess_game_move", payload, room=chess_game_room(game_id))
+    
+    if payload.get("game_result"):
+        await publish_live_game_over(game_id, payload["game_result"], payload.get("winner_id"))
+
+async def publish_live_game_over(game_id: str, result: str, winner_id: Optional[str]):
+    """Tell spectators the game ended and drop it from the live caches"""
+    evict_live_board(game_id)
+    if isinstance(sio.manager, RelayManager):
+        await sio.manager.publish_server_event("live_game_over", game_id)
+    await sio.emit("chess_game_over", {
+        "game_id": game_id,
+        "result": result,
+        "winner_id": winner_id
+    }, room=chess_game_room(game_id))
+
+@app.get("/api/chess/game/{game_id}/watch")
+async def watch_chess_game(
+    game_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a spectator snapshot of a game and the socket room to follow it"""
+    if not ObjectId.is_valid(game_id):
+        raise HTTPException(status_code=404, detail="Game not found")
+    
+    board = await get_live_board(game_id)
+    if not board:
+        raise HTTPException(status_code=404, detail="Game not found")
+    
+    return {
+        "snapshot": live_board_snapshot(game_id, board),
+        "room": chess_game_room(game_id),
+        "socket_event": "watch_game"
+    }
+
 # Chess chat endpoint (in-game chat)
 @app.get("/api/chess/chat/{game_id}")
 async def get_chess_chat(
@@ -2825,14 +5074,375 @@ async def send_chess_chat(
 
 # ============= SOCKET.IO HANDLERS =============
 
-# Active connections: {user_id: [sid]}
-active_connections = {}
-# Room users: {room_id: {user_id: username}}
-room_users = {}
-
 # Available chat rooms
 CHAT_ROOMS = ['general', 'focus', 'distraction', 'chess', 'late-night']
 
+# ===== PRESENCE SERVICE =====
+
+SOCKET_NODE_ID = uuid.uuid4().hex
+PRESENCE_HEARTBEAT_SECONDS = 30
+# Mirrored entries of a worker that stopped heartbeating expire after this
+PRESENCE_TTL_SECONDS = 120
+# Connected users with no client heartbeat for this long show as away
+PRESENCE_IDLE_SECONDS = 120
+
+class PresenceService:
+    """Tracks user -> sids -> rooms for connected sockets
+
+    Local sockets are indexed in memory. When other workers share the
+    socket.io fan-out, every socket is also mirrored to a collection
+    ({_id: sid, user_id, username, rooms, node, seen_at, active_at}) and
+    lookups go there instead, one indexed query each. Client activity is
+    only recorded in memory as it happens and mirrored in one bulk write
+    per PRESENCE_HEARTBEAT_SECONDS, so no socket event waits on Mongo for it.
+    """
+
+    def __init__(self, collection, shared: bool):
+        self.collection = collection
+        self.shared = shared
+        # {sid: {"user_id", "username", "rooms": set, "active_at"}}
+        self.sockets = {}
+        # Sockets active since their entry was last mirrored
+        self.active_sids = set()
+        # {user_id: set(sid)}
+        self.users = {}
+        # {room_id: {user_id: set(sid)}}
+        self.rooms = {}
+
+    async def connect(self, sid: str, user_id: str, username: str):
+        now = datetime.utcnow()
+        self.sockets[sid] = {"user_id": user_id, "username": username, "rooms": set(), "active_at": now}
+        self.users.setdefault(user_id, set()).add(sid)
+        if self.shared:
+            await self.collection.update_one(
+                {"_id": sid},
+                {"$set": {
+                    "user_id": user_id, "username": username, "rooms": [],
+                    "node": SOCKET_NODE_ID, "seen_at": now, "active_at": now
+                }},
+                upsert=True
+            )
+
+    def _drop_from_room(self, room_id: str, user_id: str, sid: str):
+        members = self.rooms.get(room_id, {})
+        sids = members.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del members[user_id]
+        if not members:
+            self.rooms.pop(room_id, None)
+
+    async def disconnect(self, sid: str):
+        """Forget a socket; returns (user_id, rooms the user has left entirely, user went offline)"""
+        entry = self.sockets.pop(sid, None)
+        self.active_sids.discard(sid)
+        if entry is None:
+            return None, [], False
+        user_id = entry["user_id"]
+        sids = self.users.get(user_id, set())
+        sids.discard(sid)
+        if not sids:
+            self.users.pop(user_id, None)
+        for room_id in entry["rooms"]:
+            self._drop_from_room(room_id, user_id, sid)
+        if self.shared:
+            await self.collection.delete_one({"_id": sid})
+        
+        left_rooms = [room_id for room_id in entry["rooms"] if not await self.in_room(user_id, room_id)]
+        return user_id, left_rooms, not await self.is_online(user_id)
+
+    async def join(self, sid: str, room_id: str):
+        entry = self.sockets.get(sid)
+        if entry is None:
+            return
+        entry["rooms"].add(room_id)
+        self.rooms.setdefault(room_id, {}).setdefault(entry["user_id"], set()).add(sid)
+        if self.shared:
+            await self.collection.update_one({"_id": sid}, {"$addToSet": {"rooms": room_id}})
+
+    async def leave(self, sid: str, room_id: str) -> bool:
+        """Returns True if this was the user's last socket in the room"""
+        entry = self.sockets.get(sid)
+        if entry is None or room_id not in entry["rooms"]:
+            return False
+        entry["rooms"].discard(room_id)
+        self._drop_from_room(room_id, entry["user_id"], sid)
+        if self.shared:
+            await self.collection.update_one({"_id": sid}, {"$pull": {"rooms": room_id}})
+        return not await self.in_room(entry["user_id"], room_id)
+
+    def heartbeat(self, sid: str):
+        entry = self.sockets.get(sid)
+        if entry is None:
+            return
+        entry["active_at"] = datetime.utcnow()
+        if self.shared:
+            self.active_sids.add(sid)
+
+    async def in_room(self, user_id: str, room_id: str) -> bool:
+        if self.shared:
+            return await self.collection.find_one({"user_id": user_id, "rooms": room_id}, {"_id": 1}) is not None
+        return user_id in self.rooms.get(room_id, {})
+
+    async def is_online(self, user_id: str) -> bool:
+        if self.shared:
+            return await self.collection.find_one({"user_id": user_id}, {"_id": 1}) is not None
+        return user_id in self.users
+
+    async def statuses(self, user_ids: List[str]) -> dict:
+        """{user_id: "online" | "away" | "offline"}"""
+        active = {}
+        if self.shared:
+            async for doc in self.collection.find(
+                {"user_id": {"$in": list(user_ids)}}, {"user_id": 1, "active_at": 1}
+            ):
+                active[doc["user_id"]] = max(active.get(doc["user_id"], datetime.min), doc["active_at"])
+        else:
+            for user_id in user_ids:
+                if user_id in self.users:
+                    active[user_id] = max(self.sockets[sid]["active_at"] for sid in self.users[user_id])
+        
+        idle_before = datetime.utcnow() - timedelta(seconds=PRESENCE_IDLE_SECONDS)
+        return {
+            user_id: "offline" if user_id not in active else "online" if active[user_id] >= idle_before else "away"
+            for user_id in user_ids
+        }
+
+    async def online_users(self, user_ids) -> set:
+        statuses = await self.statuses(list(user_ids))
+        return {user_id for user_id, state in statuses.items() if state != "offline"}
+
+    async def room_usernames(self, room_id: str) -> List[str]:
+        if self.shared:
+            entries = await self.collection.find(
+                {"rooms": room_id}, {"user_id": 1, "username": 1}
+            ).to_list(None)
+            return list({e["user_id"]: e.get("username", "Anonymous") for e in entries}.values())
+        return [
+            self.sockets[next(iter(sids))]["username"]
+            for sids in self.rooms.get(room_id, {}).values()
+        ]
+
+    async def sync_activity(self):
+        """Mirror client activity since the last sync; other workers only
+        need it to within the idle threshold"""
+        active, self.active_sids = self.active_sids, set()
+        ops = [
+            UpdateOne({"_id": sid}, {"$set": {"active_at": self.sockets[sid]["active_at"]}})
+            for sid in active if sid in self.sockets
+        ]
+        if not ops:
+            return
+        try:
+            await self.collection.bulk_write(ops, ordered=False)
+        except Exception:
+            self.active_sids |= {sid for sid in active if sid in self.sockets}
+            raise
+
+    async def refresh_node(self):
+        """Keep this worker's mirrored entries from expiring"""
+        if self.shared:
+            await self.collection.update_many(
+                {"node": SOCKET_NODE_ID}, {"$set": {"seen_at": datetime.utcnow()}}
+            )
+            await self.sync_activity()
+
+presence = PresenceService(socket_presence_collection, shared=SOCKETIO_MANAGER != 'memory')
+
+async def presence_heartbeat_loop():
+    while True:
+        await asyncio.sleep(PRESENCE_HEARTBEAT_SECONDS)
+        try:
+            await presence.refresh_node()
+        except Exception as e:
+            logger.error(f"Presence heartbeat failed: {e}")
+
+@app.on_event("startup")
+async def startup_presence():
+    if not presence.shared:
+        return
+    await socket_presence_collection.create_index("user_id")
+    await socket_presence_collection.create_index("rooms")
+    await socket_presence_collection.create_index("seen_at", expireAfterSeconds=PRESENCE_TTL_SECONDS)
+    start_background_task(presence_heartbeat_loop())
+
+@app.on_event("shutdown")
+async def shutdown_presence():
+    if presence.shared:
+        await socket_presence_collection.delete_many({"node": SOCKET_NODE_ID})
+
+@app.post("/api/presence")
+async def get_presence(
+    query: PresenceQuery,
+    current_user: dict = Depends(get_current_user)
+):
+    """Online status for many users at once (friends list, leaderboard)"""
+    return {"presence": await presence.statuses(query.user_ids)}
+
+# ===== SESSION PROFILES =====
+
+# Slim profile kept in each socket session so chat events need no user read
+SOCKET_PROFILE_PROJECTION = {"username": 1, "avatar_id": 1, "is_blocked": 1, "role": 1}
+
+def socket_profile(user: dict) -> dict:
+    return {
+        "username": user.get("username", "Anonymous"),
+        "avatar_id": user.get("avatar_id", "shield"),
+        "is_blocked": user.get("is_blocked", False),
+        "role": user.get("role", "user")
+    }
+
+async def apply_socket_profiles(profiles: dict):
+    """Replace the cached profile in every local session of the given users"""
+    for user_id, profile in profiles.items():
+        for sid, _ in sio.manager.get_participants("/", user_room(user_id)):
+            async with sio.session(sid) as session:
+                session["profile"] = profile
+
+async def refresh_socket_profiles(user_ids: List[str]):
+    """Reload profiles after a change and push them to sessions on every worker"""
+    users = await users_collection.find(
+        {"_id": {"$in": [ObjectId(user_id) for user_id in user_ids]}}, SOCKET_PROFILE_PROJECTION
+    ).to_list(None)
+    profiles = {str(user["_id"]): socket_profile(user) for user in users}
+    await apply_socket_profiles(profiles)
+    if isinstance(sio.manager, RelayManager):
+        await sio.manager.publish_server_event("socket_profiles", profiles)
+
+if isinstance(sio.manager, RelayManager):
+    sio.manager.on_server_event("socket_profiles", apply_socket_profiles)
+
+# ===== SOCKET FLOW CONTROL =====
+
+# Token buckets per event: (sid rate/s, sid burst, user rate/s, user burst).
+# Override with SOCKET_RATE_LIMITS='{"room_message": [1, 5, 2, 10]}'
+SOCKET_RATE_LIMITS = {
+    "room_message": (1.0, 5, 2.0, 10),
+    "send_message": (1.0, 5, 2.0, 10),
+    "typing": (4.0, 8, 8.0, 16),
+}
+SOCKET_RATE_LIMITS.update({
+    event: tuple(limit) for event, limit in json.loads(os.getenv('SOCKET_RATE_LIMITS', '{}')).items()
+})
+
+# Outbound engine.io packets queued for one connection
+SLOW_CONSUMER_TYPING_QUEUE = 32  # typing updates skip the socket above this
+SLOW_CONSUMER_MAX_QUEUE = 256  # counts a strike above this
+SLOW_CONSUMER_STRIKES = 3  # consecutive strikes before disconnecting
+SLOW_CONSUMER_CHECK_SECONDS = 2
+
+# {(scope, sid or user_id, event): [tokens, updated_at]}
+socket_buckets = {}
+slow_consumer_strikes = {}
+socket_flow_stats = {
+    "allowed": 0, "dropped_sid": 0, "dropped_user": 0,
+    "typing_skipped": 0, "slow_disconnects": 0
+}
+
+def take_token(key: tuple, rate: float, burst: int) -> bool:
+    now = time.monotonic()
+    bucket = socket_buckets.get(key)
+    if bucket is None:
+        socket_buckets[key] = [burst - 1, now]
+        return True
+    tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+    bucket[1] = now
+    if tokens < 1:
+        bucket[0] = tokens
+        return False
+    bucket[0] = tokens - 1
+    return True
+
+def allow_socket_event(sid: str, user_id: str, event: str) -> bool:
+    limit = SOCKET_RATE_LIMITS.get(event)
+    if not limit:
+        return True
+    sid_rate, sid_burst, user_rate, user_burst = limit
+    if not take_token(("sid", sid, event), sid_rate, sid_burst):
+        socket_flow_stats["dropped_sid"] += 1
+        return False
+    if not take_token(("user", user_id, event), user_rate, user_burst):
+        socket_flow_stats["dropped_user"] += 1
+        return False
+    socket_flow_stats["allowed"] += 1
+    return True
+
+def forget_socket_buckets(sid: str, user_id: Optional[str], user_gone: bool):
+    for event in SOCKET_RATE_LIMITS:
+        socket_buckets.pop(("sid", sid, event), None)
+        if user_gone:
+            socket_buckets.pop(("user", user_id, event), None)
+
+def outbound_queue_size(sid: str) -> int:
+    eio_sid = sio.manager.eio_sid_from_sid(sid, "/")
+    socket = sio.eio.sockets.get(eio_sid) if eio_sid else None
+    return socket.queue.qsize() if socket else 0
+
+def congested_sids(room: str) -> List[str]:
+    """Local sockets in a room too backed up to be sent low-priority updates"""
+    return [
+        sid for sid, _ in sio.manager.get_participants("/", room)
+        if outbound_queue_size(sid) > SLOW_CONSUMER_TYPING_QUEUE
+    ]
+
+async def check_slow_consumers():
+    for eio_sid, socket in list(sio.eio.sockets.items()):
+        if socket.queue.qsize() <= SLOW_CONSUMER_MAX_QUEUE:
+            slow_consumer_strikes.pop(eio_sid, None)
+            continue
+        strikes = slow_consumer_strikes[eio_sid] = slow_consumer_strikes.get(eio_sid, 0) + 1
+        if strikes >= SLOW_CONSUMER_STRIKES:
+            slow_consumer_strikes.pop(eio_sid, None)
+            socket_flow_stats["slow_disconnects"] += 1
+            logger.warning(f"Disconnecting slow consumer {eio_sid} ({socket.queue.qsize()} packets queued)")
+            # Abort rather than wait for a queue the client is not draining
+            await socket.close(wait=False, abort=True)
+            sio.eio.sockets.pop(eio_sid, None)
+    for eio_sid in list(slow_consumer_strikes):
+        if eio_sid not in sio.eio.sockets:
+            del slow_consumer_strikes[eio_sid]
+
+async def slow_consumer_loop():
+    while True:
+        await asyncio.sleep(SLOW_CONSUMER_CHECK_SECONDS)
+        try:
+            await check_slow_consumers()
+        except Exception as e:
+            logger.error(f"Slow consumer check failed: {e}")
+
+@app.on_event("startup")
+async def startup_socket_flow_control():
+    start_background_task(slow_consumer_loop())
+
+@app.get("/api/admin/socket/stats")
+async def get_socket_stats(current_user: dict = Depends(get_current_admin)):
+    return {
+        **socket_flow_stats,
+        "local_connections": len(sio.eio.sockets),
+        "rate_limits": SOCKET_RATE_LIMITS,
+        "buckets": len(socket_buckets),
+        "serializers": {**sio.serializer_stats, "msgpack_clients": len(sio.msgpack_sids)},
+        "room_batching": {**room_batch_stats, "window_ms": ROOM_BATCH_WINDOW_MS}
+    }
+
+@app.get("/api/admin/socket/metrics")
+async def get_socket_metrics(
+    sort: str = "total_ms",
+    current_user: dict = Depends(get_current_admin)
+):
+    """Per-event handler cost since startup or the last reset, most expensive first"""
+    if sort not in SOCKET_METRIC_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Sort must be one of {', '.join(SOCKET_METRIC_SORT_FIELDS)}")
+    return sio.metrics.snapshot(sort)
+
+@app.post("/api/admin/socket/metrics/reset")
+async def reset_socket_metrics(current_user: dict = Depends(get_current_admin)):
+    sio.metrics.reset()
+    return {"message": "Socket metrics reset"}
+
+# ===== CONNECTION HANDLERS =====
+
 @sio.event
 async def connect(sid, environ):
     logger.info(f"Client connected: {sid}")
@@ -2844,20 +5454,21 @@ async def authenticate(sid, data):
         payload = decode_token(token)
         user_id = payload.get("sub")
         
+        # Get user info
+        user = await users_collection.find_one({"_id": ObjectId(user_id)}, SOCKET_PROFILE_PROJECTION)
+        profile = socket_profile(user)
+        
         # Store user session
-        await sio.save_session(sid, {"user_id": user_id})
+        await sio.save_session(sid, {"user_id": user_id, "profile": profile})
         
         # Track connection
-        if user_id not in active_connections:
-            active_connections[user_id] = []
-        active_connections[user_id].append(sid)
-        
-        # Get user info
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        await presence.connect(sid, user_id, profile["username"])
+        mark_player_online(user_id)
+        await sio.enter_room(sid, user_room(user_id))
         
         await sio.emit("authenticated", {
             "user_id": user_id,
-            "username": user.get("username")
+            "username": profile["username"]
         }, to=sid)
         
         logger.info(f"User {user_id} authenticated on socket {sid}")
@@ -2868,6 +5479,77 @@ async def authenticate(sid, data):
 
 # ===== GROUP CHAT ROOM HANDLERS =====
 
+# ===== ROOM MESSAGE REPLAY =====
+
+ROOM_REPLAY_BUFFER_SIZE = 200
+# More missed messages than this and the client should page over REST
+ROOM_REPLAY_MAX_MESSAGES = 200
+
+# Recent room_message payloads broadcast by this process:
+# {room_id: deque[((timestamp, ObjectId), payload)]}
+room_recent_messages = {}
+
+def remember_room_message(room_id: str, timestamp: datetime, message_id: ObjectId, payload: dict):
+    buffer = room_recent_messages.get(room_id)
+    if buffer is None:
+        buffer = room_recent_messages[room_id] = deque(maxlen=ROOM_REPLAY_BUFFER_SIZE)
+    # Mongo keeps milliseconds; match it so buffered and stored positions compare
+    timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+    buffer.append(((timestamp, message_id), payload))
+
+def room_message_payload(doc: dict) -> dict:
+    return {
+        "message_id": str(doc["_id"]),
+        "user_id": str(doc["user_id"]),
+        "username": doc.get("username"),
+        "message": doc.get("message"),
+        "timestamp": doc["timestamp"].isoformat(),
+        "room_id": doc.get("room")
+    }
+
+async def room_message_position(room_id: str, message_id: ObjectId) -> tuple:
+    """(timestamp, _id) of a message, the order replay follows
+
+    ObjectIds from different workers are not ordered with respect to each
+    other, so they only break ties between equal timestamps.
+    """
+    for key, _ in room_recent_messages.get(room_id) or ():
+        if key[1] == message_id:
+            return key
+    doc = await messages_collection.find_one({"_id": message_id, "room": room_id}, {"timestamp": 1})
+    if doc:
+        return doc["timestamp"], message_id
+    # Unknown id: its creation second is close enough; clients drop repeats by id
+    return message_id.generation_time.replace(tzinfo=None, microsecond=0), message_id
+
+async def replay_room_messages(room_id: str, last_seen: ObjectId):
+    """Messages after last_seen, oldest first, and whether that is all of them"""
+    buffer = room_recent_messages.get(room_id) or ()
+    position = await room_message_position(room_id, last_seen)
+    # The buffer only holds this worker's broadcasts, so it is complete on its own
+    # only with a single process; otherwise it just tops up the query with
+    # messages still waiting in the write-behind buffer
+    if SOCKETIO_MANAGER == 'memory' and buffer and buffer[0][0] <= position:
+        messages = [payload for key, payload in buffer if key > position]
+        return messages[:ROOM_REPLAY_MAX_MESSAGES], len(messages) <= ROOM_REPLAY_MAX_MESSAGES
+    
+    timestamp, message_id = position
+    docs = await messages_collection.find({"room": room_id, "$or": [
+        {"timestamp": {"$gt": timestamp}},
+        {"timestamp": timestamp, "_id": {"$gt": message_id}}
+    ]}).sort([("timestamp", 1), ("_id", 1)]).limit(ROOM_REPLAY_MAX_MESSAGES + 1).to_list(ROOM_REPLAY_MAX_MESSAGES + 1)
+    found = {doc["_id"] for doc in docs}
+    # Past a truncated page the query has gaps the buffer cannot fill
+    last = (docs[-1]["timestamp"], docs[-1]["_id"]) if len(docs) > ROOM_REPLAY_MAX_MESSAGES else None
+    merged = [((doc["timestamp"], doc["_id"]), room_message_payload(doc)) for doc in docs]
+    merged += [
+        (key, payload) for key, payload in buffer
+        if key > position and key[1] not in found and (last is None or key < last)
+    ]
+    merged.sort(key=lambda item: item[0])
+    messages = [payload for _, payload in merged]
+    return messages[:ROOM_REPLAY_MAX_MESSAGES], len(messages) <= ROOM_REPLAY_MAX_MESSAGES
+
 @sio.on("join_room")
 async def join_room(sid, data):
     session = await sio.get_session(sid)
@@ -2881,17 +5563,13 @@ async def join_room(sid, data):
         await sio.emit("error", {"message": "Invalid room"}, to=sid)
         return
     
-    # Get user info
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    username = user.get("username", "Anonymous")
+    username = session["profile"]["username"]
     
     # Join the socket room
-    sio.enter_room(sid, f"room_{room_id}")
+    await sio.enter_room(sid, f"room_{room_id}")
     
     # Track user in room
-    if room_id not in room_users:
-        room_users[room_id] = {}
-    room_users[room_id][user_id] = username
+    await presence.join(sid, room_id)
     
     # Notify others in room
     await sio.emit("user_joined_room", {
@@ -2903,8 +5581,19 @@ async def join_room(sid, data):
     # Send current room users to the joining user
     await sio.emit("room_users", {
         "room_id": room_id,
-        "users": list(room_users.get(room_id, {}).values())
+        "users": await presence.room_usernames(room_id)
     }, to=sid)
+    await send_room_typers(f"room_{room_id}", sid)
+    
+    # Catch a reconnecting client up on what it missed
+    last_seen = data.get("last_seen_message_id")
+    if last_seen and ObjectId.is_valid(last_seen):
+        messages, complete = await replay_room_messages(room_id, ObjectId(last_seen))
+        await sio.emit("room_replay", {
+            "room_id": room_id,
+            "messages": messages,
+            "complete": complete
+        }, to=sid)
     
     logger.info(f"User {user_id} joined room {room_id}")
 
@@ -2918,21 +5607,86 @@ async def leave_room(sid, data):
         return
     
     # Leave the socket room
-    sio.leave_room(sid, f"room_{room_id}")
+    await sio.leave_room(sid, f"room_{room_id}")
+    clear_typing(sid, f"room_{room_id}")
     
     # Remove user from room tracking
-    if room_id in room_users and user_id in room_users[room_id]:
-        username = room_users[room_id].pop(user_id, "Anonymous")
-        
+    if await presence.leave(sid, room_id):
         # Notify others
         await sio.emit("user_left_room", {
             "user_id": user_id,
-            "username": username,
+            "username": session["profile"]["username"],
             "room_id": room_id
         }, room=f"room_{room_id}")
     
     logger.info(f"User {user_id} left room {room_id}")
 
+# ===== ROOM BROADCAST BATCHING =====
+
+ROOM_BATCH_MAX_MESSAGES = 100
+
+# Adaptive per room: a message sent while the room is quiet goes out at once;
+# one arriving within the window of the previous emit waits for the window to
+# close and goes out with everything else that arrived meanwhile
+room_last_emit = {}  # {room_id: loop time of the last emit}
+room_batches = {}  # {room_id: [payload]} waiting for the window to close
+room_batch_tasks = {}
+room_batch_stats = {"messages": 0, "emits": 0, "batches": 0, "batched_messages": 0}
+
+async def emit_room_payloads(room_id: str, payloads: list):
+    room_last_emit[room_id] = asyncio.get_running_loop().time()
+    room_batch_stats["emits"] += 1
+    if len(payloads) == 1:
+        await sio.emit("room_message", payloads[0], room=f"room_{room_id}")
+        return
+    room_batch_stats["batches"] += 1
+    room_batch_stats["batched_messages"] += len(payloads)
+    await sio.emit("room_messages", {"room_id": room_id, "messages": payloads}, room=f"room_{room_id}")
+
+async def flush_room_batch(room_id: str, delay: float):
+    await asyncio.sleep(delay)
+    room_batch_tasks.pop(room_id, None)
+    payloads = room_batches.pop(room_id, None)
+    if payloads:
+        await emit_room_payloads(room_id, payloads)
+
+async def broadcast_room_message(room_id: str, payload: dict):
+    room_batch_stats["messages"] += 1
+    window = ROOM_BATCH_WINDOW_MS / 1000
+    batch = room_batches.get(room_id)
+    if batch is not None:
+        batch.append(payload)
+        if len(batch) >= ROOM_BATCH_MAX_MESSAGES:
+            room_batch_tasks.pop(room_id).cancel()
+            del room_batches[room_id]
+            await emit_room_payloads(room_id, batch)
+        return
+    
+    since_last = asyncio.get_running_loop().time() - room_last_emit.get(room_id, float("-inf"))
+    if window <= 0 or since_last >= window:
+        await emit_room_payloads(room_id, [payload])
+        return
+    
+    room_batches[room_id] = [payload]
+    room_batch_tasks[room_id] = asyncio.create_task(flush_room_batch(room_id, window - since_last))
+
+async def drain_room_batches():
+    """Send every batch still waiting for its window, without waiting"""
+    for task in room_batch_tasks.values():
+        task.cancel()
+    room_batch_tasks.clear()
+    pending = list(room_batches.items())
+    room_batches.clear()
+    for room_id, payloads in pending:
+        try:
+            await emit_room_payloads(room_id, payloads)
+        except Exception as e:
+            logger.error(f"Room batch drain failed for {room_id}: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_room_batching():
+    await drain_room_batches()
+
 @sio.on("room_message")
 async def room_message(sid, data):
     session = await sio.get_session(sid)
@@ -2943,6 +5697,10 @@ async def room_message(sid, data):
     if not user_id:
         return
     
+    if not allow_socket_event(sid, user_id, "room_message"):
+        await sio.emit("error", {"message": "Slow down"}, to=sid)
+        return
+    
     if room_id not in CHAT_ROOMS:
         await sio.emit("error", {"message": "Invalid room"}, to=sid)
         return
@@ -2951,8 +5709,8 @@ async def room_message(sid, data):
         await sio.emit("error", {"message": "Invalid message"}, to=sid)
         return
     
-    # Get user info
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+    # Cached at authenticate, refreshed on profile changes
+    user = session["profile"]
     
     if user.get("is_blocked", False):
         await sio.emit("error", {"message": "You are blocked from sending messages"}, to=sid)
@@ -2967,20 +5725,53 @@ async def room_message(sid, data):
         "room": room_id
     }
     
-    result = await messages_collection.insert_one(message_doc)
+    message_id = await persist_message(messages_collection, message_doc)
     
     # Broadcast to room
-    await sio.emit("room_message", {
-        "message_id": str(result.inserted_id),
+    payload = {
+        "message_id": str(message_id),
         "user_id": user_id,
         "username": user.get("username"),
         "message": message_content,
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": message_doc["timestamp"].isoformat(),
         "room_id": room_id
-    }, room=f"room_{room_id}")
+    }
+    await broadcast_room_message(room_id, payload)
+    remember_room_message(room_id, message_doc["timestamp"], message_id, payload)
     
     logger.info(f"Room {room_id} message from {user_id}: {message_content[:50]}")
 
+# ===== CHESS SPECTATOR HANDLERS =====
+
+@sio.on("watch_game")
+async def watch_game(sid, data):
+    session = await sio.get_session(sid)
+    user_id = session.get("user_id")
+    game_id = data.get("game_id")
+    
+    if not user_id:
+        return
+    
+    if not game_id or not ObjectId.is_valid(game_id):
+        await sio.emit("error", {"message": "Invalid game"}, to=sid)
+        return
+    
+    board = await get_live_board(game_id)
+    if not board:
+        await sio.emit("error", {"message": "Game not found"}, to=sid)
+        return
+    
+    await sio.enter_room(sid, chess_game_room(game_id))
+    await report_spectators(game_id)
+    await sio.emit("chess_game_snapshot", live_board_snapshot(game_id, board), to=sid)
+
+@sio.on("unwatch_game")
+async def unwatch_game(sid, data):
+    game_id = data.get("game_id")
+    if game_id and chess_game_room(game_id) in sio.rooms(sid):
+        await sio.leave_room(sid, chess_game_room(game_id))
+        await report_spectators(game_id)
+
 # ===== LEGACY COMMUNITY CHAT =====
 
 @sio.on("join_community")
@@ -2993,14 +5784,15 @@ async def join_community(sid, data):
         return
     
     # Join community room
-    sio.enter_room(sid, "community")
+    await sio.enter_room(sid, "community")
     
     # Notify others
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+    user = session["profile"]
     await sio.emit("user_joined", {
         "user_id": user_id,
         "username": user.get("username")
     }, room="community", skip_sid=sid)
+    await send_room_typers("community", sid)
     
     logger.info(f"User {user_id} joined community chat")
 
@@ -3013,13 +5805,17 @@ async def send_message(sid, data):
         await sio.emit("error", {"message": "Not authenticated"}, to=sid)
         return
     
+    if not allow_socket_event(sid, user_id, "send_message"):
+        await sio.emit("error", {"message": "Slow down"}, to=sid)
+        return
+    
     message_content = data.get("message", "").strip()
     if not message_content or len(message_content) > 2000:
         await sio.emit("error", {"message": "Invalid message"}, to=sid)
         return
     
-    # Get user info
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+    # Cached at authenticate, refreshed on profile changes
+    user = session["profile"]
     
     # Check if user is blocked
     if user.get("is_blocked", False):
@@ -3035,11 +5831,11 @@ async def send_message(sid, data):
         "room": "community"
     }
     
-    result = await messages_collection.insert_one(message_doc)
+    message_id = await persist_message(messages_collection, message_doc)
     
     # Broadcast to community room
     await sio.emit("new_message", {
-        "message_id": str(result.inserted_id),
+        "message_id": str(message_id),
         "user_id": user_id,
         "username": user.get("username"),
         "message": message_content,
@@ -3048,31 +5844,154 @@ async def send_message(sid, data):
     
     logger.info(f"Message from {user_id}: {message_content[:50]}")
 
+# ===== TYPING INDICATORS =====
+
+# Typing state is kept per room and flushed as one update per changed room per
+# tick, so broadcasts scale with rooms rather than keystrokes. Updates are
+# deltas (which sockets started, which stopped) keyed per socket, so that a
+# user typing from two devices, or workers sharing a room through the pub/sub
+# manager, never clear each other's entries. A socket joining a room is sent
+# the current typers of every worker
+TYPING_TTL_SECONDS = 5
+TYPING_FLUSH_INTERVAL_SECONDS = 0.5
+
+# {socket room: {sid: (user_id, username, expires_at)}}
+typing_rooms = {}
+typing_dirty_rooms = set()
+# Sockets this worker last announced as typing: {socket room: {key: (user_id, username)}}
+typing_announced = {}
+
+def typing_key(sid: str) -> str:
+    """Opaque per-socket key for typing updates, so clients never see socket ids"""
+    return hashlib.blake2s(sid.encode(), digest_size=8).hexdigest()
+
+def set_typing(room: str, sid: str, user_id: str, username: str, active: bool):
+    typers = typing_rooms.setdefault(room, {})
+    if active:
+        if sid not in typers:
+            typing_dirty_rooms.add(room)
+        typers[sid] = (user_id, username, asyncio.get_running_loop().time() + TYPING_TTL_SECONDS)
+    elif typers.pop(sid, None):
+        typing_dirty_rooms.add(room)
+
+def clear_typing(sid: str, room: Optional[str] = None):
+    for typing_room, typers in typing_rooms.items():
+        if room in (None, typing_room) and typers.pop(sid, None):
+            typing_dirty_rooms.add(typing_room)
+
+async def flush_typing():
+    now = asyncio.get_running_loop().time()
+    for room, typers in typing_rooms.items():
+        expired = [sid for sid, (_, _, expires_at) in typers.items() if expires_at <= now]
+        for sid in expired:
+            del typers[sid]
+        if expired:
+            typing_dirty_rooms.add(room)
+    
+    dirty = list(typing_dirty_rooms)
+    typing_dirty_rooms.clear()
+    for room in dirty:
+        current = {
+            typing_key(sid): (user_id, username)
+            for sid, (user_id, username, _) in typing_rooms.get(room, {}).items()
+        }
+        announced = typing_announced.get(room, {})
+        started = [{"key": key, "user_id": user_id, "username": username}
+                   for key, (user_id, username) in current.items() if key not in announced]
+        stopped = [key for key in announced if key not in current]
+        if current:
+            typing_announced[room] = current
+        else:
+            typing_announced.pop(room, None)
+            if not typing_rooms.get(room):
+                typing_rooms.pop(room, None)
+        if not started and not stopped:
+            continue
+        
+        skipped = congested_sids(room)
+        socket_flow_stats["typing_skipped"] += len(skipped)
+        await sio.emit("typing_users", {
+            "room": room,
+            "started": started,
+            "stopped": stopped
+        }, room=room, skip_sid=skipped or None)
+
+async def send_typing_snapshot(room: str, sid: str):
+    """Send a socket the typers this worker has announced in a room"""
+    announced = typing_announced.get(room)
+    if not announced:
+        return
+    await sio.emit("typing_users", {
+        "room": room,
+        "started": [{"key": key, "user_id": user_id, "username": username}
+                    for key, (user_id, username) in announced.items()],
+        "stopped": []
+    }, to=sid)
+
+async def send_room_typers(room: str, sid: str):
+    """Catch a socket that just joined a room up on who is typing there"""
+    await send_typing_snapshot(room, sid)
+    if isinstance(sio.manager, RelayManager):
+        await sio.manager.publish_server_event("typing_snapshot", {"room": room, "sid": sid})
+
+async def relayed_typing_snapshot(data: dict):
+    await send_typing_snapshot(data["room"], data["sid"])
+
+if isinstance(sio.manager, RelayManager):
+    sio.manager.on_server_event("typing_snapshot", relayed_typing_snapshot)
+
+async def typing_flush_loop():
+    while True:
+        await asyncio.sleep(TYPING_FLUSH_INTERVAL_SECONDS)
+        try:
+            await flush_typing()
+        except Exception as e:
+            logger.error(f"Typing flush failed: {e}")
+
+@app.on_event("startup")
+async def startup_typing():
+    start_background_task(typing_flush_loop())
+
 @sio.on("typing")
 async def typing(sid, data):
+    """Typing start (default) or stop ({"typing": false}) in the community or a chat room"""
     session = await sio.get_session(sid)
     user_id = session.get("user_id")
     
     if not user_id:
         return
     
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    
-    await sio.emit("user_typing", {
-        "user_id": user_id,
-        "username": user.get("username")
-    }, room="community", skip_sid=sid)
+    data = data or {}
+    room_id = data.get("room_id")
+    room = f"room_{room_id}" if room_id in CHAT_ROOMS else "community"
+    active = data.get("typing", True) is not False
+    # Only sockets actually in the room may show up as typing there
+    if active and room not in sio.rooms(sid):
+        return
+    # Stops always go through so nobody is left shown as typing
+    if active and not allow_socket_event(sid, user_id, "typing"):
+        return
+    set_typing(room, sid, user_id, session["profile"]["username"], active)
 
 @sio.event
 async def disconnect(sid):
     session = await sio.get_session(sid)
     user_id = session.get("user_id")
     
-    if user_id and user_id in active_connections:
-        if sid in active_connections[user_id]:
-            active_connections[user_id].remove(sid)
-        if not active_connections[user_id]:
-            del active_connections[user_id]
+    clear_typing(sid)
+    for room in sio.rooms(sid):
+        if room.startswith("chess_game_"):
+            await report_spectators(room.removeprefix("chess_game_"), leaving_sid=sid)
+    _, left_rooms, user_gone = await presence.disconnect(sid)
+    for room_id in left_rooms:
+        await sio.emit("user_left_room", {
+            "user_id": user_id,
+            "username": session["profile"]["username"],
+            "room_id": room_id
+        }, room=f"room_{room_id}")
+    if user_gone:
+        mark_player_offline(user_id)
+    forget_socket_buckets(sid, user_id, user_gone)
     
     logger.info(f"Client disconnected: {sid}")
 
@@ -0,0 +1,249 @@
+"""
+Socket.IO client managers for running more than one server process
+
+Each manager relays emits, room changes and disconnects between processes
+through a pub/sub backend, so a user connected to any worker receives
+events emitted by any other:
+
+- MongoChangeStreamManager: inserts into a TTL collection and tails it with
+  a change stream (needs a replica set, which change streams require)
+- UnixSocketPubSubManager: workers on one host relay through a broker on a
+  Unix socket; the first worker to take the lock file runs the broker
+- LocalPubSubManager: servers in one process share an in-memory channel,
+  a stand-in for tests
+
+All of them also carry server events: notifications between workers that
+never reach a client, such as invalidating cached socket sessions.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+# Largest relayed message a Unix socket peer will read
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+
+class RelayManager(AsyncPubSubManager, ABC):
+    """Pub/sub manager that also relays server events between workers
+
+    Subclasses implement _publish and _receive (instead of _listen).
+    """
+
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.server_event_handlers = {}
+
+    def on_server_event(self, event, handler):
+        """Register an async handler called with the data of events from other workers"""
+        self.server_event_handlers[event] = handler
+
+    async def publish_server_event(self, event, data):
+        await self._publish({"method": "server_event", "event": event, "data": data,
+                             "host_id": self.host_id})
+
+    @abstractmethod
+    async def _publish(self, data):
+        """Send one message (a dict) to every worker on the channel"""
+
+    @abstractmethod
+    async def _receive(self):
+        """Async generator of messages from the channel, as dicts or JSON text
+
+        Messages this worker published may come back too; server events from
+        its own host id are dropped by _listen.
+        """
+        yield
+
+    async def _listen(self):
+        async for message in self._receive():
+            if isinstance(message, (str, bytes)):
+                try:
+                    message = json.loads(message)
+                except ValueError:
+                    continue
+            if message.get("method") != "server_event":
+                yield message
+            elif message.get("host_id") != self.host_id:
+                handler = self.server_event_handlers.get(message.get("event"))
+                if handler is None:
+                    continue
+                try:
+                    await handler(message.get("data"))
+                except Exception as e:
+                    self._get_logger().error(f"Server event {message.get('event')} failed: {e}")
+
+
+class MongoChangeStreamManager(RelayManager):
+    """Pub/sub over a Mongo collection tailed with a change stream"""
+    name = 'mongochangestream'
+
+    def __init__(self, collection, channel='socketio', ttl_seconds=60,
+                 write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+
+    async def _publish(self, data):
+        try:
+            await self.collection.insert_one({
+                "channel": self.channel,
+                "data": json.dumps(data),
+                "created_at": datetime.utcnow()
+            })
+        except Exception as e:
+            self._get_logger().error(f"Cannot publish to mongo: {e}")
+
+    async def _receive(self):
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.channel": self.channel}}]
+        resume_token = None
+        retry_sleep = 1
+        while True:
+            try:
+                async with self.collection.watch(pipeline, resume_after=resume_token) as stream:
+                    async for change in stream:
+                        retry_sleep = 1
+                        resume_token = stream.resume_token
+                        yield change["fullDocument"]["data"]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._get_logger().error(
+                    f"Cannot receive from mongo change stream, retrying in {retry_sleep} secs: {e}"
+                )
+                if retry_sleep > 1:
+                    # The token itself may be the problem (e.g. history rolled off the oplog)
+                    resume_token = None
+                await asyncio.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+
+
+class UnixSocketPubSubManager(RelayManager):
+    """Pub/sub between workers on one host through a Unix socket broker
+
+    Messages are newline-delimited JSON. Whichever worker holds the lock
+    file runs the broker; if it dies the lock is released and the next
+    worker to reconnect takes over.
+    """
+    name = 'unixsocketpubsub'
+
+    def __init__(self, path, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self.reader = None
+        self.writer = None
+        self.connect_lock = asyncio.Lock()
+        self.broker = None
+        self.broker_lock_fd = None
+        self.peers = set()
+
+    async def _ensure_broker(self):
+        if self.broker is not None:
+            return
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return  # another worker runs the broker
+        self.broker_lock_fd = fd
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left behind by a broker that died
+        self.broker = await asyncio.start_unix_server(
+            self._relay, path=self.path, limit=MAX_MESSAGE_BYTES
+        )
+        self._get_logger().info(f"Socket.IO broker listening on {self.path}")
+
+    async def _relay(self, reader, writer):
+        self.peers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for peer in list(self.peers):
+                    if not peer.is_closing():
+                        peer.write(line)
+        except Exception as e:
+            self._get_logger().error(f"Socket.IO broker peer failed: {e}")
+        finally:
+            self.peers.discard(writer)
+            writer.close()
+
+    async def _connect(self):
+        async with self.connect_lock:
+            if self.writer is None or self.writer.is_closing():
+                await self._ensure_broker()
+                self.reader, self.writer = await asyncio.open_unix_connection(
+                    self.path, limit=MAX_MESSAGE_BYTES
+                )
+            return self.reader, self.writer
+
+    def _close(self, reader):
+        # Only drop the connection the caller was using, not a newer one
+        if self.reader is reader and self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def _publish(self, data):
+        reader = None
+        try:
+            reader, writer = await self._connect()
+            writer.write(json.dumps({"channel": self.channel, "data": data}).encode() + b"\n")
+            await writer.drain()
+        except Exception as e:
+            self._get_logger().error(f"Cannot publish to socket broker: {e}")
+            self._close(reader)
+
+    async def _receive(self):
+        retry_sleep = 1
+        while True:
+            reader = None
+            try:
+                reader, _ = await self._connect()
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        raise ConnectionError("broker closed the connection")
+                    retry_sleep = 1
+                    message = json.loads(line)
+                    if message.get("channel") == self.channel:
+                        yield message["data"]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._get_logger().error(
+                    f"Cannot receive from socket broker, retrying in {retry_sleep} secs: {e}"
+                )
+                self._close(reader)
+                await asyncio.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+
+
+class LocalPubSubManager(RelayManager):
+    """Pub/sub between servers in the same process"""
+    name = 'localpubsub'
+
+    # {channel: set of subscriber queues}, shared by every instance
+    channels = {}
+
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.queue = asyncio.Queue()
+        if not write_only:
+            self.channels.setdefault(channel, set()).add(self.queue)
+
+    async def _publish(self, data):
+        message = json.dumps(data)
+        for queue in self.channels.get(self.channel, ()):
+            queue.put_nowait(message)
+
+    async def _receive(self):
+        while True:
+            yield await self.queue.get()
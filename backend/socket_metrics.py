@@ -0,0 +1,155 @@
+"""
+Per-event metrics for Socket.IO handlers
+
+InstrumentedServerMixin wraps the dispatch of every event handler and
+records, per event name: calls, errors, a latency histogram, Mongo
+commands issued and packets sent to clients (fan-out).
+
+The stats for the running handler sit in a context variable, which asyncio
+tasks inherit and Motor copies onto its executor threads. That is how the
+Mongo command listener and the send path find which event to charge.
+
+Counters and histogram buckets are allocated once per registered event, so
+recording an event only increments integers.
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+# Upper bounds of the latency buckets in milliseconds; one more bucket catches the rest
+LATENCY_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+_LATENCY_BOUNDS = tuple(ms / 1000 for ms in LATENCY_BUCKETS_MS)
+
+# Fields the metrics endpoint can order events by
+SORT_FIELDS = ("calls", "errors", "total_ms", "mean_ms", "max_ms", "p99_ms", "mongo_calls", "fanout")
+
+# EventStats of the handler running in this context, if any
+current_event = ContextVar("socket_event_stats", default=None)
+
+
+class EventStats:
+    __slots__ = ("calls", "errors", "mongo_calls", "fanout", "seconds", "max_seconds", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.mongo_calls = 0
+        self.fanout = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(_LATENCY_BOUNDS) + 1)
+
+    def observe(self, seconds: float):
+        self.calls += 1
+        self.seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        self.buckets[bisect_left(_LATENCY_BOUNDS, seconds)] += 1
+
+    def percentile_ms(self, fraction: float):
+        """Upper bound of the bucket holding the given fraction of calls"""
+        if not self.calls:
+            return None
+        target = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return round(self.max_seconds * 1000, 3)
+
+    def to_dict(self) -> dict:
+        calls = self.calls or 1
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": round(self.seconds * 1000, 3),
+            "mean_ms": round(self.seconds * 1000 / calls, 3),
+            "max_ms": round(self.max_seconds * 1000, 3),
+            "p50_ms": self.percentile_ms(0.5),
+            "p99_ms": self.percentile_ms(0.99),
+            "mongo_calls": self.mongo_calls,
+            "mongo_calls_per_call": round(self.mongo_calls / calls, 2),
+            "fanout": self.fanout,
+            "fanout_per_call": round(self.fanout / calls, 2),
+            "buckets": dict(zip([str(ms) for ms in LATENCY_BUCKETS_MS] + ["inf"], self.buckets))
+        }
+
+
+class SocketMetrics:
+    def __init__(self):
+        self.events = {}  # {event: EventStats}
+        self.started_at = time.time()
+
+    def stats_for(self, event: str) -> EventStats:
+        stats = self.events.get(event)
+        if stats is None:
+            stats = self.events[event] = EventStats()
+        return stats
+
+    def snapshot(self, sort: str = "total_ms") -> dict:
+        events = {event: stats.to_dict() for event, stats in self.events.items()}
+        return {
+            "since": self.started_at,
+            "latency_buckets_ms": LATENCY_BUCKETS_MS,
+            "events": dict(sorted(events.items(), key=lambda item: item[1].get(sort) or 0, reverse=True))
+        }
+
+    def reset(self):
+        for stats in self.events.values():
+            stats.__init__()
+        self.started_at = time.time()
+
+
+class MongoCommandCounter(monitoring.CommandListener):
+    """Charges each Mongo command to the socket event that issued it"""
+
+    def started(self, event):
+        stats = current_event.get()
+        if stats is not None:
+            stats.mongo_calls += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class InstrumentedServerMixin:
+    """Mix in before the AsyncServer class; the stats are kept in self.metrics"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = SocketMetrics()
+
+    async def _trigger_event(self, event, namespace, *args):
+        if event not in self.handlers.get(namespace, ()):
+            return await super()._trigger_event(event, namespace, *args)
+
+        stats = self.metrics.stats_for(event)
+        token = current_event.set(stats)
+        started = time.perf_counter()
+        try:
+            return await super()._trigger_event(event, namespace, *args)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.observe(time.perf_counter() - started)
+            current_event.reset(token)
+
+    async def _send_packet(self, eio_sid, pkt):
+        stats = current_event.get()
+        if stats is not None:
+            stats.fanout += 1
+        await super()._send_packet(eio_sid, pkt)
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        stats = current_event.get()
+        if stats is not None:
+            stats.fanout += 1
+        await super()._send_eio_packet(eio_sid, eio_pkt)
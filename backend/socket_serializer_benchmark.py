@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the per-client Socket.IO serializers (socket_serializers.py)
+Broadcasts a chat message to one room of listeners and measures bytes put
+on the wire and CPU time per broadcast, for all-JSON, all-MessagePack and
+mixed rooms, against a loop that emits to each listener separately
+
+Nothing goes over a network: the Engine.IO send calls are replaced with
+counters, so the numbers cover serialization and fan-out only.
+
+Usage: python socket_serializer_benchmark.py [listeners] [broadcasts]
+"""
+
+import asyncio
+import sys
+import time
+
+from socket_serializers import NegotiatingAsyncServer, MsgPackPacket
+
+ROOM = "room_benchmark"
+
+
+def sample_message(i: int) -> dict:
+    """Shaped like the room_message payload in server.py"""
+    return {
+        "id": f"66f1c0ffee{i:014d}",
+        "room_id": "66f1c0ffee0000000000beef",
+        "user_id": "66f1c0ffee0000000000cafe",
+        "username": "steady_recovery",
+        "avatar_url": "https://cdn.example.com/avatars/66f1c0ffee0000000000cafe.png",
+        "content": "Day 42 without a bet. Logged the urge instead of acting on it, thanks all.",
+        "message_type": "text",
+        "created_at": "2026-10-19T12:00:00.000000",
+        "reactions": {"heart": 12, "clap": 4},
+        "reply_to": None
+    }
+
+
+async def build_server(listeners: int, msgpack_share: float):
+    """Server with `listeners` sockets in ROOM, the given share on MessagePack"""
+    sio = NegotiatingAsyncServer(async_mode="asgi")
+    wire = {"bytes": 0, "frames": 0}
+
+    async def send_packet(eio_sid, pkt):
+        wire["bytes"] += len(pkt.encode())
+        wire["frames"] += 1
+
+    async def send(eio_sid, data):
+        wire["bytes"] += len(data)
+        wire["frames"] += 1
+
+    sio.eio.send_packet = send_packet
+    sio.eio.send = send
+
+    sids = []
+    msgpack_count = int(listeners * msgpack_share)
+    for i in range(listeners):
+        eio_sid = f"eio{i}"
+        query = "serializer=msgpack" if i < msgpack_count else ""
+        await sio._handle_eio_connect(eio_sid, {"QUERY_STRING": query})
+        sid = await sio.manager.connect(eio_sid, "/")
+        await sio.enter_room(sid, ROOM)
+        sids.append(sid)
+    return sio, sids, wire
+
+
+async def measure(listeners: int, broadcasts: int, msgpack_share: float, per_socket: bool):
+    sio, sids, wire = await build_server(listeners, msgpack_share)
+    started = time.process_time()
+    for i in range(broadcasts):
+        if per_socket:
+            for sid in sids:
+                await sio.emit("room_message", sample_message(i), to=sid)
+        else:
+            await sio.emit("room_message", sample_message(i), room=ROOM)
+    cpu = time.process_time() - started
+    return wire["bytes"] / broadcasts, cpu / broadcasts, wire["frames"] / broadcasts
+
+
+def main():
+    listeners = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    broadcasts = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    cases = [("json", 0.0, False), ("json, per socket", 0.0, True)]
+    if MsgPackPacket is not None:
+        cases += [("msgpack", 1.0, False), ("msgpack, per socket", 1.0, True), ("50% msgpack", 0.5, False)]
+    else:
+        print("msgpack is not installed; only measuring JSON")
+
+    print(f"{listeners} listeners, {broadcasts} broadcasts")
+    print(f"{'case':<22}{'bytes/broadcast':>18}{'bytes/listener':>16}{'cpu ms/broadcast':>18}")
+    for name, share, per_socket in cases:
+        size, cpu, frames = asyncio.run(measure(listeners, broadcasts, share, per_socket))
+        print(f"{name:<22}{size:>18,.0f}{size / frames:>16,.1f}{cpu * 1000:>18,.2f}")
+
+
+if __name__ == "__main__":
+    main()
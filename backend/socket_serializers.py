@@ -0,0 +1,115 @@
+"""
+Per-client packet serializers for Socket.IO
+
+Socket.IO picks one packet serializer for the whole server. This server
+keeps JSON as the default and lets each client opt into MessagePack by
+connecting with ?serializer=msgpack (and socket.io-msgpack-parser on its
+side). Clients that don't ask keep using JSON.
+
+Broadcasts are still encoded once: the manager encodes an emit to JSON a
+single time for every recipient, and the first MessagePack recipient
+converts that packet and caches the result on it for the rest. Binary
+attachments are not converted; nothing emitted here carries raw bytes.
+
+MessagePack needs the optional msgpack package. Without it, connections
+that ask for MessagePack are rejected, so the client can reconnect with
+JSON.
+"""
+
+from urllib.parse import parse_qs
+
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+
+try:
+    from socketio.msgpack_packet import MsgPackPacket
+except ImportError:  # msgpack not installed
+    MsgPackPacket = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+# The msgpack parser has no separate binary packet types
+_MSGPACK_PACKET_TYPES = {packet.BINARY_EVENT: packet.EVENT, packet.BINARY_ACK: packet.ACK}
+
+
+def requested_serializer(environ) -> str:
+    """Serializer named in the connection's query string, JSON if none"""
+    query = parse_qs(environ.get("QUERY_STRING", ""))
+    return query.get("serializer", [JSON])[0].lower()
+
+
+def to_msgpack(pkt) -> bytes:
+    """Re-encode a decoded Socket.IO packet with MessagePack"""
+    return MsgPackPacket(
+        _MSGPACK_PACKET_TYPES.get(pkt.packet_type, pkt.packet_type),
+        data=pkt.data, namespace=pkt.namespace, id=pkt.id
+    ).encode()
+
+
+class NegotiatingAsyncServer(socketio.AsyncServer):
+    """AsyncServer that speaks JSON or MessagePack, chosen per connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Engine.IO sids of clients that negotiated MessagePack
+        self.msgpack_sids = set()
+        self.serializer_stats = {"json_connections": 0, "msgpack_connections": 0,
+                                 "msgpack_rejected": 0, "msgpack_conversions": 0}
+
+    async def _handle_eio_connect(self, eio_sid, environ):
+        serializer = requested_serializer(environ)
+        if serializer == MSGPACK:
+            if MsgPackPacket is None:
+                self.serializer_stats["msgpack_rejected"] += 1
+                self.logger.warning("Rejected MessagePack client: msgpack is not installed")
+                return False
+            self.msgpack_sids.add(eio_sid)
+            self.serializer_stats["msgpack_connections"] += 1
+        else:
+            self.serializer_stats["json_connections"] += 1
+        return await super()._handle_eio_connect(eio_sid, environ)
+
+    async def _handle_eio_disconnect(self, eio_sid, reason):
+        try:
+            await super()._handle_eio_disconnect(eio_sid, reason)
+        finally:
+            self.msgpack_sids.discard(eio_sid)
+
+    async def _handle_eio_message(self, eio_sid, data):
+        if eio_sid not in self.msgpack_sids:
+            return await super()._handle_eio_message(eio_sid, data)
+
+        pkt = MsgPackPacket(encoded_packet=data)
+        if pkt.packet_type == packet.CONNECT:
+            await self._handle_connect(eio_sid, pkt.namespace, pkt.data)
+        elif pkt.packet_type == packet.DISCONNECT:
+            await self._handle_disconnect(eio_sid, pkt.namespace, self.reason.CLIENT_DISCONNECT)
+        elif pkt.packet_type == packet.EVENT:
+            await self._handle_event(eio_sid, pkt.namespace, pkt.id, pkt.data)
+        elif pkt.packet_type == packet.ACK:
+            await self._handle_ack(eio_sid, pkt.namespace, pkt.id, pkt.data)
+        else:
+            raise ValueError("Unexpected MessagePack packet type.")
+
+    async def _send_packet(self, eio_sid, pkt):
+        # Direct sends: connect replies, acks and emits with a callback
+        if eio_sid in self.msgpack_sids:
+            await self.eio.send(eio_sid, to_msgpack(pkt))
+        else:
+            await super()._send_packet(eio_sid, pkt)
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        # Broadcasts: the manager hands every recipient the same JSON-encoded
+        # Engine.IO packet, so the MessagePack form is built once and kept on it
+        if eio_sid in self.msgpack_sids and isinstance(eio_pkt.data, str):
+            converted = getattr(eio_pkt, "msgpack_packet", None)
+            if converted is None:
+                converted = eio_packet.Packet(
+                    eio_packet.MESSAGE, to_msgpack(self.packet_class(encoded_packet=eio_pkt.data))
+                )
+                eio_pkt.msgpack_packet = converted
+                self.serializer_stats["msgpack_conversions"] += 1
+            eio_pkt = converted
+        await super()._send_eio_packet(eio_sid, eio_pkt)
@@ -24,11 +24,13 @@ import { WebView } from 'react-native-webview';
 import { colors } from '../../src/theme';
 import { useAuth } from '../../src/context/AuthContext';
 import { useBlocker } from '../../src/context/BlockerContext';
-import { socketService } from '../../src/services/socket';
+import { socketService, TypingUser } from '../../src/services/socket';
 import api from '../../src/services/api';
 import { contentService, ContentItem } from '../../src/services/contentService';
 
 const { width: SCREEN_WIDTH } = Dimensions.get('window');
+// Re-announce typing well inside the server's 5s expiry
+const TYPING_EMIT_INTERVAL_MS = 2000;
 
 // Avatar mappings
 const AVATAR_ICONS: { [key: string]: string } = {
@@ -803,6 +805,9 @@ export default function Tools() {
   const [selectedRoom, setSelectedRoom] = useState<string | null>(null);
   const [roomMessages, setRoomMessages] = useState<any[]>([]);
   const [roomUsers, setRoomUsers] = useState<string[]>([]);
+  const [roomTypers, setRoomTypers] = useState<TypingUser[]>([]);
+  // When this client last told the server it is typing; the server forgets after 5s
+  const lastTypingEmit = useRef(0);
   
   const ROOM_INFO = [
     { id: 'general', name: 'General Support', icon: 'people', color: '#00F5A0' },
@@ -830,12 +835,29 @@ export default function Tools() {
     setSelectedRoom(null);
     setRoomMessages([]);
     setRoomUsers([]);
+    setRoomTypers([]);
   };
 
   const sendRoomMessage = () => {
     if (!chatInput.trim() || !selectedRoom) return;
     socketService.sendRoomMessage(chatInput.trim());
     setChatInput('');
+    if (lastTypingEmit.current) {
+      socketService.emitTyping(false);
+      lastTypingEmit.current = 0;
+    }
+  };
+
+  const onRoomInputChange = (text: string) => {
+    setChatInput(text);
+    const now = Date.now();
+    if (text && now - lastTypingEmit.current >= TYPING_EMIT_INTERVAL_MS) {
+      socketService.emitTyping(true);
+      lastTypingEmit.current = now;
+    } else if (!text && lastTypingEmit.current) {
+      socketService.emitTyping(false);
+      lastTypingEmit.current = 0;
+    }
   };
 
   // Socket listeners for room
@@ -854,9 +876,16 @@ export default function Tools() {
       }
     });
     
+    const unsubTyping = socketService.onTypingUsers((data) => {
+      if (data.room_id === selectedRoom) {
+        setRoomTypers(data.users.filter(typer => typer.user_id !== user?._id));
+      }
+    });
+    
     return () => {
       unsubMessage();
       unsubUsers();
+      unsubTyping();
     };
   }, [selectedRoom]);
 
@@ -949,6 +978,16 @@ export default function Tools() {
           }
         />
         
+        {roomTypers.length > 0 && (
+          <Text style={styles.typingIndicator}>
+            {roomTypers.length === 1
+              ? `${roomTypers[0].username} is typing…`
+              : roomTypers.length === 2
+                ? `${roomTypers[0].username} and ${roomTypers[1].username} are typing…`
+                : 'Several people are typing…'}
+          </Text>
+        )}
+        
         {/* Input */}
         <View style={styles.chatInputContainer}>
           <TextInput
@@ -956,7 +995,7 @@ export default function Tools() {
             placeholder="Type a message..."
             placeholderTextColor={colors.textMuted}
             value={chatInput}
-            onChangeText={setChatInput}
+            onChangeText={onRoomInputChange}
             onSubmitEditing={sendRoomMessage}
           />
           <Pressable style={styles.sendButton} onPress={sendRoomMessage}>
@@ -1679,6 +1718,7 @@ const styles = StyleSheet.create({
   },
   chatHeaderCenter: { flex: 1, marginLeft: 8 },
   userCount: { fontSize: 12, color: colors.textMuted },
+  typingIndicator: { fontSize: 12, color: colors.textMuted, fontStyle: 'italic', paddingHorizontal: 16, paddingBottom: 4 },
   // Empty States
   emptyState: { alignItems: 'center', justifyContent: 'center', paddingVertical: 50, gap: 8 },
   emptyText: { fontSize: 15, fontWeight: '600', color: colors.textPrimary },
@@ -1,7 +1,15 @@
+import { AppState } from 'react-native';
 import { io, Socket } from 'socket.io-client';
 import storage from './storage';
 
 const SOCKET_URL = process.env.EXPO_PUBLIC_BACKEND_URL || '/api';
+// Well under the server's 120s idle threshold for showing a user as away
+const HEARTBEAT_INTERVAL_MS = 60000;
+
+export interface TypingUser {
+  user_id: string;
+  username: string;
+}
 
 // Available chat rooms
 export const CHAT_ROOMS = [
@@ -18,6 +26,9 @@ class SocketService {
   private currentRoom: string | null = null;
   private connectionAttempted: boolean = false;
   private silentMode: boolean = true; // Never show errors to users
+  private heartbeatTimer: ReturnType<typeof setInterval> | null = null;
+  // Sockets shown as typing: {socket room: {typing key: user}}
+  private typers: Map<string, Map<string, TypingUser>> = new Map();
 
   async connect(userId?: string) {
     // Don't reconnect if already connected or connection failed
@@ -52,6 +63,7 @@ class SocketService {
 
       this.socket.on('authenticated', (data) => {
         if (!this.silentMode) console.log('Socket authenticated');
+        this.startHeartbeat();
       });
 
       // SILENT error handling - never show to users
@@ -62,6 +74,8 @@ class SocketService {
 
       this.socket.on('disconnect', () => {
         if (!this.silentMode) console.log('Socket disconnected');
+        // Typing updates missed while disconnected would leave stale entries
+        Array.from(this.typers.keys()).forEach(room => this.clearTypers(room));
       });
 
       // Group chat events
@@ -70,6 +84,12 @@ class SocketService {
         callbacks.forEach(cb => cb(data));
       });
 
+      // Bursts arrive batched; deliver each message as if sent on its own
+      this.socket.on('room_messages', (data) => {
+        const callbacks = this.listeners.get('room_message') || [];
+        data.messages.forEach((message: any) => callbacks.forEach(cb => cb(message)));
+      });
+
       this.socket.on('room_users', (data) => {
         const callbacks = this.listeners.get('room_users') || [];
         callbacks.forEach(cb => cb(data));
@@ -85,17 +105,66 @@ class SocketService {
         callbacks.forEach(cb => cb(data));
       });
 
+      // Typing arrives as per-socket deltas; a snapshot is sent after joining
+      this.socket.on('typing_users', (data) => {
+        const typers = this.typers.get(data.room) || new Map<string, TypingUser>();
+        (data.stopped || []).forEach((key: string) => typers.delete(key));
+        (data.started || []).forEach((entry: any) => {
+          typers.set(entry.key, { user_id: entry.user_id, username: entry.username });
+        });
+        this.typers.set(data.room, typers);
+        this.notifyTypers(data.room);
+      });
+
     } catch (error) {
       // Silently fail - app continues without sockets
       this.socket = null;
     }
   }
 
+  // Keeps the user shown as online while the app is in the foreground
+  private startHeartbeat() {
+    this.stopHeartbeat();
+    this.heartbeatTimer = setInterval(() => {
+      if (this.socket?.connected && AppState.currentState === 'active') {
+        this.socket.emit('heartbeat', {});
+      }
+    }, HEARTBEAT_INTERVAL_MS);
+  }
+
+  private stopHeartbeat() {
+    if (this.heartbeatTimer) {
+      clearInterval(this.heartbeatTimer);
+      this.heartbeatTimer = null;
+    }
+  }
+
+  // Users typing in a socket room, once each however many devices they type from
+  private typingUsers(room: string): TypingUser[] {
+    const users = new Map<string, TypingUser>();
+    (this.typers.get(room) || new Map()).forEach(user => users.set(user.user_id, user));
+    return Array.from(users.values());
+  }
+
+  private notifyTypers(room: string) {
+    const callbacks = this.listeners.get('typing_users') || [];
+    const roomId = room.startsWith('room_') ? room.slice('room_'.length) : room;
+    const users = this.typingUsers(room);
+    callbacks.forEach(cb => cb({ room_id: roomId, users }));
+  }
+
+  private clearTypers(room: string) {
+    if (!this.typers.delete(room)) return;
+    this.notifyTypers(room);
+  }
+
   disconnect() {
+    this.stopHeartbeat();
     if (this.socket) {
       this.socket.disconnect();
       this.socket = null;
       this.listeners.clear();
+      this.typers.clear();
       this.currentRoom = null;
     }
     this.connectionAttempted = false;
@@ -108,6 +177,7 @@ class SocketService {
     // Leave current room first
     if (this.currentRoom) {
       this.socket.emit('leave_room', { room_id: this.currentRoom });
+      this.clearTypers(`room_${this.currentRoom}`);
     }
     
     this.currentRoom = roomId;
@@ -118,6 +188,7 @@ class SocketService {
   leaveRoom() {
     if (!this.socket?.connected || !this.currentRoom) return;
     this.socket.emit('leave_room', { room_id: this.currentRoom });
+    this.clearTypers(`room_${this.currentRoom}`);
     this.currentRoom = null;
   }
 
@@ -156,6 +227,20 @@ class SocketService {
     };
   }
 
+  // Called with { room_id, users } whenever who is typing in a room changes
+  onTypingUsers(callback: (data: { room_id: string; users: TypingUser[] }) => void) {
+    if (!this.listeners.has('typing_users')) {
+      this.listeners.set('typing_users', []);
+    }
+    this.listeners.get('typing_users')?.push(callback);
+    
+    return () => {
+      const callbacks = this.listeners.get('typing_users') || [];
+      const index = callbacks.indexOf(callback);
+      if (index > -1) callbacks.splice(index, 1);
+    };
+  }
+
   onUserJoinedRoom(callback: (data: any) => void) {
     if (!this.listeners.has('user_joined_room')) {
       this.listeners.set('user_joined_room', []);
@@ -203,9 +288,10 @@ class SocketService {
     };
   }
 
-  emitTyping() {
+  // Typing in the current chat room, or the community chat outside one
+  emitTyping(typing: boolean = true) {
     if (!this.socket?.connected) return;
-    this.socket.emit('typing', {});
+    this.socket.emit('typing', { room_id: this.currentRoom, typing });
   }
 
   isConnected(): boolean {
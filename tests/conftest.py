@@ -0,0 +1,43 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend is a flat set of modules, not a package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture
+def emits(monkeypatch):
+    """Records sio.emit calls as (event, data, room) instead of sending them"""
+    import server
+
+    sent = []
+
+    async def emit(event, data=None, to=None, room=None, **kwargs):
+        sent.append((event, data, to or room))
+
+    monkeypatch.setattr(server.sio, "emit", emit)
+    return sent
+
+
+@pytest.fixture
+def chat_db(monkeypatch):
+    """Fake chat collections, reachable both as module globals and through db[name]"""
+    import server
+    from tests.fakes import FakeCollection
+
+    collections = {
+        name: FakeCollection(name=name)
+        for name in ("messages", "chat_messages", "reactions", "settings")
+    }
+    monkeypatch.setattr(server, "db", collections)
+    monkeypatch.setattr(server, "messages_collection", collections["messages"])
+    monkeypatch.setattr(server, "chat_messages_collection", collections["chat_messages"])
+    monkeypatch.setattr(server, "reactions_collection", collections["reactions"])
+    monkeypatch.setattr(server, "settings_collection", collections["settings"])
+    monkeypatch.setattr(server, "message_buffers", {})
+    monkeypatch.setattr(server, "message_flush_lock", asyncio.Lock())
+    monkeypatch.setattr(server, "message_write_stats", dict(server.message_write_stats, buffered=0))
+    return collections
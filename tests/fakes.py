@@ -0,0 +1,250 @@
+"""
+In-memory stand-ins for the Motor collections server.py uses
+
+Only the query and update operators the server actually sends are
+supported; anything else raises, so a test never passes by accident.
+"""
+
+import copy
+from datetime import datetime
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+_MISSING = object()
+
+
+def _get(doc, path):
+    value = doc
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return _MISSING
+        value = value[key]
+    return value
+
+
+def _set(doc, path, value):
+    *parents, last = path.split(".")
+    for key in parents:
+        doc = doc.setdefault(key, {})
+    doc[last] = value
+
+
+def _unset(doc, path):
+    *parents, last = path.split(".")
+    for key in parents:
+        doc = doc.get(key, {})
+    doc.pop(last, None)
+
+
+def _compare(value, op, arg):
+    if op == "$ne":
+        return value is _MISSING or value != arg and not (isinstance(value, list) and arg in value)
+    if op == "$in":
+        return value is not _MISSING and (
+            value in arg or isinstance(value, list) and any(v in arg for v in value)
+        )
+    if op == "$nin":
+        return not _compare(value, "$in", arg)
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op == "$type":
+        return arg == "date" and isinstance(value, datetime)
+    if value is _MISSING or value is None:
+        return False
+    if op == "$lt":
+        return value < arg
+    if op == "$lte":
+        return value <= arg
+    if op == "$gt":
+        return value > arg
+    if op == "$gte":
+        return value >= arg
+    raise NotImplementedError(op)
+
+
+def matches(doc, query) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if not all(_compare(value, op, arg) for op, arg in condition.items()):
+                return False
+        elif isinstance(value, list) and not isinstance(condition, list):
+            if condition not in value:
+                return False
+        elif (None if value is _MISSING else value) != condition:
+            return False
+    return True
+
+
+def apply_update(doc, update, inserting=False):
+    for op, fields in update.items():
+        for path, arg in fields.items():
+            if op == "$set":
+                _set(doc, path, copy.deepcopy(arg))
+            elif op == "$setOnInsert":
+                if inserting:
+                    _set(doc, path, copy.deepcopy(arg))
+            elif op == "$inc":
+                current = _get(doc, path)
+                _set(doc, path, (0 if current is _MISSING else current) + arg)
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$addToSet":
+                current = _get(doc, path)
+                current = [] if current is _MISSING else current
+                if arg not in current:
+                    current.append(arg)
+                _set(doc, path, current)
+            elif op == "$pull":
+                current = _get(doc, path)
+                if current is not _MISSING:
+                    _set(doc, path, [v for v in current if v != arg])
+            else:
+                raise NotImplementedError(op)
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    if all(not v for k, v in projection.items() if k != "_id"):
+        return {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, 1)}
+    keep = {k for k, v in projection.items() if v}
+    if projection.get("_id", 1):
+        keep.add("_id")
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k in keep}
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self.docs.sort(key=lambda d: (_get(d, field) is _MISSING, _get(d, field)), reverse=order < 0)
+        return self
+
+    def limit(self, n):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs[:length] if length else list(self.docs)
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, docs=(), name="fake"):
+        self.name = name
+        self.docs = [copy.deepcopy(d) for d in docs]
+        self.calls = []  # (method, query) in call order
+
+    def _matching(self, query):
+        return [d for d in self.docs if matches(d, query or {})]
+
+    def find(self, query=None, projection=None):
+        self.calls.append(("find", query))
+        return FakeCursor([_project(d, projection) for d in self._matching(query)])
+
+    async def find_one(self, query=None, projection=None):
+        self.calls.append(("find_one", query))
+        found = self._matching(query)
+        return _project(found[0], projection) if found else None
+
+    async def count_documents(self, query):
+        self.calls.append(("count_documents", query))
+        return len(self._matching(query))
+
+    async def insert_one(self, doc):
+        self.calls.append(("insert_one", doc))
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        self.calls.append(("insert_many", docs))
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_ids=[d["_id"] for d in docs])
+
+    async def update_one(self, query, update, upsert=False):
+        self.calls.append(("update_one", query))
+        found = self._matching(query)
+        if found:
+            apply_update(found[0], update)
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            apply_update(doc, update, inserting=True)
+            doc.setdefault("_id", ObjectId())
+            self.docs.append(doc)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query, update):
+        self.calls.append(("update_many", query))
+        found = self._matching(query)
+        for doc in found:
+            apply_update(doc, update)
+        return SimpleNamespace(matched_count=len(found), modified_count=len(found))
+
+    async def bulk_write(self, requests, ordered=True):
+        self.calls.append(("bulk_write", requests))
+        for request in requests:
+            if not isinstance(request, UpdateOne):
+                raise NotImplementedError(type(request).__name__)
+            await self.update_one(request._filter, request._doc, upsert=request._upsert)
+        return SimpleNamespace(matched_count=len(requests))
+
+    async def find_one_and_update(self, query, update, projection=None,
+                                  return_document=ReturnDocument.BEFORE, upsert=False):
+        self.calls.append(("find_one_and_update", query))
+        found = self._matching(query)
+        if not found:
+            return None
+        before = _project(found[0], projection)
+        apply_update(found[0], update)
+        return _project(found[0], projection) if return_document else before
+
+    async def find_one_and_delete(self, query, projection=None):
+        self.calls.append(("find_one_and_delete", query))
+        found = self._matching(query)
+        if not found:
+            return None
+        self.docs.remove(found[0])
+        return _project(found[0], projection)
+
+    async def delete_one(self, query):
+        self.calls.append(("delete_one", query))
+        found = self._matching(query)
+        if found:
+            self.docs.remove(found[0])
+        return SimpleNamespace(deleted_count=len(found[:1]))
+
+    async def delete_many(self, query):
+        self.calls.append(("delete_many", query))
+        found = self._matching(query)
+        for doc in found:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=len(found))
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+import server
+from server import ADMIN_STATS_ID, claim_admin_stats_reconcile, reconcile_admin_stats
+from tests.fakes import FakeCollection
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    users = FakeCollection([
+        {"subscription_status": "active"}, {"is_blocked": True}, {}, {}
+    ])
+    settings = FakeCollection([
+        {"_id": ADMIN_STATS_ID, "total_users": 7, "active_subscriptions": 1, "blocked_users": 1}
+    ])
+    monkeypatch.setattr(server, "users_collection", users)
+    monkeypatch.setattr(server, "messages_collection", FakeCollection([{}, {}]))
+    monkeypatch.setattr(server, "settings_collection", settings)
+    return settings
+
+
+def counters(settings):
+    doc = settings.docs[0]
+    return {field: doc.get(field) for field in server.ADMIN_STATS_FIELDS}
+
+
+def test_reconcile_corrects_drift(stats):
+    asyncio.run(reconcile_admin_stats())
+    assert counters(stats) == {"total_users": 4, "active_subscriptions": 1, "blocked_users": 1, "total_messages": 2}
+    assert stats.docs[0]["reconciled_at"] is not None
+
+
+def test_reconcile_keeps_increments_made_while_counting(stats, monkeypatch):
+    users = server.users_collection
+    count_documents = users.count_documents
+    bumped = []
+
+    async def count_with_signup(query):
+        count = await count_documents(query)
+        if query == {} and not bumped:
+            # A registration lands between the count and the correction
+            bumped.append(True)
+            await users.insert_one({})
+            await server.bump_admin_stats(total_users=1)
+        return count
+
+    monkeypatch.setattr(users, "count_documents", count_with_signup)
+    asyncio.run(reconcile_admin_stats())
+    assert counters(stats)["total_users"] == 5
+
+
+def test_one_worker_claims_each_interval(stats):
+    async def run():
+        return [await claim_admin_stats_reconcile() for _ in range(3)]
+
+    assert asyncio.run(run()) == [True, False, False]
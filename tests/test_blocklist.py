@@ -0,0 +1,146 @@
+from collections import OrderedDict
+
+import pytest
+
+import server
+from server import DomainMatcher, blocklist_diff, etag_matches, get_user_matcher, parse_blocklist_entry, preferred_encoding
+
+
+@pytest.fixture
+def matcher():
+    return DomainMatcher(["draftkings.com", "https://www.fanduel.com/", "*.bet365.com", "yahoo.com/fantasy"])
+
+
+def test_matches_exact_host_and_subdomains(matcher):
+    assert matcher.match_host("draftkings.com") == "draftkings.com"
+    assert matcher.match_host("sportsbook.draftkings.com") == "draftkings.com"
+    assert matcher.match("https://fanduel.com/casino?x=1") == "fanduel.com"
+    assert matcher.match("bet365.com") == "bet365.com"
+
+
+def test_does_not_match_unrelated_hosts(matcher):
+    assert matcher.match_host("notdraftkings.com") is None
+    assert matcher.match_host("draftkings.com.evil.org") is None
+    assert matcher.match_host("com") is None
+    assert matcher.match("") is None
+
+
+def test_path_rules_match_only_their_prefix(matcher):
+    assert matcher.match("https://yahoo.com/fantasy") == "yahoo.com/fantasy"
+    assert matcher.match("yahoo.com/fantasy/football") == "yahoo.com/fantasy"
+    assert matcher.match("yahoo.com/fantasyland") is None
+    assert matcher.match("yahoo.com/mail") is None
+
+
+def test_duplicate_entries_count_once():
+    assert DomainMatcher(["a.com", "www.a.com", "A.COM/"]).size == 1
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("DraftKings.com", ("draftkings.com", "")),
+    ("https://www.fanduel.com/", ("fanduel.com", "")),
+    ("houseof fun.com", ("houseoffun.com", "")),
+    ("yahoo.com/fantasy/", ("yahoo.com", "/fantasy")),
+    ("'betmgm.com'", ("betmgm.com", "")),
+])
+def test_parse_blocklist_entry(raw, expected):
+    assert parse_blocklist_entry(raw) == expected
+
+
+@pytest.mark.parametrize("raw", ["", "localhost", "not a domain", "exa$mple.com", "/path-only"])
+def test_parse_blocklist_entry_rejects_invalid(raw):
+    assert parse_blocklist_entry(raw) is None
+
+
+@pytest.fixture
+def changelog(monkeypatch):
+    cache = dict(server.blocklist_cache)
+    cache["version"] = 5
+    cache["changes"] = [
+        (3, ["a.com", "b.com"], []),
+        (4, ["c.com"], ["a.com"]),
+        (5, ["a.com"], ["c.com", "old.com"]),
+    ]
+    monkeypatch.setattr(server, "blocklist_cache", cache)
+
+
+def test_blocklist_diff_nets_out_changes(changelog):
+    assert blocklist_diff(2) == (["a.com", "b.com"], ["old.com"])
+    assert blocklist_diff(3) == ([], ["old.com"])
+    assert blocklist_diff(4) == (["a.com"], ["c.com", "old.com"])
+    assert blocklist_diff(5) == ([], [])
+
+
+def test_blocklist_diff_needs_full_list_outside_changelog(changelog):
+    assert blocklist_diff(1) is None
+    assert blocklist_diff(6) is None
+    assert blocklist_diff(-1) is None
+
+
+@pytest.mark.parametrize("header, expected", [
+    ('"bl-5-1"', True),
+    ('W/"bl-5-1"', True),
+    ('"bl-4-1", "bl-5-1"', True),
+    ('"bl-4-1",W/"bl-5-1"', True),
+    ("*", True),
+    ('"bl-5-10"', False),
+    ('"bl-5-1-locked"', False),
+    ("bl-5-1", False),
+    ("", False),
+    (None, False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"bl-5-1"') is expected
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, deflate, br", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("gzip;q=0.5, br;q=0.9", "br"),
+    ("br;q=0.1, gzip;q=0.8", "gzip"),
+    ("*;q=0.2, br;q=0", "gzip"),
+    ("identity", "identity"),
+    ("", "identity"),
+])
+def test_preferred_encoding(accept, expected):
+    assert preferred_encoding(accept) == expected
+
+
+@pytest.fixture
+def global_list(monkeypatch):
+    cache = dict(server.blocklist_cache)
+    cache["matcher"] = DomainMatcher(["draftkings.com", "live.draftkings.com", "yahoo.com/fantasy"])
+    monkeypatch.setattr(server, "blocklist_cache", cache)
+    monkeypatch.setattr(server, "user_matcher_cache", OrderedDict())
+    return cache
+
+
+def overlay_user(**fields):
+    return {"_id": "u1", "blocklist_overlay_version": 1, **fields}
+
+
+def test_overlay_adds_user_entries_on_top_of_the_global_list(global_list):
+    matcher = get_user_matcher(overlay_user(blocklist_additions=["stake.com"]))
+    assert matcher.match("https://stake.com/casino") == "stake.com"
+    assert matcher.match("draftkings.com") == "draftkings.com"
+    assert matcher.match("example.com") is None
+
+
+def test_overlay_removals_skip_only_the_removed_rule(global_list):
+    matcher = get_user_matcher(overlay_user(blocklist_removals=["draftkings.com", "yahoo.com/fantasy"]))
+    assert matcher.match("draftkings.com") is None
+    assert matcher.match("live.draftkings.com") == "live.draftkings.com"
+    assert matcher.match("yahoo.com/fantasy") is None
+
+
+def test_overlay_removals_are_frozen_while_locked(global_list):
+    user = overlay_user(blocklist_removals=["draftkings.com"], recovery_mode_enabled=True)
+    assert get_user_matcher(user).match("draftkings.com") == "draftkings.com"
+
+
+def test_overlay_follows_global_list_changes_without_rebuild(global_list):
+    matcher = get_user_matcher(overlay_user(blocklist_additions=["stake.com"]))
+    global_list["matcher"] = DomainMatcher(["fanduel.com"])
+    assert get_user_matcher(overlay_user(blocklist_additions=["stake.com"])) is matcher
+    assert matcher.match("fanduel.com") == "fanduel.com"
+    assert matcher.match("draftkings.com") is None
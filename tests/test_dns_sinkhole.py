@@ -0,0 +1,135 @@
+import socket
+import struct
+
+import pytest
+
+from dns_sinkhole import (
+    FORWARD, QTYPE_A, QTYPE_AAAA, RCODE_FORMERR, RCODE_REFUSED, SINKHOLE_TTL,
+    DNSSinkholeProtocol, _UpstreamProtocol, build_error, build_sinkhole, parse_query,
+)
+
+IPV4 = socket.inet_pton(socket.AF_INET, "0.0.0.0")
+IPV6 = socket.inet_pton(socket.AF_INET6, "::")
+
+
+def build_query(qid: int, name: str, qtype: int = QTYPE_A, flags: int = 0x0100) -> bytes:
+    question = b"".join(bytes([len(label)]) + label.encode() for label in name.split(".")) + b"\x00"
+    return struct.pack("!HHHHHH", qid, flags, 1, 0, 0, 0) + question + struct.pack("!HH", qtype, 1)
+
+
+def test_parse_query():
+    data = build_query(0x1234, "WWW.DraftKings.com", QTYPE_AAAA)
+    assert parse_query(data) == (0x1234, 0x0100, "www.draftkings.com", QTYPE_AAAA, len(data))
+
+
+@pytest.mark.parametrize("data", [
+    b"\x00" * 11,  # shorter than a header
+    build_query(1, "a.com", flags=0x8100),  # a response, not a query
+    struct.pack("!HHHHHH", 1, 0x0100, 2, 0, 0, 0) + b"\x00" + b"\x00\x01\x00\x01",  # two questions
+    build_query(1, "a.com")[:-3],  # truncated question
+    struct.pack("!HHHHHH", 1, 0x0100, 1, 0, 0, 0) + b"\xc0\x0c\x00\x01\x00\x01",  # compression pointer
+])
+def test_parse_query_rejects_malformed(data):
+    assert parse_query(data) is None
+
+
+def test_build_error_echoes_question_with_rcode():
+    data = build_query(7, "casino.bet")
+    _, _, _, _, question_end = parse_query(data)
+    reply = build_error(data, question_end, RCODE_REFUSED)
+    qid, flags, qdcount, ancount = struct.unpack_from("!HHHH", reply)
+    assert (qid, qdcount, ancount) == (7, 1, 0)
+    assert flags & 0x8000 and flags & 0x0100  # response, recursion desired kept
+    assert flags & 0x000F == RCODE_REFUSED
+    assert reply[12:] == data[12:]
+
+
+def test_build_error_without_question():
+    reply = build_error(build_query(9, "a.com"), 12, RCODE_FORMERR)
+    assert struct.unpack_from("!HHH", reply)[2] == 0
+    assert len(reply) == 12
+
+
+@pytest.mark.parametrize("qtype, rdata", [(QTYPE_A, IPV4), (QTYPE_AAAA, IPV6)])
+def test_build_sinkhole_answers_address(qtype, rdata):
+    data = build_query(42, "casino.bet", qtype)
+    _, _, _, _, question_end = parse_query(data)
+    reply = build_sinkhole(data, question_end, qtype, IPV4, IPV6)
+    qid, flags, qdcount, ancount = struct.unpack_from("!HHHH", reply)
+    assert (qid, qdcount, ancount) == (42, 1, 1)
+    assert flags & 0x000F == 0
+    name_ptr, rtype, rclass, ttl, rdlength = struct.unpack_from("!HHHIH", reply, question_end)
+    assert (name_ptr, rtype, rclass, ttl, rdlength) == (0xC00C, qtype, 1, SINKHOLE_TTL, len(rdata))
+    assert reply[question_end + 12:] == rdata
+
+
+def test_build_sinkhole_nodata_for_other_types():
+    data = build_query(3, "casino.bet", qtype=16)  # TXT
+    _, _, _, _, question_end = parse_query(data)
+    reply = build_sinkhole(data, question_end, 16, IPV4, IPV6)
+    assert struct.unpack_from("!HHHH", reply)[3] == 0
+    assert len(reply) == question_end
+
+
+class FakeTransport:
+    def __init__(self, peer=None):
+        self.sent = []
+        self.peer = peer
+
+    def sendto(self, data, addr=None):
+        self.sent.append((data, addr))
+
+    def get_extra_info(self, name):
+        return self.peer
+
+
+@pytest.fixture
+def forwarder():
+    protocol = DNSSinkholeProtocol(lambda client_ip, qname: FORWARD)
+    protocol.connection_made(FakeTransport())
+    protocol.upstream = FakeTransport()
+    return protocol
+
+
+def answer_for(query: bytes, qid: int) -> bytes:
+    return struct.pack("!HHHHHH", qid, 0x8180, 1, 1, 0, 0) + query[12:] + b"answer"
+
+
+def test_forwarded_ids_are_random(forwarder):
+    for i in range(50):
+        forwarder.datagram_received(build_query(i, f"site{i}.com"), ("10.0.0.2", 5000))
+    ids = [struct.unpack_from("!H", data)[0] for data, _ in forwarder.upstream.sent]
+    assert len(set(ids)) == 50
+    assert ids != sorted(ids)
+
+
+def test_upstream_answer_is_relayed_with_the_client_id(forwarder):
+    query = build_query(0x4242, "example.com")
+    forwarder.datagram_received(query, ("10.0.0.2", 5000))
+    upstream_query = forwarder.upstream.sent[0][0]
+    forwarder.upstream_response(answer_for(upstream_query, struct.unpack_from("!H", upstream_query)[0]))
+    reply, addr = forwarder.transport.sent[0]
+    assert addr == ("10.0.0.2", 5000)
+    assert struct.unpack_from("!H", reply)[0] == 0x4242
+    assert not forwarder.pending
+
+
+def test_upstream_answer_for_another_question_is_dropped(forwarder):
+    forwarder.datagram_received(build_query(1, "example.com"), ("10.0.0.2", 5000))
+    upstream_id = struct.unpack_from("!H", forwarder.upstream.sent[0][0])[0]
+    forwarder.upstream_response(answer_for(build_query(0, "evil.com"), upstream_id))
+    assert forwarder.transport.sent == []
+    assert upstream_id in forwarder.pending
+    assert forwarder.stats["mismatched"] == 1
+
+
+def test_only_the_upstream_address_may_answer(forwarder):
+    forwarder.datagram_received(build_query(1, "example.com"), ("10.0.0.2", 5000))
+    upstream_query = forwarder.upstream.sent[0][0]
+    relay = _UpstreamProtocol(forwarder)
+    relay.connection_made(FakeTransport(peer=("1.1.1.1", 53)))
+    answer = answer_for(upstream_query, struct.unpack_from("!H", upstream_query)[0])
+    relay.datagram_received(answer, ("6.6.6.6", 53))
+    assert forwarder.transport.sent == []
+    relay.datagram_received(answer, ("1.1.1.1", 53))
+    assert len(forwarder.transport.sent) == 1
@@ -0,0 +1,34 @@
+import pytest
+
+from server import HyperLogLog
+
+
+def test_empty_sketch_estimates_zero():
+    assert HyperLogLog.estimate(HyperLogLog().nonzero()) == 0
+
+
+def test_duplicates_do_not_count():
+    hll = HyperLogLog()
+    for _ in range(100):
+        hll.add("user-1")
+    assert HyperLogLog.estimate(hll.nonzero()) == 1
+
+
+@pytest.mark.parametrize("n", [10, 200, 5000, 50000])
+def test_estimate_within_error_bound(n):
+    hll = HyperLogLog()
+    for i in range(n):
+        hll.add(f"user-{i}")
+    # Standard error is 1.04 / sqrt(256), about 6.5%; allow three of them
+    assert abs(HyperLogLog.estimate(hll.nonzero()) - n) <= max(2, 0.2 * n)
+
+
+def test_merging_registers_with_max_counts_the_union():
+    a, b = HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        a.add(f"user-{i}")
+    for i in range(2000, 5000):
+        b.add(f"user-{i}")
+    merged = {i: max(a.registers[i], b.registers[i]) for i in range(HyperLogLog.M)}
+    merged = {str(i): r for i, r in merged.items() if r}
+    assert abs(HyperLogLog.estimate(merged) - 5000) <= 1000
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+import server
+from server import apply_live_move, evict_live_board, get_live_board, update_live_board
+
+GAME_ID = "66f1c0ffee0000000000beef"
+
+
+def board_with(moves):
+    return {"fen": f"fen-{len(moves)}", "moves": list(moves), "white": {}, "black": {}, "status": "active"}
+
+
+def move(number, uci):
+    return {"game_id": GAME_ID, "move": uci, "fen": f"fen-{number}", "move_number": number}
+
+
+@pytest.fixture
+def slow_loader(monkeypatch):
+    """Patches the Mongo load with one that waits until released"""
+    monkeypatch.setattr(server, "live_boards", {})
+    monkeypatch.setattr(server, "live_board_loads", {})
+    monkeypatch.setattr(server, "live_spectators", {})
+    state = {"loads": 0, "release": None, "board": board_with(["e2e4", "e7e5"])}
+
+    async def load_live_board(game_id):
+        state["loads"] += 1
+        await state["release"].wait()
+        return {**state["board"], "moves": list(state["board"]["moves"])}
+
+    monkeypatch.setattr(server, "load_live_board", load_live_board)
+    return state
+
+
+def test_apply_live_move_in_order():
+    board = board_with(["e2e4"])
+    assert apply_live_move(board, move(1, "e2e4"))
+    assert apply_live_move(board, move(2, "e7e5"))
+    assert board["moves"] == ["e2e4", "e7e5"] and board["fen"] == "fen-2"
+    assert not apply_live_move(board, move(4, "d2d4"))
+
+
+def test_concurrent_readers_share_one_load(slow_loader):
+    async def run():
+        slow_loader["release"] = asyncio.Event()
+        readers = [asyncio.ensure_future(get_live_board(GAME_ID)) for _ in range(3)]
+        await asyncio.sleep(0)
+        slow_loader["release"].set()
+        return await asyncio.gather(*readers)
+
+    boards = asyncio.run(run())
+    assert slow_loader["loads"] == 1
+    assert boards[0] is boards[1] is boards[2] is server.live_boards[GAME_ID]
+    assert server.live_board_loads == {}
+
+
+def test_move_published_during_load_is_kept(slow_loader):
+    async def run():
+        slow_loader["release"] = asyncio.Event()
+        reader = asyncio.ensure_future(get_live_board(GAME_ID))
+        await asyncio.sleep(0)
+        update_live_board(move(3, "g1f3"))
+        slow_loader["release"].set()
+        return await reader
+
+    board = asyncio.run(run())
+    assert board["moves"] == ["e2e4", "e7e5", "g1f3"]
+    assert server.live_boards[GAME_ID]["fen"] == "fen-3"
+
+
+def test_game_over_during_load_is_not_cached(slow_loader):
+    async def run():
+        slow_loader["release"] = asyncio.Event()
+        reader = asyncio.ensure_future(get_live_board(GAME_ID))
+        await asyncio.sleep(0)
+        evict_live_board(GAME_ID)
+        slow_loader["release"].set()
+        return await reader
+
+    assert asyncio.run(run()) is not None
+    assert GAME_ID not in server.live_boards
+    assert server.live_board_loads == {}
+
+
+def test_missed_move_evicts_the_cached_board(slow_loader):
+    server.live_boards[GAME_ID] = board_with(["e2e4"])
+    update_live_board(move(3, "g1f3"))
+    assert GAME_ID not in server.live_boards
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+import server
+from server import flush_messages, persist_message
+
+
+@pytest.fixture
+def buffered(chat_db, monkeypatch):
+    monkeypatch.setattr(server, "MESSAGE_DURABILITY", "buffered")
+    monkeypatch.setattr(server, "MESSAGE_FLUSH_BATCH_SIZE", 2)
+    return chat_db
+
+
+@pytest.fixture
+def bumps(monkeypatch):
+    """Admin counter deltas applied by the flushes"""
+    applied = []
+
+    async def bump_admin_stats(**deltas):
+        applied.append(deltas)
+
+    monkeypatch.setattr(server, "bump_admin_stats", bump_admin_stats)
+    return applied
+
+
+def buffer_messages(collection, count):
+    async def run():
+        return [await persist_message(collection, {"content": f"m{i}"}) for i in range(count)]
+
+    return asyncio.run(run())
+
+
+def test_messages_wait_in_the_buffer_until_flushed(buffered, bumps):
+    ids = buffer_messages(buffered["messages"], 3)
+
+    assert buffered["messages"].docs == []
+    assert server.message_write_stats["buffered"] == 3
+
+    assert asyncio.run(flush_messages())
+    assert [doc["_id"] for doc in buffered["messages"].docs] == ids
+    assert [method for method, _ in buffered["messages"].calls] == ["insert_many", "insert_many"]
+    assert server.message_write_stats["buffered"] == 0
+    assert bumps == [{"total_messages": 2}, {"total_messages": 1}]
+
+
+def test_sync_durability_writes_before_returning(buffered, bumps, monkeypatch):
+    monkeypatch.setattr(server, "MESSAGE_DURABILITY", "sync")
+    ids = buffer_messages(buffered["chat_messages"], 1)
+    assert [doc["_id"] for doc in buffered["chat_messages"].docs] == ids
+    assert server.message_buffers == {}
+
+
+def test_failed_batch_is_requeued_in_order(buffered, bumps, monkeypatch):
+    ids = buffer_messages(buffered["messages"], 5)
+    collection = buffered["messages"]
+    real_insert_many = collection.insert_many
+    failures = [RuntimeError("not primary")]
+
+    async def insert_many(docs, ordered=True):
+        # The second batch fails once
+        if len(collection.docs) == 2 and failures:
+            raise failures.pop()
+        return await real_insert_many(docs, ordered=ordered)
+
+    monkeypatch.setattr(collection, "insert_many", insert_many)
+
+    assert not asyncio.run(flush_messages())
+    assert [doc["_id"] for doc in collection.docs] == ids[:2]
+    assert [doc["_id"] for doc in server.message_buffers["messages"]] == ids[2:]
+    assert server.message_write_stats["requeued"] == 3
+    assert server.message_write_stats["buffered"] == 3
+
+    # Rows buffered meanwhile stay behind the requeued ones
+    later = buffer_messages(collection, 1)
+    assert asyncio.run(flush_messages())
+    assert [doc["_id"] for doc in collection.docs] == ids + later
+    assert server.message_write_stats["buffered"] == 0
+
+
+def test_rows_already_written_are_not_counted_as_rejected(buffered, bumps, monkeypatch):
+    buffer_messages(buffered["messages"], 2)
+
+    async def insert_many(docs, ordered=True):
+        raise BulkWriteError({"writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key"}]})
+
+    monkeypatch.setattr(buffered["messages"], "insert_many", insert_many)
+
+    assert asyncio.run(flush_messages())
+    assert server.message_write_stats["rejected"] == 0
+    assert bumps == [{"total_messages": 2}]
@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId
+
+import server
+from server import MessagePurgeRequest, persist_message, purge_user_messages
+
+USER_ID = str(ObjectId())
+ADMIN = {"_id": str(ObjectId()), "is_admin": True}
+
+
+def deleted_events(emits):
+    return [(data["message_ids"], channel) for event, data, channel in emits if event == "chat_message_deleted"]
+
+
+def test_purge_announces_on_the_channel_each_message_used(chat_db, emits):
+    now = datetime.utcnow()
+    chat_id = ObjectId()
+    legacy_id = ObjectId()
+    room_id = ObjectId()
+    chat_db["chat_messages"].docs.append({"_id": chat_id, "user_id": USER_ID, "created_at": now})
+    chat_db["messages"].docs += [
+        {"_id": legacy_id, "user_id": ObjectId(USER_ID), "room": "community", "timestamp": now},
+        {"_id": room_id, "user_id": ObjectId(USER_ID), "room": "abc", "timestamp": now},
+        {"_id": ObjectId(), "user_id": ObjectId(), "room": "abc", "timestamp": now},
+    ]
+
+    result = asyncio.run(purge_user_messages(MessagePurgeRequest(user_id=USER_ID), ADMIN))
+
+    assert result["chat_messages_deleted"] == 1
+    assert result["room_messages_deleted"] == 2
+    assert sorted(deleted_events(emits)) == sorted([
+        ([str(chat_id)], None),
+        ([str(legacy_id)], "community"),
+        ([str(room_id)], "room_abc"),
+    ])
+    assert len(chat_db["messages"].docs) == 1
+
+
+def test_purge_includes_messages_still_in_the_write_buffer(chat_db, emits):
+    async def run():
+        buffered_id = await persist_message(server.messages_collection, {
+            "user_id": ObjectId(USER_ID), "room": "abc", "timestamp": datetime.utcnow()
+        })
+        result = await purge_user_messages(MessagePurgeRequest(user_id=USER_ID), ADMIN)
+        # The flush loop runs later and must have nothing of this user's left to write
+        await server.flush_messages()
+        return buffered_id, result
+
+    buffered_id, result = asyncio.run(run())
+    assert result["room_messages_deleted"] == 1
+    assert deleted_events(emits) == [([str(buffered_id)], "room_abc")]
+    assert chat_db["messages"].docs == []
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from server import PresenceService
+from tests.fakes import FakeCollection
+
+
+@pytest.fixture
+def shared_presence(monkeypatch):
+    presence = PresenceService(FakeCollection(name="socket_presence"), shared=True)
+    monkeypatch.setattr(server, "presence", presence)
+    asyncio.run(presence.connect("sid-a", "u1", "alice"))
+    presence.collection.calls.clear()
+    return presence
+
+
+def mirrored(presence, sid):
+    return next(doc for doc in presence.collection.docs if doc["_id"] == sid)
+
+
+def test_heartbeat_does_not_wait_on_mongo(shared_presence):
+    before = shared_presence.sockets["sid-a"]["active_at"]
+    shared_presence.heartbeat("sid-a")
+    assert shared_presence.sockets["sid-a"]["active_at"] >= before
+    assert shared_presence.collection.calls == []
+
+
+def test_activity_is_mirrored_in_one_bulk_write(shared_presence):
+    asyncio.run(shared_presence.connect("sid-b", "u2", "bob"))
+    shared_presence.collection.calls.clear()
+    for _ in range(5):
+        shared_presence.heartbeat("sid-a")
+        shared_presence.heartbeat("sid-b")
+    asyncio.run(shared_presence.refresh_node())
+
+    bulk = [args for method, args in shared_presence.collection.calls if method == "bulk_write"]
+    assert len(bulk) == 1 and len(bulk[0]) == 2
+    for sid in ("sid-a", "sid-b"):
+        assert mirrored(shared_presence, sid)["active_at"] == shared_presence.sockets[sid]["active_at"]
+
+    shared_presence.collection.calls.clear()
+    asyncio.run(shared_presence.refresh_node())
+    assert [method for method, _ in shared_presence.collection.calls] == ["update_many"]
+
+
+def test_failed_sync_is_retried(shared_presence, monkeypatch):
+    shared_presence.heartbeat("sid-a")
+
+    async def failing_bulk_write(requests, ordered=True):
+        raise RuntimeError("primary stepped down")
+
+    monkeypatch.setattr(shared_presence.collection, "bulk_write", failing_bulk_write)
+    with pytest.raises(RuntimeError):
+        asyncio.run(shared_presence.sync_activity())
+    assert shared_presence.active_sids == {"sid-a"}
+
+
+def test_disconnected_sockets_are_not_synced(shared_presence):
+    shared_presence.heartbeat("sid-a")
+    asyncio.run(shared_presence.disconnect("sid-a"))
+    asyncio.run(shared_presence.sync_activity())
+    assert shared_presence.active_sids == set()
+    assert "bulk_write" not in [method for method, _ in shared_presence.collection.calls]
+
+
+def test_any_client_event_counts_as_activity(monkeypatch):
+    presence = PresenceService(FakeCollection(name="socket_presence"), shared=False)
+    monkeypatch.setattr(server, "presence", presence)
+    assert "heartbeat" not in server.sio.handlers["/"]
+
+    async def run():
+        sio = server.SocketServer(async_mode="asgi")
+        await sio._handle_eio_connect("eio-a", {"QUERY_STRING": ""})
+        sid = await sio.manager.connect("eio-a", "/")
+        await presence.connect(sid, "u1", "alice")
+        presence.sockets[sid]["active_at"] = datetime.utcnow() - timedelta(hours=1)
+        await sio._handle_event("eio-a", "/", None, ["heartbeat", {}])
+        return sid
+
+    sid = asyncio.run(run())
+    assert datetime.utcnow() - presence.sockets[sid]["active_at"] < timedelta(minutes=1)
+    assert asyncio.run(presence.statuses(["u1"])) == {"u1": "online"}
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+import server
+from server import broadcast_room_message, drain_room_batches
+
+ROOM = "general"
+
+
+@pytest.fixture
+def batching(monkeypatch, emits):
+    monkeypatch.setattr(server, "ROOM_BATCH_WINDOW_MS", 50)
+    monkeypatch.setattr(server, "room_last_emit", {})
+    monkeypatch.setattr(server, "room_batches", {})
+    monkeypatch.setattr(server, "room_batch_tasks", {})
+    monkeypatch.setattr(server, "room_batch_stats", dict.fromkeys(server.room_batch_stats, 0))
+    return emits
+
+
+def payload(n: int) -> dict:
+    return {"message_id": str(n), "room_id": ROOM, "message": f"m{n}"}
+
+
+def sent(emits):
+    """(event, message ids) per broadcast"""
+    return [
+        (event, [m["message_id"] for m in data["messages"]] if event == "room_messages" else [data["message_id"]])
+        for event, data, _ in emits
+    ]
+
+
+def test_quiet_room_is_not_delayed(batching):
+    asyncio.run(broadcast_room_message(ROOM, payload(1)))
+    assert sent(batching) == [("room_message", ["1"])]
+    assert server.room_batches == {}
+
+
+def test_burst_goes_out_as_one_batch_per_window(batching):
+    async def run():
+        for n in range(1, 5):
+            await broadcast_room_message(ROOM, payload(n))
+        assert sent(batching) == [("room_message", ["1"])]
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert sent(batching) == [("room_message", ["1"]), ("room_messages", ["2", "3", "4"])]
+    assert all(room == f"room_{ROOM}" for _, _, room in batching)
+    assert server.room_batch_stats == {"messages": 4, "emits": 2, "batches": 1, "batched_messages": 3}
+
+
+def test_full_batch_is_sent_without_waiting(batching, monkeypatch):
+    monkeypatch.setattr(server, "ROOM_BATCH_MAX_MESSAGES", 2)
+
+    async def run():
+        for n in range(1, 4):
+            await broadcast_room_message(ROOM, payload(n))
+        return dict(server.room_batch_tasks)
+
+    assert asyncio.run(run()) == {}
+    assert sent(batching) == [("room_message", ["1"]), ("room_messages", ["2", "3"])]
+
+
+def test_batching_off_sends_every_message(batching, monkeypatch):
+    monkeypatch.setattr(server, "ROOM_BATCH_WINDOW_MS", 0)
+
+    async def run():
+        for n in range(1, 4):
+            await broadcast_room_message(ROOM, payload(n))
+
+    asyncio.run(run())
+    assert sent(batching) == [("room_message", [str(n)]) for n in range(1, 4)]
+
+
+def test_shutdown_drains_pending_batches(batching, monkeypatch):
+    monkeypatch.setattr(server, "ROOM_BATCH_WINDOW_MS", 60000)
+
+    async def run():
+        for room in (ROOM, "focus"):
+            await broadcast_room_message(room, payload(1))
+            await broadcast_room_message(room, payload(2))
+        tasks = list(server.room_batch_tasks.values())
+        await drain_room_batches()
+        await asyncio.sleep(0)
+        return tasks
+
+    tasks = asyncio.run(run())
+    assert all(task.cancelled() for task in tasks)
+    assert [(event, room) for event, _, room in batching] == [
+        ("room_message", "room_general"), ("room_message", "room_focus"),
+        ("room_message", "room_general"), ("room_message", "room_focus"),
+    ]
+    assert server.room_batches == {} and server.room_batch_tasks == {}
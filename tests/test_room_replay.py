@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import server
+from server import remember_room_message, replay_room_messages, room_message_payload
+
+ROOM = "general"
+START = datetime(2026, 10, 19, 12, 0, 0)
+
+
+@pytest.fixture
+def replay(chat_db, monkeypatch):
+    monkeypatch.setattr(server, "room_recent_messages", {})
+    monkeypatch.setattr(server, "SOCKETIO_MANAGER", "redis")
+    return chat_db["messages"]
+
+
+def message(seconds: float, oid: ObjectId = None) -> dict:
+    return {"_id": oid or ObjectId(), "room": ROOM, "user_id": ObjectId(), "username": "alice",
+            "message": f"at {seconds}", "timestamp": START + timedelta(seconds=seconds)}
+
+
+def replayed_ids(last_seen):
+    messages, complete = asyncio.run(replay_room_messages(ROOM, last_seen))
+    return [m["message_id"] for m in messages], complete
+
+
+def test_replay_follows_timestamps_not_ids(replay):
+    # Ids minted on different workers: the later message has the smaller id
+    late_id, early_id = ObjectId(), ObjectId()
+    seen = message(0)
+    replay.docs += [seen, message(2, late_id), message(1, early_id)]
+
+    assert replayed_ids(seen["_id"]) == ([str(early_id), str(late_id)], True)
+
+
+def test_equal_timestamps_are_ordered_by_id(replay):
+    first, second, third = ObjectId(), ObjectId(), ObjectId()
+    replay.docs += [message(1, third), message(1, first), message(1, second)]
+
+    assert replayed_ids(first) == ([str(second), str(third)], True)
+
+
+def test_unwritten_broadcasts_are_merged_in_order(replay):
+    seen, stored = message(0), message(2)
+    replay.docs += [seen, stored]
+    # Still in the write-behind buffer, and one already written
+    for doc in (message(1), message(3), stored):
+        remember_room_message(ROOM, doc["timestamp"], doc["_id"], room_message_payload(doc))
+    pending = [key[1] for key, _ in server.room_recent_messages[ROOM]]
+
+    ids, complete = replayed_ids(seen["_id"])
+    assert ids == [str(pending[0]), str(stored["_id"]), str(pending[1])]
+    assert complete
+
+
+def test_single_process_replays_from_its_buffer(replay, monkeypatch):
+    monkeypatch.setattr(server, "SOCKETIO_MANAGER", "memory")
+    docs = [message(i) for i in range(3)]
+    for doc in docs:
+        remember_room_message(ROOM, doc["timestamp"], doc["_id"], room_message_payload(doc))
+
+    assert replayed_ids(docs[0]["_id"]) == ([str(docs[1]["_id"]), str(docs[2]["_id"])], True)
+    assert replay.calls == []
+
+
+def test_long_gaps_are_reported_incomplete(replay, monkeypatch):
+    monkeypatch.setattr(server, "ROOM_REPLAY_MAX_MESSAGES", 2)
+    docs = [message(i) for i in range(5)]
+    replay.docs += docs
+
+    assert replayed_ids(docs[0]["_id"]) == ([str(docs[1]["_id"]), str(docs[2]["_id"])], False)
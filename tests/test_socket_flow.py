@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+import server
+from server import take_token
+from socket_managers import LocalPubSubManager, RelayManager
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(server, "socket_buckets", {})
+    return now
+
+
+def test_token_bucket_allows_burst_then_drops(clock):
+    key = ("sid", "abc", "room_message")
+    assert [take_token(key, 1.0, 5) for _ in range(6)] == [True] * 5 + [False]
+
+
+def test_token_bucket_refills_at_rate(clock):
+    key = ("sid", "abc", "typing")
+    for _ in range(2):
+        take_token(key, 2.0, 2)
+    assert not take_token(key, 2.0, 2)
+    clock[0] += 0.5  # one token at 2/s
+    assert take_token(key, 2.0, 2)
+    assert not take_token(key, 2.0, 2)
+
+
+def test_token_bucket_never_exceeds_burst(clock):
+    key = ("user", "u1", "typing")
+    take_token(key, 1.0, 3)
+    clock[0] += 3600
+    assert [take_token(key, 1.0, 3) for _ in range(4)] == [True] * 3 + [False]
+
+
+def test_token_buckets_are_independent(clock):
+    assert take_token(("sid", "a", "x"), 1.0, 1)
+    assert not take_token(("sid", "a", "x"), 1.0, 1)
+    assert take_token(("sid", "b", "x"), 1.0, 1)
+
+
+def test_local_manager_relays_server_events_to_other_instances():
+    async def run():
+        LocalPubSubManager.channels.clear()
+        sender = LocalPubSubManager(channel="test")
+        receiver = LocalPubSubManager(channel="test")
+        received = []
+
+        async def handler(data):
+            received.append(data)
+
+        sender.on_server_event("ping", handler)
+        receiver.on_server_event("ping", handler)
+        listener = receiver._listen().__aiter__()
+        await sender.publish_server_event("ping", {"n": 1})
+        # The handler runs inside _listen; the own-host copy on sender is never read
+        task = asyncio.ensure_future(listener.__anext__())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        return received
+
+    assert asyncio.run(run()) == [{"n": 1}]
+
+
+def test_relay_managers_must_implement_receive():
+    class PublishOnly(RelayManager):
+        async def _publish(self, data):
+            pass
+
+    with pytest.raises(TypeError):
+        PublishOnly()
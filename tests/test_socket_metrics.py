@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+import socketio
+
+from socket_metrics import EventStats, InstrumentedServerMixin, MongoCommandCounter, current_event
+
+ROOM = "room_general"
+
+
+class Server(InstrumentedServerMixin, socketio.AsyncServer):
+    pass
+
+
+@pytest.fixture
+def sio():
+    # Handlers run inline rather than as tasks, so dispatch returns once they finish
+    server = Server(async_mode="asgi", async_handlers=False)
+
+    async def send_packet(eio_sid, pkt):
+        pass
+
+    async def send(eio_sid, data):
+        pass
+
+    server.eio.send_packet = send_packet
+    server.eio.send = send
+    return server
+
+
+async def connect(sio, eio_sid):
+    await sio._handle_eio_connect(eio_sid, {})
+    sid = await sio.manager.connect(eio_sid, "/")
+    await sio.enter_room(sid, ROOM)
+    return sid
+
+
+def dispatch(sio, *events):
+    async def run():
+        for eio_sid in ("a", "b", "c"):
+            await connect(sio, eio_sid)
+        for event in events:
+            await sio._handle_event("a", "/", None, [event, {}])
+
+    asyncio.run(run())
+
+
+def test_calls_fanout_and_mongo_calls_are_charged_to_the_event(sio):
+    counter = MongoCommandCounter()
+
+    @sio.on("room_message")
+    async def room_message(sid, data):
+        counter.started(None)
+        # Motor runs commands on executor threads with a copy of the context
+        await asyncio.to_thread(counter.started, None)
+        await sio.emit("room_message", data, room=ROOM)
+
+    @sio.on("typing")
+    async def typing(sid, data):
+        pass
+
+    dispatch(sio, "room_message", "room_message", "typing")
+
+    stats = sio.metrics.events["room_message"]
+    assert (stats.calls, stats.errors, stats.mongo_calls, stats.fanout) == (2, 0, 4, 6)
+    assert sio.metrics.events["typing"].fanout == 0
+    assert current_event.get() is None
+
+
+def test_failing_handlers_count_as_errors(sio):
+    @sio.on("authenticate")
+    async def authenticate(sid, data):
+        raise RuntimeError("bad token")
+
+    with pytest.raises(RuntimeError):
+        dispatch(sio, "authenticate")
+    stats = sio.metrics.events["authenticate"]
+    assert (stats.calls, stats.errors) == (1, 1)
+
+
+def test_unhandled_events_are_not_tracked(sio):
+    dispatch(sio, "heartbeat")
+    assert sio.metrics.events == {}
+
+
+def test_work_outside_handlers_is_not_charged(sio):
+    @sio.on("typing")
+    async def typing(sid, data):
+        pass
+
+    async def run():
+        await connect(sio, "a")
+        await sio.emit("room_message", {}, room=ROOM)
+        MongoCommandCounter().started(None)
+        await sio._handle_event("a", "/", None, ["typing", {}])
+
+    asyncio.run(run())
+    stats = sio.metrics.events["typing"]
+    assert (stats.mongo_calls, stats.fanout) == (0, 0)
+
+
+def test_percentiles_come_from_bucket_bounds():
+    stats = EventStats()
+    for seconds in [0.0004] * 98 + [0.02, 3.0]:
+        stats.observe(seconds)
+    summary = stats.to_dict()
+    assert (summary["p50_ms"], summary["p99_ms"]) == (0.5, 25)
+    assert summary["max_ms"] == 3000.0 and summary["buckets"]["inf"] == 1
+    assert EventStats().percentile_ms(0.5) is None
+
+
+def test_snapshot_is_sorted_and_reset_keeps_events(sio):
+    sio.metrics.stats_for("typing").observe(0.001)
+    slow = sio.metrics.stats_for("room_message")
+    slow.observe(0.5)
+    assert list(sio.metrics.snapshot("total_ms")["events"]) == ["room_message", "typing"]
+
+    sio.metrics.reset()
+    assert sio.metrics.events["room_message"] is slow and slow.calls == 0
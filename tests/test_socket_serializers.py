@@ -0,0 +1,112 @@
+import asyncio
+
+import msgpack
+import pytest
+from socketio import packet
+
+import socket_serializers
+from socket_serializers import NegotiatingAsyncServer, requested_serializer
+
+ROOM = "room_general"
+
+
+async def connect(sio, eio_sid, query=""):
+    accepted = await sio._handle_eio_connect(eio_sid, {"QUERY_STRING": query})
+    if accepted is False:
+        return None
+    sid = await sio.manager.connect(eio_sid, "/")
+    await sio.enter_room(sid, ROOM)
+    return sid
+
+
+@pytest.fixture
+def wire():
+    """Server whose Engine.IO sends are recorded as {eio_sid: [payload]}"""
+    sio = NegotiatingAsyncServer(async_mode="asgi")
+    sent = {}
+
+    async def send_packet(eio_sid, pkt):
+        sent.setdefault(eio_sid, []).append(pkt.data)
+
+    async def send(eio_sid, data):
+        sent.setdefault(eio_sid, []).append(data)
+
+    sio.eio.send_packet = send_packet
+    sio.eio.send = send
+    return sio, sent
+
+
+def test_serializer_comes_from_the_query_string():
+    assert requested_serializer({"QUERY_STRING": "serializer=MsgPack&EIO=4"}) == "msgpack"
+    assert requested_serializer({"QUERY_STRING": "EIO=4"}) == "json"
+    assert requested_serializer({}) == "json"
+
+
+def test_broadcast_reaches_each_client_in_its_format(wire):
+    sio, sent = wire
+
+    async def run():
+        await connect(sio, "json-1")
+        for eio_sid in ("mp-1", "mp-2"):
+            await connect(sio, eio_sid, "serializer=msgpack")
+        await sio.emit("room_message", {"message": "hi"}, room=ROOM)
+
+    asyncio.run(run())
+    assert sent["json-1"] == ['2["room_message",{"message":"hi"}]']
+    for eio_sid in ("mp-1", "mp-2"):
+        decoded = msgpack.unpackb(sent[eio_sid][0])
+        assert decoded["type"] == packet.EVENT and decoded["data"] == ["room_message", {"message": "hi"}]
+    # Converted once for both MessagePack clients
+    assert sio.serializer_stats == {"json_connections": 1, "msgpack_connections": 2,
+                                    "msgpack_rejected": 0, "msgpack_conversions": 1}
+
+
+def test_direct_sends_use_the_clients_format(wire):
+    sio, sent = wire
+
+    async def run():
+        json_sid = await connect(sio, "json-1")
+        msgpack_sid = await connect(sio, "mp-1", "serializer=msgpack")
+        await sio.emit("vpn_status", {"locked": True}, to=json_sid, callback=lambda *args: None)
+        await sio.emit("vpn_status", {"locked": True}, to=msgpack_sid, callback=lambda *args: None)
+
+    asyncio.run(run())
+    assert isinstance(sent["json-1"][-1], str)
+    assert msgpack.unpackb(sent["mp-1"][-1])["data"] == ["vpn_status", {"locked": True}]
+
+
+def test_msgpack_events_reach_handlers(wire):
+    sio, _ = wire
+    received = []
+
+    @sio.on("typing")
+    async def typing(sid, data):
+        received.append(data)
+
+    async def run():
+        await connect(sio, "mp-1", "serializer=msgpack")
+        encoded = msgpack.packb({"type": packet.EVENT, "nsp": "/", "data": ["typing", {"typing": False}]})
+        await sio._handle_eio_message("mp-1", encoded)
+
+    asyncio.run(run())
+    assert received == [{"typing": False}]
+
+
+def test_msgpack_clients_are_refused_without_msgpack(wire, monkeypatch):
+    sio, _ = wire
+    monkeypatch.setattr(socket_serializers, "MsgPackPacket", None)
+
+    assert asyncio.run(connect(sio, "mp-1", "serializer=msgpack")) is None
+    assert sio.msgpack_sids == set()
+    assert sio.serializer_stats["msgpack_rejected"] == 1
+
+
+def test_disconnect_forgets_the_serializer(wire):
+    sio, _ = wire
+
+    async def run():
+        await connect(sio, "mp-1", "serializer=msgpack")
+        await sio._handle_eio_disconnect("mp-1", sio.reason.CLIENT_DISCONNECT)
+
+    asyncio.run(run())
+    assert sio.msgpack_sids == set()
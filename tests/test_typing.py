@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+import server
+from server import flush_typing, send_room_typers, set_typing, typing_key
+from socket_managers import LocalPubSubManager
+
+ROOM = "room_general"
+
+
+@pytest.fixture
+def typing_state(monkeypatch, emits):
+    monkeypatch.setattr(server, "typing_rooms", {})
+    monkeypatch.setattr(server, "typing_dirty_rooms", set())
+    monkeypatch.setattr(server, "typing_announced", {})
+    monkeypatch.setattr(server, "congested_sids", lambda room: [])
+    return emits
+
+
+def deltas(emits):
+    return [data for event, data, _ in emits if event == "typing_users"]
+
+
+def test_typing_is_announced_as_deltas(typing_state):
+    async def run():
+        set_typing(ROOM, "sid-a", "u1", "alice", True)
+        await flush_typing()
+        set_typing(ROOM, "sid-a", "u1", "alice", True)  # still typing: nothing new to say
+        await flush_typing()
+        set_typing(ROOM, "sid-a", "u1", "alice", False)
+        await flush_typing()
+
+    asyncio.run(run())
+    key = typing_key("sid-a")
+    assert deltas(typing_state) == [
+        {"room": ROOM, "started": [{"key": key, "user_id": "u1", "username": "alice"}], "stopped": []},
+        {"room": ROOM, "started": [], "stopped": [key]},
+    ]
+    assert server.typing_rooms == {} and server.typing_announced == {}
+
+
+def test_one_device_stopping_leaves_the_other_typing(typing_state):
+    async def run():
+        set_typing(ROOM, "phone", "u1", "alice", True)
+        set_typing(ROOM, "laptop", "u1", "alice", True)
+        await flush_typing()
+        set_typing(ROOM, "phone", "u1", "alice", False)
+        await flush_typing()
+
+    asyncio.run(run())
+    started, stopped = deltas(typing_state)
+    assert {entry["key"] for entry in started["started"]} == {typing_key("phone"), typing_key("laptop")}
+    assert stopped["stopped"] == [typing_key("phone")] and stopped["started"] == []
+    assert list(server.typing_announced[ROOM]) == [typing_key("laptop")]
+
+
+def test_keys_do_not_expose_socket_ids(typing_state):
+    assert typing_key("sid-a") != "sid-a"
+    assert typing_key("sid-a") == typing_key("sid-a") != typing_key("sid-b")
+
+
+def test_joiner_is_sent_current_typers(typing_state):
+    async def run():
+        set_typing(ROOM, "sid-a", "u1", "alice", True)
+        await flush_typing()
+        typing_state.clear()
+        await send_room_typers(ROOM, "joiner")
+
+    asyncio.run(run())
+    assert typing_state == [("typing_users", {
+        "room": ROOM,
+        "started": [{"key": typing_key("sid-a"), "user_id": "u1", "username": "alice"}],
+        "stopped": []
+    }, "joiner")]
+
+
+def test_joiner_on_another_worker_is_sent_our_typers(typing_state, monkeypatch):
+    async def run():
+        LocalPubSubManager.channels.clear()
+        joiner_worker = LocalPubSubManager(channel="typing")
+        typing_worker = LocalPubSubManager(channel="typing")
+        typing_worker.on_server_event("typing_snapshot", server.relayed_typing_snapshot)
+        set_typing(ROOM, "sid-a", "u1", "alice", True)
+        await flush_typing()
+        typing_state.clear()
+
+        monkeypatch.setattr(server.sio, "manager", joiner_worker)
+        await send_room_typers(ROOM, "joiner")
+        listener = asyncio.ensure_future(typing_worker._listen().__aiter__().__anext__())
+        await asyncio.sleep(0.05)
+        listener.cancel()
+
+    asyncio.run(run())
+    # Once from the joiner's own worker, once relayed from the other one
+    assert [to for event, _, to in typing_state] == ["joiner", "joiner"]
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+import server
+from server import UnlockDecisionBulk, bulk_decide_unlock_requests, get_unlock_requests
+from tests.fakes import FakeCollection
+
+ADMIN = {"_id": str(ObjectId()), "is_admin": True}
+REQUESTED_AT = datetime(2026, 10, 19, 8, 0, 0)
+
+
+def request(minutes: int = 0, **fields) -> dict:
+    return {"_id": ObjectId(), "name": "user", "recovery_mode_enabled": True, "can_disable": False,
+            "unlock_requested": True, "unlock_requested_at": REQUESTED_AT + timedelta(minutes=minutes),
+            **fields}
+
+
+@pytest.fixture
+def unlocks(monkeypatch):
+    collection = FakeCollection(name="users")
+    published, scheduled = [], []
+
+    async def publish_vpn_status(user_id, before, after):
+        published.append(user_id)
+
+    monkeypatch.setattr(server, "users_collection", collection)
+    monkeypatch.setattr(server, "publish_vpn_status", publish_vpn_status)
+    monkeypatch.setattr(server, "schedule_vpn_deadline", lambda when, user_id, field: scheduled.append(user_id))
+    return SimpleNamespace(users=collection, published=published, scheduled=scheduled)
+
+
+def decide(user_ids, action):
+    return asyncio.run(bulk_decide_unlock_requests(UnlockDecisionBulk(user_ids=user_ids, action=action), ADMIN))
+
+
+def test_bulk_approve_changes_only_open_requests(unlocks):
+    open_request = request()
+    approved = request(unlock_approved=True, unlock_effective_at=REQUESTED_AT)
+    withdrawn = request(unlock_requested=False)
+    unlocks.users.docs += [open_request, approved, withdrawn]
+    ids = [str(doc["_id"]) for doc in unlocks.users.docs]
+
+    result = decide(ids + [ids[0]], "approve")
+
+    assert (result["requested"], result["modified"], result["skipped"]) == (3, 1, 2)
+    assert unlocks.published == unlocks.scheduled == [ids[0]]
+    assert open_request["_id"] == unlocks.users.docs[0]["_id"]
+    assert unlocks.users.docs[0]["unlock_approved"] and unlocks.users.docs[0]["unlock_approved_by"] == ADMIN["_id"]
+    # The earlier approval keeps its cooldown
+    assert unlocks.users.docs[1]["unlock_effective_at"] == REQUESTED_AT
+    assert [method for method, _ in unlocks.users.calls].count("bulk_write") == 1
+
+
+def test_requests_decided_meanwhile_are_skipped(unlocks, monkeypatch):
+    unlocks.users.docs += [request(), request()]
+    ids = [str(doc["_id"]) for doc in unlocks.users.docs]
+    real_bulk_write = unlocks.users.bulk_write
+
+    async def bulk_write(requests, ordered=True):
+        # Another admin denies the second request between the read and the write
+        unlocks.users.docs[1]["unlock_requested"] = False
+        return await real_bulk_write(requests, ordered=ordered)
+
+    monkeypatch.setattr(unlocks.users, "bulk_write", bulk_write)
+
+    result = decide(ids, "approve")
+
+    assert (result["modified"], result["skipped"]) == (1, 1)
+    assert unlocks.published == unlocks.scheduled == [ids[0]]
+    assert "unlock_approved" not in unlocks.users.docs[1]
+
+
+def test_bulk_deny_closes_requests_without_deadlines(unlocks):
+    unlocks.users.docs += [request(), request(unlock_approved=True)]
+    ids = [str(doc["_id"]) for doc in unlocks.users.docs]
+
+    result = decide(ids, "deny")
+
+    assert result["modified"] == 2 and result["effective_at"] is None
+    assert all(not doc["unlock_requested"] for doc in unlocks.users.docs)
+    assert unlocks.scheduled == []
+
+
+def test_bulk_rejects_unknown_actions_and_ids(unlocks):
+    with pytest.raises(HTTPException) as error:
+        decide([str(ObjectId())], "maybe")
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException) as error:
+        decide(["not-an-id"], "approve")
+    assert error.value.status_code == 400
+
+
+def test_queue_pages_oldest_first_without_gaps(unlocks):
+    # Two requests share a timestamp across the page boundary
+    unlocks.users.docs += [request(2), request(0), request(1), request(1), request(3, unlock_requested=False)]
+    expected = sorted(
+        (doc for doc in unlocks.users.docs if doc["unlock_requested"]),
+        key=lambda doc: (doc["unlock_requested_at"], doc["_id"])
+    )
+
+    seen, cursor = [], None
+    while True:
+        page = asyncio.run(get_unlock_requests(limit=2, after=cursor, current_user=ADMIN))
+        seen += [user["_id"] for user in page["requests"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [str(doc["_id"]) for doc in expected]
+    with pytest.raises(HTTPException):
+        asyncio.run(get_unlock_requests(after="garbage", current_user=ADMIN))
@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import server
+from server import fire_vpn_deadline, load_vpn_deadlines
+from tests.fakes import FakeCollection
+
+NOW = datetime.utcnow()
+PAST = NOW - timedelta(hours=1)
+FUTURE = NOW + timedelta(hours=1)
+
+
+@pytest.fixture
+def users(monkeypatch):
+    monkeypatch.setattr(server, "vpn_deadlines", [])
+    monkeypatch.setattr(server, "vpn_deadline_keys", set())
+    monkeypatch.setattr(server, "vpn_fired_deadlines", set())
+    collection = FakeCollection([
+        {"_id": ObjectId(), "recovery_mode_enabled": True, "lock_expires_at": PAST},
+        {"_id": ObjectId(), "recovery_mode_enabled": True, "lock_expires_at": FUTURE},
+        {"_id": ObjectId(), "recovery_mode_enabled": True, "lock_expires_at": PAST, "can_disable": True},
+        {"_id": ObjectId(), "recovery_mode_enabled": True, "unlock_approved": True,
+         "unlock_effective_at": PAST},
+        {"_id": ObjectId(), "recovery_mode_enabled": False, "lock_expires_at": PAST},
+    ])
+    monkeypatch.setattr(server, "users_collection", collection)
+    return collection
+
+
+def queued():
+    return sorted((user_id, field) for _, user_id, field in server.vpn_deadlines)
+
+
+def test_reload_skips_deadlines_already_recorded(users):
+    asyncio.run(load_vpn_deadlines())
+    ids = [str(doc["_id"]) for doc in users.docs]
+    assert queued() == sorted([
+        (ids[0], "lock_expires_at"), (ids[1], "lock_expires_at"), (ids[3], "unlock_effective_at")
+    ])
+
+
+def test_fired_deadline_is_recorded_pushed_and_not_requeued(users, emits):
+    user_id = str(users.docs[0]["_id"])
+
+    async def run():
+        await fire_vpn_deadline(PAST, user_id, "lock_expires_at")
+        server.vpn_fired_deadlines.add((PAST, user_id, "lock_expires_at"))
+        await load_vpn_deadlines()
+
+    asyncio.run(run())
+    assert users.docs[0]["can_disable"] is True
+    assert emits == [("vpn_status", {"lock_expired": True, "cooldown_remaining_seconds": None,
+                                     "can_disable": True}, server.user_room(user_id))]
+    assert (user_id, "lock_expires_at") not in queued()
+
+
+def test_deadline_fires_once_across_workers(users, emits):
+    user_id = str(users.docs[0]["_id"])
+
+    async def run():
+        await fire_vpn_deadline(PAST, user_id, "lock_expires_at")
+        await fire_vpn_deadline(PAST, user_id, "lock_expires_at")
+
+    asyncio.run(run())
+    assert len(emits) == 1
+
+
+def test_fired_entries_recheck_after_the_reload_window(users):
+    stale = (NOW - timedelta(seconds=server.VPN_SCHEDULER_RELOAD_SECONDS + 60), "u1", "lock_expires_at")
+    recent = (NOW, "u2", "lock_expires_at")
+    server.vpn_fired_deadlines.update([stale, recent])
+    asyncio.run(load_vpn_deadlines())
+    assert server.vpn_fired_deadlines == {recent}